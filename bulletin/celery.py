@@ -3,9 +3,21 @@ import os
 from django.conf import settings
 
 from celery import Celery
+from kombu.serialization import register
+from wo import payload
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bulletin.settings")
+
+# Register compact task payload serializer, see CELERY_TASK_SERIALIZER.
+register(
+    payload.NAME,
+    payload.dumps,
+    payload.loads,
+    content_type=payload.CONTENT_TYPE,
+    content_encoding=payload.CONTENT_ENCODING,
+)
 app = Celery("bulletin")
 
 app.config_from_object("django.conf:settings", namespace="CELERY")
+
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
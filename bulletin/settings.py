@@ -3,6 +3,7 @@ from pathlib import Path
 from corsheaders.defaults import default_headers
 from decouple import Csv, config
 from django.core import exceptions
+from kombu import Queue
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -223,9 +224,53 @@ REDIS_URL = config("REDIS_URL", default="redis://localhost:6379")
 
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
-CELERY_ACCEPT_CONTENT = ["application/json", "application/x-python-serialize"]
+# Tasks are serialized as compact JSON payload with epoch microsecond
+# timestamps registered in bulletin/celery.py (see wo/payload.py). Pickle is
+# still accepted for one release, so that tasks queued by the previous release
+# are executed. Remove it in the next release, because it is unsafe to
+# deserialize.
+CELERY_ACCEPT_CONTENT = [
+    "application/json",
+    "application/x-bulletin-payload",
+    "application/x-python-serialize",
+]
 CELERY_RESULT_SERIALIZER = "json"
-CELERY_TASK_SERIALIZER = "json"
+CELERY_TASK_SERIALIZER = "bulletin"
+
+# Celery queues. Interactive WebObs actions, periodic sync, and backfill tasks
+# are routed to separate queues, so that long running sync does not delay
+# operator edits. In production, run a worker for each queue with its own
+# concurrency (see conf/supervisor/bulletin_celery.conf). A worker without -Q
+# option consumes all queues, interactive queue first. Lower task priority
+# value is executed first.
+CELERY_INTERACTIVE_QUEUE = "interactive"
+CELERY_SYNC_QUEUE = "sync"
+CELERY_BACKFILL_QUEUE = "backfill"
+CELERY_TASK_DEFAULT_QUEUE = CELERY_INTERACTIVE_QUEUE
+# Queues are declared in priority order, so that a worker without -Q option
+# consumes interactive tasks before sync and backfill tasks.
+CELERY_TASK_QUEUES = [
+    Queue(CELERY_INTERACTIVE_QUEUE),
+    Queue(CELERY_SYNC_QUEUE),
+    Queue(CELERY_BACKFILL_QUEUE),
+]
+CELERY_TASK_ROUTES = {
+    "webobs_update_event": {"queue": CELERY_INTERACTIVE_QUEUE, "priority": 0},
+    "webobs_hide_event": {"queue": CELERY_INTERACTIVE_QUEUE, "priority": 0},
+    "webobs_restore_event": {"queue": CELERY_INTERACTIVE_QUEUE, "priority": 0},
+    "webobs_delete_event": {"queue": CELERY_INTERACTIVE_QUEUE, "priority": 0},
+    "webobs_sync_events": {"queue": CELERY_SYNC_QUEUE, "priority": 6},
+    "webobs_backfill_events": {"queue": CELERY_BACKFILL_QUEUE, "priority": 9},
+    "webobs_process_events": {"queue": CELERY_SYNC_QUEUE, "priority": 6},
+    "webobs_process_events_done": {"queue": CELERY_SYNC_QUEUE, "priority": 6},
+}
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "queue_order_strategy": "priority",
+    "priority_steps": [0, 3, 6, 9],
+}
+# Reserve one task at a time, so that a worker busy with long running task does
+# not hold other tasks.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
 MOCK_SEISCOMP_SERVER = config("MOCK_SEISCOMP_SERVER", default=False, cast=bool)
 if not DEBUG and MOCK_SEISCOMP_SERVER:
@@ -245,4 +290,28 @@ if not DEBUG and MOCK_WEBOBS_SERVER:
 
 WEBOBS_UPDATE_EVENT_DELAY = config("WEBOBS_UPDATE_EVENT_DELAY", default=10, cast=int)
 
+# Updates of the same event (eventid or sc3id) requested within this window in
+# seconds are coalesced, so only the last update is executed. Set to 0 to
+# disable.
+WEBOBS_UPDATE_EVENT_COALESCE_WINDOW = config(
+    "WEBOBS_UPDATE_EVENT_COALESCE_WINDOW", default=10, cast=int
+)
+
+# Expiry time in seconds of idempotency keys of applied update event actions.
+# Update event tasks matching WebObs MC3 event of the same eventid, sc3id,
+# eventdate, and MC3 timestamp are processed only once within this time. Set to
+# 0 to disable.
+WEBOBS_IDEMPOTENCY_TTL = config(
+    "WEBOBS_IDEMPOTENCY_TTL", default=7 * 24 * 60 * 60, cast=int
+)
+
+# Maximum number of actions in a single batch request.
+WEBOBS_BATCH_MAX_SIZE = config("WEBOBS_BATCH_MAX_SIZE", default=500, cast=int)
+
+WEBOBS_SYNC_INCREMENTAL = config("WEBOBS_SYNC_INCREMENTAL", default=True, cast=bool)
+
+# Maximum number of events processed by each subtask dispatched by sync events
+# and backfill events tasks. Set to 0 to process events in the sync task.
+WEBOBS_SYNC_CHUNK_SIZE = config("WEBOBS_SYNC_CHUNK_SIZE", default=10, cast=int)
+
 WAVEVIEW_HOST = config("WAVEVIEW_HOST", default="127.0.0.1:8444")
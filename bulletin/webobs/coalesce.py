@@ -0,0 +1,95 @@
+import logging
+import uuid
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "bulletin:webobs:update_event:"
+
+# Expiry time of coalescing keys in seconds. It only has to be longer than the
+# time an update event task waits in the queue.
+KEY_TTL = 60 * 60
+
+# Delete the keys that hold the token of the task. Return 0 if any key holds
+# the token of a newer task, i.e. the task has been superseded. Keys that do not
+# exist, e.g. expired, do not supersede the task.
+_RELEASE_SCRIPT = """
+local result = 1
+for _, key in ipairs(KEYS) do
+    local value = redis.call("get", key)
+    if value == ARGV[1] then
+        redis.call("del", key)
+    elseif value then
+        result = 0
+    end
+end
+return result
+"""
+
+_client = None
+
+
+def get_client():
+    """
+    Get Redis client of REDIS_URL.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
+
+
+def get_keys(eventid=None, sc3id=None):
+    """
+    Get coalescing keys of an event by eventid and sc3id. Return empty list if
+    both are empty.
+
+    An update of an event is requested with sc3id only until WebObs generates
+    the eventid, and with eventid and sc3id afterwards. The task claims the keys
+    of both identifiers, so that an update with eventid supersedes previous
+    updates of the same event with sc3id only and vice versa.
+    """
+    keys = []
+    if eventid:
+        keys.append("{}eventid:{}".format(KEY_PREFIX, eventid))
+    if sc3id:
+        keys.append("{}sc3id:{}".format(KEY_PREFIX, sc3id))
+    return keys
+
+
+def claim_many(keys, client=None):
+    """
+    Register new update event tasks of list of coalescing keys of each task in
+    a single round trip, superseding previous tasks that claimed any of the
+    same keys and have not been executed yet.
+
+    :returns: List of tokens of the new tasks.
+    """
+    if client is None:
+        client = get_client()
+    tokens = [uuid.uuid4().hex for __ in keys]
+    pipeline = client.pipeline(transaction=False)
+    for task_keys, token in zip(keys, tokens):
+        for key in task_keys:
+            pipeline.set(key, token, ex=KEY_TTL)
+    pipeline.execute()
+    return tokens
+
+
+def release(keys, token, client=None):
+    """
+    Release the keys of a task before executing the task.
+
+    :returns: False if the task has been superseded by a newer task of any of
+    the keys, otherwise True.
+    """
+    if client is None:
+        client = get_client()
+    try:
+        return bool(client.eval(_RELEASE_SCRIPT, len(keys), *keys, token))
+    except redis.RedisError as e:
+        # Execute the task rather than losing the update.
+        logger.error("Failed to release coalescing keys %s: %s", keys, e)
+        return True
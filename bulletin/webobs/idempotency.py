@@ -0,0 +1,139 @@
+import hashlib
+import logging
+
+import redis
+from django.conf import settings
+
+from .coalesce import get_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "bulletin:webobs:applied:"
+
+# Expiry time in seconds of the key of an action that is being executed. It
+# only has to be longer than the time the task runs, so that the key of a
+# crashed worker does not block the action forever.
+RUNNING_TTL = 60 * 60
+
+# Countdown in seconds of the first retry of a task whose action is being
+# executed by another task. The countdown doubles on each retry.
+RETRY_DELAY = 60
+
+RUNNING = "running"
+DONE = "done"
+
+
+class ActionInProgress(Exception):
+    """
+    Raised if the same action is being executed by another task. The task
+    should be retried later, because the other task may fail.
+    """
+
+
+def _is_null(value):
+    return value is None or value != value
+
+
+def get_key(action, event):
+    """
+    Get idempotency key of an action by action name and eventid, sc3id,
+    eventdate, and MC3 timestamp (last modified time) of WebObs MC3 event.
+    Return None if the event has no MC3 timestamp, because modifications of the
+    event can not be told apart.
+    """
+    timestamp = event.get("timestamp")
+    if _is_null(timestamp):
+        return None
+    content = "|".join(
+        "" if _is_null(value) else str(value)
+        for value in (
+            action,
+            event.get("eventid"),
+            event.get("seiscompid"),
+            event.get("eventdate"),
+            timestamp,
+        )
+    )
+    return "{}{}".format(KEY_PREFIX, hashlib.sha1(content.encode("utf-8")).hexdigest())
+
+
+def acquire(key, client=None):
+    """
+    Mark the action of the key as running if it has not been applied or is not
+    being applied by another task.
+
+    :returns: True if the action should be executed, otherwise False.
+    """
+    if client is None:
+        client = get_client()
+    try:
+        return bool(client.set(key, RUNNING, nx=True, ex=RUNNING_TTL))
+    except redis.RedisError as e:
+        # Execute the action rather than losing it.
+        logger.error("Failed to acquire idempotency key %s: %s", key, e)
+        return True
+
+
+def is_done(key, client=None):
+    """
+    Check if the action of the key has been applied.
+    """
+    if client is None:
+        client = get_client()
+    try:
+        value = client.get(key)
+    except redis.RedisError as e:
+        logger.error("Failed to read idempotency key %s: %s", key, e)
+        return False
+    return value is not None and value.decode("utf-8") == DONE
+
+
+def mark_done(key, client=None):
+    """
+    Record the action of the key as applied for WEBOBS_IDEMPOTENCY_TTL seconds.
+    """
+    if client is None:
+        client = get_client()
+    try:
+        client.set(key, DONE, ex=settings.WEBOBS_IDEMPOTENCY_TTL)
+    except redis.RedisError as e:
+        logger.error("Failed to record idempotency key %s: %s", key, e)
+
+
+def discard(key, client=None):
+    """
+    Remove the key of a failed action, so that it can be retried.
+    """
+    if client is None:
+        client = get_client()
+    try:
+        client.delete(key)
+    except redis.RedisError as e:
+        logger.error("Failed to discard idempotency key %s: %s", key, e)
+
+
+def execute_once(key, func, *args, **kwargs):
+    """
+    Execute func(*args, **kwargs) unless the action of the key has been
+    applied. If key is None, func is always executed.
+
+    :raises ActionInProgress: If the action is being applied by another task.
+
+    :returns: Return value of func, or None if the action is skipped.
+    """
+    if key is None:
+        return func(*args, **kwargs)
+
+    if not acquire(key):
+        if is_done(key):
+            logger.info("Action already applied, skipping: %s", key)
+            return None
+        raise ActionInProgress(key)
+
+    try:
+        result = func(*args, **kwargs)
+    except Exception:
+        discard(key)
+        raise
+    mark_done(key)
+    return result
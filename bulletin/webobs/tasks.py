@@ -1,41 +1,125 @@
 import datetime
-import time
 
+import numpy as np
+import pandas as pd
+import pytz
 from bulletin.celery import app
+from celery import chord
 from celery.schedules import crontab
 from celery.utils.log import get_task_logger
 from django.conf import settings
-from django.utils import timezone
-from wo import visitor
-from wo.clients.webobs import WebObsMC3Fetcher
+from django.utils import dateparse, timezone
+from wo import payload, visitor
+from wo.actions import WebObsAction
+from wo.clients.webobs import WebObsMC3Fetcher, get_mc3_cache
+from wo.watermark import SyncWatermark, dump_state, load_state
 
-from . import schema
+from . import coalesce, idempotency, schema
 
 logger = get_task_logger(__name__)
 
+# Fields of WebObs MC3 events that are pandas Timestamp in UTC.
+DATETIME_FIELDS = ("eventdate", "timestamp")
+
+
+def dump_event(event):
+    """
+    Convert WebObs MC3 event to dictionary of plain JSON types, so that events
+    can be passed to subtasks with any task serializer. Datetime values are
+    converted to ISO 8601 strings, NaN and NaT to None, and NumPy scalars to
+    Python scalars.
+    """
+    data = {}
+    for key, value in event.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is None or value != value:
+            value = None
+        elif isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        data[key] = value
+    return data
+
+
+def load_event(data):
+    """
+    Convert dictionary returned by dump_event() to WebObs MC3 event.
+    """
+    event = dict(data)
+    for key in DATETIME_FIELDS:
+        if event.get(key) is not None:
+            event[key] = pd.to_datetime(event[key], utc=True)
+    return event
+
 
 @app.task(bind=True, name="webobs_update_event", max_retries=5)
 def update_event(self, eventdate, **kwargs):
     """
     Update or create an event in the database.
+
+    For a new event, WebObs may still generate eventid and synchronize the
+    event with SeisComP. So, the task has to be scheduled with countdown of
+    WEBOBS_UPDATE_EVENT_DELAY seconds, so that the broker delays the execution
+    without holding a worker.
+
+    If coalesce_keys is set, the task is dropped if a newer update of the same
+    event has been requested, i.e. coalesce_token is no longer the token of any
+    of the keys.
+
+    eventdate and requested_at are microseconds since epoch (UTC), see
+    wo/payload.py.
+
+    requested_at is the time the update event request was received. Cached
+    WebObs MC3 events fetched after that time already include the modification
+    of an existing event. A new event is only complete after the delay.
+
+    If WEBOBS_IDEMPOTENCY_TTL is greater than 0, the matched WebObs MC3 event
+    is only processed once for each MC3 timestamp, e.g. replayed failed request.
+    If the same event modification is being processed by another task, the task
+    is retried later, so it is not lost if the other task fails.
     """
+    coalesce_keys = kwargs.pop("coalesce_keys", None)
+    coalesce_token = kwargs.pop("coalesce_token", None)
+    if coalesce_keys and not coalesce.release(coalesce_keys, coalesce_token):
+        logger.info("Update event task superseded by newer task: %s", coalesce_keys)
+        return
 
-    # For a new event, WebObs may still generate eventid and synchronize the
-    # event with SeisComP. So, we need to wait several seconds until the process
-    # finished.
-    logger.info(
-        "Waiting for {}s before executing task...".format(
-            settings.WEBOBS_UPDATE_EVENT_DELAY
+    eventdate = payload.from_epoch_us(eventdate)
+    requested_at = kwargs.pop("requested_at", None)
+    if requested_at is None:
+        requested_at = timezone.now()
+    else:
+        requested_at = payload.from_epoch_us(requested_at)
+    if kwargs.get("eventid"):
+        not_before = requested_at
+    else:
+        not_before = requested_at + datetime.timedelta(
+            seconds=settings.WEBOBS_UPDATE_EVENT_DELAY
+        )
+
+    once = None
+    if settings.WEBOBS_IDEMPOTENCY_TTL > 0:
+        once = _apply_update_once
+
+    try:
+        visitor.update_event(
+            schema.engine,
+            schema.Bulletin,
+            eventdate,
+            not_before=not_before,
+            once=once,
+            **kwargs,
+        )
+    except idempotency.ActionInProgress as e:
+        logger.info("Update event is being applied by another task: %s", e)
+        raise self.retry(
+            exc=e, countdown=idempotency.RETRY_DELAY * 2**self.request.retries
         )
-    )
-    time.sleep(settings.WEBOBS_UPDATE_EVENT_DELAY)
 
-    visitor.update_event(
-        schema.engine,
-        schema.Bulletin,
-        eventdate,
-        **kwargs,
-    )
+
+def _apply_update_once(event, func):
+    key = idempotency.get_key(WebObsAction.WEBOBS_UPDATE_EVENT.name, event)
+    return idempotency.execute_once(key, func)
 
 
 @app.task(bind=True, name="webobs_hide_event", max_retries=5)
@@ -87,31 +171,221 @@ def sync_events(**kwargs):
     Concurrent execution of update event signal and sync events signal may lead
     to old data replacement. To mitigate this effect, we need to increase the
     time range of WebObs MC3 fetching.
+
+    If WEBOBS_SYNC_INCREMENTAL is True, only events that changed since the last
+    run are processed and the full time range is only reconciled periodically.
+
+    If WEBOBS_SYNC_CHUNK_SIZE is greater than 0, events that need waveform
+    processing are dispatched as subtasks of at most WEBOBS_SYNC_CHUNK_SIZE
+    events each, so that they are processed in parallel across the worker pool.
+    The watermark is saved by the chord callback after all subtasks succeeded.
     """
-    fetcher = WebObsMC3Fetcher()
+    fetcher = WebObsMC3Fetcher(cache=get_mc3_cache())
     now = timezone.now()
     start = datetime.datetime(
         now.year, now.month, now.day, tzinfo=now.tzinfo
     ) - datetime.timedelta(days=1)
-    events = fetcher.fetch_mc3_as_dict(start, now)
-    if events:
-        # Sync WebObs MC3 bulletin to seismic bulletin database (forward sync).
+
+    if settings.WEBOBS_SYNC_INCREMENTAL:
+        visitor.incremental_sync(
+            schema.engine,
+            schema.Bulletin,
+            fetcher,
+            start,
+            now,
+            dispatch=_get_dispatcher(
+                eventtype=kwargs.get("eventtype", "ALL"),
+                dry_run=kwargs.get("dry_run", False),
+            ),
+            **kwargs,
+        )
+        return
+
+    sync_range(fetcher, start, now, **kwargs)
+
+
+@app.task(name="webobs_backfill_events")
+def backfill_events(start, end, eventtype="ALL", **kwargs):
+    """
+    Synchronize events between WebObs MC3 and seismic bulletin database and vice
+    versa in time range start to end (ISO 8601 string or datetime in UTC).
+
+    The task is routed to backfill queue, so that long time range does not delay
+    interactive and periodic sync tasks.
+    """
+    if isinstance(start, str):
+        start = dateparse.parse_datetime(start)
+    if isinstance(end, str):
+        end = dateparse.parse_datetime(end)
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start, pytz.utc)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end, pytz.utc)
+
+    fetcher = WebObsMC3Fetcher()
+    sync_range(
+        fetcher,
+        start,
+        end,
+        eventtype=eventtype,
+        queue=settings.CELERY_BACKFILL_QUEUE,
+        **kwargs,
+    )
+
+
+@app.task(name="webobs_process_events")
+def process_events(events, **kwargs):
+    """
+    Fetch waveform data, compute magnitudes, and update the database of chunk of
+    WebObs MC3 events dispatched by sync events or backfill events task.
+
+    :param events: List of events converted by dump_event().
+
+    :returns: List of event IDs that failed to be updated.
+    """
+    return visitor.process_webobs_events(
+        schema.engine, [load_event(event) for event in events], **kwargs
+    )
+
+
+@app.task(name="webobs_process_events_done")
+def process_events_done(results, state=None, eventtype="ALL", events=None):
+    """
+    Chord callback of process events subtasks. Save the advanced watermark state
+    of the eventtype if set, i.e. the sync run can be marked as completed. The
+    watermark is held back before events that failed to be updated.
+
+    :param state: Watermark state converted by dump_state().
+
+    :param events: List of eventid, eventdate, and MC3 timestamp of the
+    dispatched events converted by dump_event().
+    """
+    failed = set(eventid for result in results or [] for eventid in result or [])
+    logger.info(
+        "Processed events in %s subtasks. %s events failed.",
+        len(results or []),
+        len(failed),
+    )
+    if state is None:
+        return
+
+    state = load_state(state)
+    watermark = SyncWatermark.for_eventtype(eventtype)
+    if failed:
+        state = watermark.hold_back(
+            state,
+            [load_event(event) for event in events or [] if event["eventid"] in failed],
+        )
+    watermark.save(state)
+
+
+def dispatch_events(events, state=None, queue=None, eventtype="ALL", **kwargs):
+    """
+    Dispatch events that need waveform processing as chunked process events
+    subtasks and track their completion with a chord. Events and watermark
+    state are converted to plain JSON types before building the chord.
+
+    :param state: Watermark state of the eventtype saved once all subtasks
+    succeeded.
+
+    :param queue: Queue of the subtasks. If not set, use CELERY_TASK_ROUTES.
+    """
+    size = settings.WEBOBS_SYNC_CHUNK_SIZE
+    chunks = [events[i : i + size] for i in range(0, len(events), size)]
+    if not chunks:
+        if state is not None:
+            SyncWatermark.for_eventtype(eventtype).save(state)
+        return
+
+    options = {}
+    if queue is not None:
+        options["queue"] = queue
+    header = [
+        process_events.signature(
+            args=([dump_event(event) for event in chunk],), kwargs=kwargs, **options
+        )
+        for chunk in chunks
+    ]
+    callback_kwargs = {"state": None, "eventtype": eventtype}
+    if state is not None:
+        callback_kwargs["state"] = dump_state(state)
+        callback_kwargs["events"] = [
+            dump_event(
+                {
+                    "eventid": event["eventid"],
+                    "eventdate": event["eventdate"],
+                    "timestamp": event.get("timestamp"),
+                }
+            )
+            for event in events
+        ]
+    callback = process_events_done.signature(kwargs=callback_kwargs, **options)
+    logger.info("Dispatching %s events in %s subtasks.", len(events), len(chunks))
+    chord(header)(callback)
+
+
+def _get_dispatcher(queue=None, eventtype="ALL", dry_run=False):
+    """
+    Get dispatch function of events that need waveform processing. Return None
+    if WEBOBS_SYNC_CHUNK_SIZE is 0, i.e. events are processed in the current
+    task.
+    """
+    if settings.WEBOBS_SYNC_CHUNK_SIZE <= 0:
+        return None
+
+    def dispatch(events, state):
+        dispatch_events(
+            events, state=state, queue=queue, eventtype=eventtype, dry_run=dry_run
+        )
+
+    return dispatch
+
+
+def sync_range(fetcher, start, end, eventtype="ALL", queue=None, **kwargs):
+    """
+    Run forward and reverse sync of WebObs MC3 events in time range start to
+    end. Events that need waveform processing are dispatched to queue if
+    WEBOBS_SYNC_CHUNK_SIZE is greater than 0.
+    """
+    events = fetcher.fetch_mc3_as_dict(start, end, eventtype=eventtype)
+    if not events:
+        return
+
+    # Sync WebObs MC3 bulletin to seismic bulletin database (forward sync).
+    dispatch = _get_dispatcher(
+        queue=queue, eventtype=eventtype, dry_run=kwargs.get("dry_run", False)
+    )
+    if dispatch is None:
         visitor.sync_webobs_and_bulletin(
             schema.engine,
             schema.Bulletin,
             events,
             **kwargs,
         )
-
-        # Sync seismic bulletin database to WebObs MC3 bulletin (reverse sync).
-        visitor.sync_bulletin_and_webobs(
+    else:
+        pending, __ = visitor.diff_webobs_and_bulletin(
             schema.engine,
             schema.Bulletin,
             events,
-            start,
-            now,
             **kwargs,
         )
+        dispatch(pending, None)
+
+    # Sync seismic bulletin database to WebObs MC3 bulletin (reverse sync).
+    # Skip if some time ranges failed to be fetched, because missing events
+    # would be mistaken as deleted from WebObs.
+    if fetcher.failed_ranges:
+        logger.error("WebObs MC3 events partially fetched. Skip reverse sync.")
+        return
+    visitor.sync_bulletin_and_webobs(
+        schema.engine,
+        schema.Bulletin,
+        events,
+        start,
+        end,
+        eventtype=eventtype,
+        **kwargs,
+    )
 
 
 @app.on_after_finalize.connect
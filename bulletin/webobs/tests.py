@@ -1 +1,485 @@
-from django.test import TestCase
+import datetime
+import json
+from unittest.mock import Mock, patch
+
+import fakeredis
+import numpy as np
+import pandas as pd
+import pytz
+from celery.canvas import Signature, group
+from bulletin.celery import app
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from wo.watermark import SYNCED_UNTIL, TIMESTAMP, SyncWatermark
+
+from . import coalesce, idempotency, tasks, views
+
+EVENTDATE = datetime.datetime(2021, 7, 8, 0, 2, 0, 240000, tzinfo=pytz.utc)
+
+
+@override_settings(WEBOBS_UPDATE_EVENT_DELAY=10, WEBOBS_UPDATE_EVENT_COALESCE_WINDOW=0)
+class UpdateEventScheduleTest(SimpleTestCase):
+    def test_parse_action_countdown(self):
+        action, signature = views.parse_action(
+            {
+                "action": "WEBOBS_UPDATE_EVENT",
+                "eventdate": "2021-07-08 00:02:00.24",
+                "eventid": "2021-07#2380",
+            }
+        )
+
+        self.assertEqual(action, "WEBOBS_UPDATE_EVENT")
+        self.assertEqual(signature.task, "webobs_update_event")
+        self.assertEqual(signature.options["countdown"], 10)
+        self.assertEqual(signature.args, (1625702520240000,))
+        self.assertIsInstance(signature.kwargs["requested_at"], int)
+        json.dumps([signature.args, signature.kwargs])
+
+    @patch.object(Signature, "apply_async", autospec=True)
+    def test_endpoint_schedules_countdown(self, mock_apply_async):
+        response = self.client.post(
+            reverse("bulletin-api-v1-webobs"),
+            {
+                "action": "WEBOBS_UPDATE_EVENT",
+                "eventdate": "2021-07-08 00:02:00.24",
+                "eventid": "2021-07#2380",
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "submitted")
+        mock_apply_async.assert_called_once()
+        signature = mock_apply_async.call_args[0][0]
+        self.assertEqual(signature.options["countdown"], 10)
+
+    @patch("bulletin.webobs.tasks.visitor.update_event")
+    def test_task_epoch_fields(self, mock_update_event):
+        tasks.update_event(
+            1625702520240000, eventid="2021-07#2380", requested_at=1625702530000000
+        )
+
+        args, kwargs = mock_update_event.call_args
+        self.assertEqual(args[2], EVENTDATE)
+        self.assertEqual(
+            kwargs["not_before"],
+            datetime.datetime(2021, 7, 8, 0, 2, 10, tzinfo=pytz.utc),
+        )
+
+    @patch("bulletin.webobs.tasks.visitor.update_event")
+    def test_task_does_not_sleep(self, mock_update_event):
+        with patch("time.sleep") as mock_sleep:
+            tasks.update_event(EVENTDATE, eventid="2021-07#2380")
+
+        mock_sleep.assert_not_called()
+        mock_update_event.assert_called_once()
+        self.assertEqual(
+            mock_update_event.call_args[1]["not_before"].tzinfo.utcoffset(None),
+            datetime.timedelta(0),
+        )
+
+
+class CoalesceTest(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+
+    def test_get_keys(self):
+        self.assertEqual(
+            coalesce.get_keys(eventid="2021-07#2380", sc3id="bpptkg2021abcd"),
+            [
+                coalesce.KEY_PREFIX + "eventid:2021-07#2380",
+                coalesce.KEY_PREFIX + "sc3id:bpptkg2021abcd",
+            ],
+        )
+        self.assertEqual(coalesce.get_keys(), [])
+
+    def test_claim_many(self):
+        keys = [["a", "b"], ["b"]]
+
+        tokens = coalesce.claim_many(keys, client=self.redis)
+
+        self.assertEqual(len(tokens), 2)
+        self.assertEqual(self.redis.get("a").decode(), tokens[0])
+        self.assertEqual(self.redis.get("b").decode(), tokens[1])
+        self.assertGreater(self.redis.ttl("a"), 0)
+
+    def test_release(self):
+        first, second = coalesce.claim_many([["a", "b"], ["b"]], client=self.redis)
+
+        self.assertFalse(coalesce.release(["a", "b"], first, client=self.redis))
+        self.assertIsNone(self.redis.get("a"))
+        self.assertEqual(self.redis.get("b").decode(), second)
+
+        self.assertTrue(coalesce.release(["b"], second, client=self.redis))
+        self.assertIsNone(self.redis.get("b"))
+
+    def test_release_missing_key(self):
+        self.assertTrue(coalesce.release(["a"], "token", client=self.redis))
+
+    @override_settings(
+        WEBOBS_UPDATE_EVENT_DELAY=10, WEBOBS_UPDATE_EVENT_COALESCE_WINDOW=30
+    )
+    @patch("bulletin.webobs.tasks.visitor.update_event")
+    def test_superseded_task_dropped(self, mock_update_event):
+        signatures = [
+            views.parse_action(
+                {
+                    "action": "WEBOBS_UPDATE_EVENT",
+                    "eventdate": "2021-07-08 00:02:00.24",
+                    "sc3id": "bpptkg2021abcd",
+                }
+            )[1],
+            views.parse_action(
+                {
+                    "action": "WEBOBS_UPDATE_EVENT",
+                    "eventdate": "2021-07-08 00:02:00.24",
+                    "eventid": "2021-07#2380",
+                    "sc3id": "bpptkg2021abcd",
+                }
+            )[1],
+        ]
+        with patch.object(coalesce, "get_client", return_value=self.redis):
+            views.claim_signatures(signatures)
+            for signature in signatures:
+                self.assertEqual(signature.options["countdown"], 30)
+                tasks.update_event(*signature.args, **signature.kwargs)
+
+        mock_update_event.assert_called_once()
+        self.assertEqual(mock_update_event.call_args[1]["eventid"], "2021-07#2380")
+
+
+@override_settings(
+    WEBOBS_UPDATE_EVENT_DELAY=10,
+    WEBOBS_UPDATE_EVENT_COALESCE_WINDOW=0,
+    WEBOBS_BATCH_MAX_SIZE=3,
+)
+class WebObsBatchEndpointTest(SimpleTestCase):
+    def post(self, data):
+        return self.client.post(
+            reverse("bulletin-api-v1-webobs-batch"),
+            data,
+            content_type="application/json",
+        )
+
+    @patch.object(group, "apply_async", autospec=True)
+    def test_mixed_actions(self, mock_apply_async):
+        response = self.post(
+            [
+                {
+                    "action": "WEBOBS_UPDATE_EVENT",
+                    "eventdate": "2021-07-08 00:02:00.24",
+                    "eventid": "2021-07#2380",
+                },
+                {"action": "WEBOBS_HIDE_EVENT"},
+                "WEBOBS_DELETE_EVENT",
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["status"], "submitted")
+        self.assertEqual(data["submitted"], 1)
+        self.assertEqual(data["rejected"], 2)
+
+        results = data["results"]
+        self.assertEqual([result["index"] for result in results], [0, 1, 2])
+        self.assertEqual(results[0]["status"], "submitted")
+        self.assertEqual(results[0]["action"]["name"], "WEBOBS_UPDATE_EVENT")
+        self.assertEqual(results[1]["status"], "rejected")
+        self.assertEqual(results[1]["error"]["code"], "missing_parameter")
+        self.assertEqual(results[2]["status"], "rejected")
+        self.assertEqual(results[2]["error"]["code"], "invalid_parameter")
+
+        mock_apply_async.assert_called_once()
+        signatures = mock_apply_async.call_args[0][0].tasks
+        self.assertEqual(len(signatures), 1)
+        self.assertEqual(signatures[0].task, "webobs_update_event")
+        self.assertEqual(signatures[0].kwargs["eventid"], "2021-07#2380")
+
+    @patch.object(group, "apply_async", autospec=True)
+    def test_group_of_valid_actions(self, mock_apply_async):
+        response = self.post(
+            [
+                {"action": "WEBOBS_HIDE_EVENT", "eventid": "2021-07#2380"},
+                {
+                    "action": "WEBOBS_RESTORE_EVENT",
+                    "eventid": "2021-07#2381",
+                    "eventtype": "VTA",
+                },
+                {"action": "WEBOBS_DELETE_EVENT", "eventid": "2021-07#2382"},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["submitted"], 3)
+        signatures = mock_apply_async.call_args[0][0].tasks
+        self.assertEqual(
+            [signature.task for signature in signatures],
+            ["webobs_hide_event", "webobs_restore_event", "webobs_delete_event"],
+        )
+        self.assertEqual(signatures[1].args, ("2021-07#2381", "VTA"))
+
+    @patch.object(group, "apply_async", autospec=True)
+    def test_all_rejected(self, mock_apply_async):
+        response = self.post([{"action": "UNKNOWN"}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "rejected")
+        self.assertEqual(response.json()["rejected"], 1)
+        mock_apply_async.assert_not_called()
+
+    @patch.object(group, "apply_async", autospec=True)
+    def test_max_size(self, mock_apply_async):
+        response = self.post(
+            [{"action": "WEBOBS_HIDE_EVENT", "eventid": "2021-07#2380"}] * 4
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("limit of 3", response.json()["detail"])
+        mock_apply_async.assert_not_called()
+
+    @patch.object(group, "apply_async", autospec=True)
+    def test_invalid_body(self, mock_apply_async):
+        response = self.post({"action": "WEBOBS_HIDE_EVENT", "eventid": "1"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON array", response.json()["detail"])
+
+        response = self.post([])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("no actions", response.json()["detail"])
+
+        mock_apply_async.assert_not_called()
+
+
+class TaskRoutingTest(SimpleTestCase):
+    def route(self, name):
+        options = app.amqp.router.route({}, name)
+        return options["queue"].name, options.get("priority")
+
+    def test_interactive_tasks(self):
+        for name in (
+            "webobs_update_event",
+            "webobs_hide_event",
+            "webobs_restore_event",
+            "webobs_delete_event",
+        ):
+            self.assertEqual(self.route(name), ("interactive", 0))
+
+    def test_sync_tasks(self):
+        for name in (
+            "webobs_sync_events",
+            "webobs_process_events",
+            "webobs_process_events_done",
+        ):
+            self.assertEqual(self.route(name), ("sync", 6))
+
+    def test_backfill_tasks(self):
+        self.assertEqual(self.route("webobs_backfill_events"), ("backfill", 9))
+
+    def test_queue_order(self):
+        self.assertEqual(
+            [queue.name for queue in app.conf.task_queues],
+            ["interactive", "sync", "backfill"],
+        )
+
+
+@override_settings(WEBOBS_SYNC_CHUNK_SIZE=2)
+class BackfillEventsTest(SimpleTestCase):
+    @patch("bulletin.webobs.tasks.chord")
+    @patch("bulletin.webobs.tasks.visitor")
+    @patch("bulletin.webobs.tasks.WebObsMC3Fetcher")
+    def test_chunks(self, mock_fetcher_class, mock_visitor, mock_chord):
+        events = [
+            {
+                "eventid": "2021-07#{}".format(i),
+                "eventdate": EVENTDATE + datetime.timedelta(minutes=i),
+            }
+            for i in range(5)
+        ]
+        fetcher = mock_fetcher_class.return_value
+        fetcher.fetch_mc3_as_dict.return_value = events
+        fetcher.failed_ranges = []
+        mock_visitor.diff_webobs_and_bulletin.return_value = (events, [])
+
+        tasks.backfill_events(
+            "2021-07-08T00:00:00", "2021-07-09T00:00:00", eventtype="VTA"
+        )
+
+        start, end = fetcher.fetch_mc3_as_dict.call_args[0]
+        self.assertEqual(start, datetime.datetime(2021, 7, 8, tzinfo=pytz.utc))
+        self.assertEqual(end, datetime.datetime(2021, 7, 9, tzinfo=pytz.utc))
+        self.assertEqual(fetcher.fetch_mc3_as_dict.call_args[1], {"eventtype": "VTA"})
+
+        header = mock_chord.call_args[0][0]
+        self.assertEqual([len(signature.args[0]) for signature in header], [2, 2, 1])
+        for signature in header:
+            self.assertEqual(signature.task, "webobs_process_events")
+            self.assertEqual(signature.options["queue"], "backfill")
+
+        callback = mock_chord.return_value.call_args[0][0]
+        self.assertEqual(callback.task, "webobs_process_events_done")
+        self.assertEqual(callback.options["queue"], "backfill")
+        self.assertIsNone(callback.kwargs["state"])
+
+        mock_visitor.sync_bulletin_and_webobs.assert_called_once()
+
+
+@override_settings(WEBOBS_SYNC_CHUNK_SIZE=2)
+class DispatchEventsTest(SimpleTestCase):
+    def setUp(self):
+        self.events = [
+            {
+                "eventid": "2021-07#{}".format(i),
+                "eventdate": pd.Timestamp(EVENTDATE) + pd.Timedelta(minutes=i),
+                "timestamp": pd.Timestamp("2021-07-08 00:09:20", tz="UTC")
+                + pd.Timedelta(minutes=i),
+                "number": np.int64(i),
+                "duration": 45.4,
+                "magnitude": np.float64("nan"),
+            }
+            for i in range(3)
+        ]
+        self.events[2]["timestamp"] = pd.NaT
+        self.state = {
+            SYNCED_UNTIL: datetime.datetime(2021, 7, 9, tzinfo=pytz.utc),
+            TIMESTAMP: datetime.datetime(2021, 7, 8, 1, tzinfo=pytz.utc),
+        }
+
+    @patch("bulletin.webobs.tasks.chord")
+    def test_plain_types(self, mock_chord):
+        tasks.dispatch_events(self.events, state=self.state, eventtype="VTA")
+
+        header = mock_chord.call_args[0][0]
+        callback = mock_chord.return_value.call_args[0][0]
+        json.dumps([signature.args for signature in header], allow_nan=False)
+        json.dumps(callback.kwargs, allow_nan=False)
+
+        with patch("bulletin.webobs.tasks.visitor.process_webobs_events") as mock:
+            tasks.process_events(*header[0].args)
+        events = mock.call_args[0][1]
+        self.assertEqual(events[0]["eventdate"], self.events[0]["eventdate"])
+        self.assertIsInstance(events[0]["eventdate"], pd.Timestamp)
+        self.assertEqual(str(events[0]["eventdate"].tz), "UTC")
+        self.assertEqual(events[1]["timestamp"], self.events[1]["timestamp"])
+        self.assertEqual(events[1]["number"], 1)
+        self.assertIsNone(events[1]["magnitude"])
+
+        with patch.object(SyncWatermark, "save", autospec=True) as mock_save:
+            tasks.process_events_done([[], ["2021-07#1"]], **callback.kwargs)
+        watermark, state = mock_save.call_args[0]
+        self.assertTrue(watermark.path.endswith(".VTA.json"))
+        self.assertEqual(state[SYNCED_UNTIL], self.events[1]["eventdate"])
+        self.assertEqual(state[TIMESTAMP], self.events[1]["timestamp"])
+
+    @patch("bulletin.webobs.tasks.chord")
+    def test_missing_timestamp(self, mock_chord):
+        tasks.dispatch_events(self.events[2:], state=self.state)
+
+        callback = mock_chord.return_value.call_args[0][0]
+        self.assertIsNone(callback.kwargs["events"][0]["timestamp"])
+        with patch.object(SyncWatermark, "save", autospec=True) as mock_save:
+            tasks.process_events_done([["2021-07#2"]], **callback.kwargs)
+        state = mock_save.call_args[0][1]
+        self.assertEqual(state[SYNCED_UNTIL], self.events[2]["eventdate"])
+
+
+class IdempotencyTest(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch.object(idempotency, "get_client", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.event = {
+            "eventid": "2021-07#2380",
+            "seiscompid": "://bpptkg2021nhcpfx",
+            "eventdate": pd.Timestamp("2021-07-08 00:02:00.24", tz="UTC"),
+            "timestamp": pd.Timestamp("2021-07-08 00:09:20", tz="UTC"),
+        }
+        self.key = idempotency.get_key("WEBOBS_UPDATE_EVENT", self.event)
+
+    def test_get_key(self):
+        self.assertTrue(self.key.startswith(idempotency.KEY_PREFIX))
+        self.assertEqual(
+            idempotency.get_key("WEBOBS_UPDATE_EVENT", dict(self.event)), self.key
+        )
+        modified = dict(self.event, timestamp=pd.Timestamp("2021-07-08 00:10:00"))
+        self.assertNotEqual(
+            idempotency.get_key("WEBOBS_UPDATE_EVENT", modified), self.key
+        )
+        self.assertIsNone(
+            idempotency.get_key(
+                "WEBOBS_UPDATE_EVENT", dict(self.event, timestamp=pd.NaT)
+            )
+        )
+
+    def test_acquire_mark_done_discard(self):
+        self.assertTrue(idempotency.acquire(self.key))
+        self.assertFalse(idempotency.acquire(self.key))
+        self.assertFalse(idempotency.is_done(self.key))
+
+        idempotency.discard(self.key)
+        self.assertTrue(idempotency.acquire(self.key))
+
+        with override_settings(WEBOBS_IDEMPOTENCY_TTL=60):
+            idempotency.mark_done(self.key)
+        self.assertTrue(idempotency.is_done(self.key))
+        self.assertFalse(idempotency.acquire(self.key))
+        self.assertLessEqual(self.redis.ttl(self.key), 60)
+
+    def test_execute_once(self):
+        func = Mock(return_value=1)
+
+        self.assertEqual(idempotency.execute_once(self.key, func), 1)
+        self.assertIsNone(idempotency.execute_once(self.key, func))
+        self.assertEqual(idempotency.execute_once(None, func), 1)
+        self.assertEqual(func.call_count, 2)
+
+    def test_execute_once_failed(self):
+        func = Mock(side_effect=[ValueError, 1])
+
+        with self.assertRaises(ValueError):
+            idempotency.execute_once(self.key, func)
+        self.assertIsNone(self.redis.get(self.key))
+        self.assertEqual(idempotency.execute_once(self.key, func), 1)
+
+    def test_execute_once_in_progress(self):
+        idempotency.acquire(self.key)
+        func = Mock()
+
+        with self.assertRaises(idempotency.ActionInProgress):
+            idempotency.execute_once(self.key, func)
+        func.assert_not_called()
+
+    @override_settings(WEBOBS_IDEMPOTENCY_TTL=60)
+    @patch("bulletin.webobs.tasks.visitor.process_event_and_updatedb")
+    @patch("bulletin.webobs.tasks.visitor.settings.WEBOBS_MC3_FETCHER_CLASS")
+    def test_update_event_once(self, mock_fetcher_class, mock_process):
+        mock_fetcher_class.return_value.get_mc3.side_effect = lambda *args, **kwargs: (
+            dict(self.event)
+        )
+
+        with patch("bulletin.webobs.tasks.visitor.webobs.get_mc3_cache"):
+            tasks.update_event(EVENTDATE, eventid="2021-07#2380")
+            tasks.update_event(EVENTDATE, eventid="2021-07#2380")
+
+        mock_process.assert_called_once()
+        self.assertTrue(idempotency.is_done(self.key))
+
+    @override_settings(WEBOBS_IDEMPOTENCY_TTL=60)
+    @patch("bulletin.webobs.tasks.visitor.process_event_and_updatedb")
+    @patch("bulletin.webobs.tasks.visitor.settings.WEBOBS_MC3_FETCHER_CLASS")
+    def test_update_event_in_progress(self, mock_fetcher_class, mock_process):
+        mock_fetcher_class.return_value.get_mc3.return_value = dict(self.event)
+        idempotency.acquire(self.key)
+
+        with patch("bulletin.webobs.tasks.visitor.webobs.get_mc3_cache"):
+            with patch.object(tasks.update_event, "retry") as mock_retry:
+                mock_retry.side_effect = RuntimeError
+                with self.assertRaises(RuntimeError):
+                    tasks.update_event(EVENTDATE, eventid="2021-07#2380")
+
+        mock_process.assert_not_called()
+        self.assertEqual(mock_retry.call_args[1]["countdown"], idempotency.RETRY_DELAY)
+        self.assertIsInstance(
+            mock_retry.call_args[1]["exc"], idempotency.ActionInProgress
+        )
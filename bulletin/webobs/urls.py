@@ -4,4 +4,9 @@ from . import views
 
 urlpatterns = [
     path("webobs/", views.WebObsEndpoint.as_view(), name="bulletin-api-v1-webobs"),
+    path(
+        "webobs/batch/",
+        views.WebObsBatchEndpoint.as_view(),
+        name="bulletin-api-v1-webobs-batch",
+    ),
 ]
@@ -1,10 +1,14 @@
 import pytz
 from bulletin.api.base import Endpoint
+from celery import group
+from django.conf import settings
 from django.utils import dateparse, timezone
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
+from wo import payload
 from wo.actions import SUPPORTED_WEBOBS_ACTION_NAMES, WebObsAction
 
-from . import exceptions, tasks
+from . import coalesce, exceptions, tasks
 
 
 def get_action(name):
@@ -31,92 +35,201 @@ def get_action(name):
     return (None, None)
 
 
-class WebObsEndpoint(Endpoint):
+def parse_action(data, requested_at=None):
+    """
+    Validate WebObs action payload and create Celery task signature of the
+    action.
 
-    def post(self, request):
-        response = {}
+    :param data: Action payload, e.g. request.POST or dictionary item of batch
+    request.
+
+    :param requested_at: Time the request was received. Default to current time.
+
+    :returns: Tuple of action name and task signature.
+    """
+    action = data.get("action")
+    if action is None:
+        raise exceptions.MissingParameter("Missing action parameter.")
+
+    if action not in SUPPORTED_WEBOBS_ACTION_NAMES:
+        raise exceptions.InvalidParameter("Unsupported action name: {}".format(action))
 
-        action = request.POST.get("action")
-        if action is None:
-            raise exceptions.MissingParameter("Missing action parameter.")
+    eventdate_str = data.get("eventdate")
+    eventid = data.get("eventid")
+    sc3id = data.get("sc3id")
+    operator = data.get("operator")
+    eventtype = data.get("eventtype")
 
-        if action not in SUPPORTED_WEBOBS_ACTION_NAMES:
+    if action == WebObsAction.WEBOBS_UPDATE_EVENT.name:
+        if eventdate_str is None:
+            raise exceptions.MissingParameter("Missing eventdate parameter.")
+
+        try:
+            eventdate = dateparse.parse_datetime(eventdate_str)
+        except (TypeError, ValueError):
             raise exceptions.InvalidParameter(
-                "Unsupported action name: {}".format(action)
+                "Invalid eventdate value: {}".format(eventdate_str)
             )
 
-        eventdate_str = request.POST.get("eventdate")
-        eventid = request.POST.get("eventid")
-        sc3id = request.POST.get("sc3id")
-        operator = request.POST.get("operator")
-        eventtype = request.POST.get("eventtype")
+        if eventdate is None:
+            raise exceptions.MissingParameter("Missing eventdate parameter.")
 
-        if action == WebObsAction.WEBOBS_UPDATE_EVENT.name:
-            try:
-                eventdate = dateparse.parse_datetime(eventdate_str)
-            except ValueError as e:
-                raise exceptions.InvalidParameter(
-                    "Invalid eventdate value: {}".format(eventdate_str)
-                )
+        if eventdate.tzinfo is not None:
+            eventdate = eventdate.replace(tzinfo=pytz.utc)
+        else:
+            eventdate = pytz.utc.localize(eventdate)
 
-            if eventdate is None:
-                raise exceptions.MissingParameter("Missing eventdate parameter.")
+        kwargs = {
+            "eventid": eventid,
+            "sc3id": sc3id,
+            "operator": operator,
+            "eventtype": eventtype,
+            "requested_at": payload.to_epoch_us(requested_at or timezone.now()),
+        }
+        countdown = settings.WEBOBS_UPDATE_EVENT_DELAY
+
+        # Only the last update of the same event within the coalescing window
+        # is executed. Previous tasks are dropped by the worker.
+        keys = coalesce.get_keys(eventid=eventid, sc3id=sc3id)
+        if settings.WEBOBS_UPDATE_EVENT_COALESCE_WINDOW > 0 and keys:
+            kwargs["coalesce_keys"] = keys
+            countdown = max(countdown, settings.WEBOBS_UPDATE_EVENT_COALESCE_WINDOW)
+
+        signature = tasks.update_event.signature(
+            args=(payload.to_epoch_us(eventdate),),
+            kwargs=kwargs,
+            countdown=countdown,
+        )
 
-            if eventdate.tzinfo is not None:
-                eventdate = eventdate.replace(tzinfo=pytz.utc)
-            else:
-                eventdate = pytz.utc.localize(eventdate)
-
-            tasks.update_event.apply_async(
-                args=(eventdate,),
-                kwargs={
-                    "eventid": eventid,
-                    "sc3id": sc3id,
-                    "operator": operator,
-                    "eventtype": eventtype,
-                },
-                serializer="pickle",
-            )
+    elif action == WebObsAction.WEBOBS_HIDE_EVENT.name:
+        if eventid is None:
+            raise exceptions.MissingParameter("Missing eventid parameter.")
 
-        elif action == WebObsAction.WEBOBS_HIDE_EVENT.name:
-            if eventid is None:
-                raise exceptions.MissingParameter("Missing eventid parameter.")
+        signature = tasks.hide_event.signature(
+            args=(eventid,),
+            kwargs={"operator": operator},
+        )
 
-            tasks.hide_event.apply_async(
-                args=(eventid,),
-                kwargs={"operator": operator},
-                serializer="pickle",
-            )
+    elif action == WebObsAction.WEBOBS_RESTORE_EVENT.name:
+        if eventid is None:
+            raise exceptions.MissingParameter("Missing eventid parameter.")
 
-        elif action == WebObsAction.WEBOBS_RESTORE_EVENT.name:
-            if eventid is None:
-                raise exceptions.MissingParameter("Missing eventid parameter.")
+        if eventtype is None:
+            raise exceptions.MissingParameter("Missing eventtype parameter.")
 
-            if eventtype is None:
-                raise exceptions.MissingParameter("Missing eventtype parameter.")
+        signature = tasks.restore_event.signature(
+            args=(eventid, eventtype),
+            kwargs={"operator": operator},
+        )
 
-            tasks.restore_event.apply_async(
-                args=(eventid, eventtype),
-                kwargs={"operator": operator},
-                serializer="pickle",
-            )
+    else:
+        if eventid is None:
+            raise exceptions.MissingParameter("Missing eventid parameter.")
+
+        signature = tasks.delete_event.signature(
+            args=(eventid,),
+            kwargs={"operator": operator},
+        )
 
-        elif action == WebObsAction.WEBOBS_DELETE_EVENT.name:
-            if eventid is None:
-                raise exceptions.MissingParameter("Missing eventid parameter.")
+    return action, signature
 
-            tasks.delete_event.apply_async(
-                args=(eventid,),
-                kwargs={"operator": operator},
-                serializer="pickle",
-            )
+
+def claim_signatures(signatures):
+    """
+    Claim coalescing keys of update event signatures in a single Redis round
+    trip. If the same event is updated more than once, the last one wins.
+    """
+    pending = [
+        signature for signature in signatures if signature.kwargs.get("coalesce_keys")
+    ]
+    if not pending:
+        return
+
+    tokens = coalesce.claim_many(
+        [signature.kwargs["coalesce_keys"] for signature in pending]
+    )
+    for signature, token in zip(pending, tokens):
+        signature.kwargs["coalesce_token"] = token
+
+
+def serialize_action(action):
+    action_name, action_id = get_action(action)
+    return {
+        "id": action_id,
+        "name": action_name,
+    }
+
+
+class WebObsEndpoint(Endpoint):
+
+    def post(self, request):
+        response = {}
+
+        action, signature = parse_action(request.POST)
+        claim_signatures([signature])
+        signature.apply_async()
 
         response["status"] = "submitted"
         response["timestamp"] = timezone.now()
-        action_name, action_id = get_action(action)
-        response["action"] = {
-            "id": action_id,
-            "name": action_name,
-        }
+        response["action"] = serialize_action(action)
+
+        return Response(response)
+
+
+class WebObsBatchEndpoint(Endpoint):
+    """
+    Submit multiple WebObs actions in a single request. Request body is a JSON
+    array of action objects with the same parameters as WebObsEndpoint.
 
+    Each action is validated separately. Valid actions are enqueued as a single
+    Celery group and invalid actions are rejected without affecting the others.
+    """
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise exceptions.InvalidParameter(
+                "Request body must be a JSON array of actions."
+            )
+        if not items:
+            raise exceptions.MissingParameter("Request body has no actions.")
+        if len(items) > settings.WEBOBS_BATCH_MAX_SIZE:
+            raise exceptions.InvalidParameter(
+                "Number of actions exceeds the limit of {}.".format(
+                    settings.WEBOBS_BATCH_MAX_SIZE
+                )
+            )
+
+        now = timezone.now()
+        results = []
+        signatures = []
+        for index, item in enumerate(items):
+            result = {"index": index}
+            try:
+                if not isinstance(item, dict):
+                    raise exceptions.InvalidParameter("Action must be a JSON object.")
+                action, signature = parse_action(item, requested_at=now)
+            except APIException as e:
+                result["status"] = "rejected"
+                result["error"] = {
+                    "code": e.default_code,
+                    "detail": e.detail,
+                }
+            else:
+                result["status"] = "submitted"
+                result["action"] = serialize_action(action)
+                signatures.append(signature)
+            results.append(result)
+
+        if signatures:
+            claim_signatures(signatures)
+            group(signatures).apply_async()
+
+        response = {
+            "status": "submitted" if signatures else "rejected",
+            "timestamp": now,
+            "submitted": len(signatures),
+            "rejected": len(items) - len(signatures),
+            "results": results,
+        }
         return Response(response)
@@ -0,0 +1,99 @@
+import argparse
+import logging
+import os
+import sys
+import timeit
+import tracemalloc
+
+from webobsclient.parser import MC3Parser
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if True:
+    from wo.clients.webobs import MC3StreamParser
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "tests",
+    "data",
+    "MC3_dump_bulletin.csv",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark WebObs MC3 CSV parsers. Print rows/second and "
+        "peak memory of MC3Parser followed by time range filter and "
+        "MC3StreamParser."
+    )
+
+    parser.add_argument(
+        "-f",
+        "--file",
+        default=DATA_PATH,
+        help="Path to WebObs MC3 CSV dump file.",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=20,
+        help="Number of times the CSV rows are repeated to make a large dump.",
+    )
+    parser.add_argument(
+        "-k",
+        "--keep",
+        type=float,
+        default=0.1,
+        help="Fraction of rows within the time range filter.",
+    )
+
+    return parser.parse_args()
+
+
+def load_content(path, repeat):
+    with open(path, "rb") as fd:
+        lines = fd.read().splitlines(keepends=True)
+    header = [line for line in lines if line.startswith(b"#")]
+    rows = [line for line in lines if not line.startswith(b"#")]
+    return b"".join(header + rows * repeat)
+
+
+def parse_default(content, start, end):
+    df = MC3Parser().to_df(content)
+    df = df.where((df["eventdate"] >= start) & (df["eventdate"] < end))
+    df.dropna(how="any", inplace=True, subset=["eventdate"])
+    return df
+
+
+def parse_stream(content, start, end):
+    return MC3StreamParser().parse(content, start=start, end=end)
+
+
+def measure(func, content, start, end):
+    elapsed = min(timeit.repeat(lambda: func(content, start, end), number=1, repeat=3))
+    tracemalloc.start()
+    func(content, start, end)
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    args = parse_args()
+
+    content = load_content(args.file, args.repeat)
+    eventdates = MC3StreamParser().parse(content)["eventdate"].sort_values()
+    nrows = len(eventdates)
+    start = eventdates.iloc[0]
+    end = eventdates.iloc[min(nrows - 1, int(nrows * args.keep))]
+
+    print("Rows: {}, content size: {:.1f} MB".format(nrows, len(content) / 1e6))
+    print("{:>16} {:>12} {:>14}".format("parser", "rows/s", "peak mem (MB)"))
+    for name, func in (("MC3Parser", parse_default), ("MC3StreamParser", parse_stream)):
+        elapsed, peak = measure(func, content, start, end)
+        print("{:>16} {:>12.0f} {:>14.1f}".format(name, nrows / elapsed, peak / 1e6))
+
+
+if __name__ == "__main__":
+    main()
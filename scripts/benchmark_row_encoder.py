@@ -0,0 +1,111 @@
+import argparse
+import logging
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+from webobsclient.parser import MC3Parser
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if True:
+    from wo.encoders import DATETIME_FORMAT, RowEncoder, _encode_value
+    from wo.magnitude import compute_magnitude_all
+    from wo.ops import COLUMN_NAMES
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "tests",
+    "data",
+    "MC3_dump_bulletin.csv",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark bulletin row encoder. Print rows/second of "
+        "row encoder (zero-pandas) and vectorized pandas encoding."
+    )
+
+    parser.add_argument(
+        "-f",
+        "--file",
+        default=DATA_PATH,
+        help="Path to WebObs MC3 CSV dump file.",
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        default="10,100,500,1000,10000",
+        help="Comma separated list of batch sizes.",
+    )
+    parser.add_argument(
+        "-n",
+        "--rows",
+        type=int,
+        default=5000,
+        help="Approximate number of rows encoded for each measurement.",
+    )
+
+    return parser.parse_args()
+
+
+def load_events(path):
+    with open(path, "rb") as fd:
+        events = MC3Parser().to_dict(fd.read())
+    for event in events:
+        event.update(compute_magnitude_all(None))
+    return events
+
+
+def encode_frame(encoder, df):
+    """
+    Encode Pandas DataFrame of events to list of row tuples using vectorized
+    operations. Reference implementation to compare with the row encoder.
+    """
+    df = df[encoder.columns].copy()
+
+    for column in encoder.datetime_columns:
+        series = pd.to_datetime(df[column], utc=True)
+        df[column] = (
+            series.dt.tz_convert(encoder.timezone)
+            .dt.tz_localize(None)
+            .dt.strftime(DATETIME_FORMAT)
+        )
+
+    df = df.astype(object).where(pd.notnull(df), None)
+    for column in df.columns:
+        values = df[column].values
+        if any(isinstance(value, np.generic) for value in values):
+            df[column] = [_encode_value(value) for value in values]
+
+    return list(df.itertuples(index=False, name=None))
+
+
+def rows_per_second(func, nrows, number):
+    elapsed = min(timeit.repeat(func, number=number, repeat=3))
+    return nrows * number / elapsed
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    args = parse_args()
+
+    events = load_events(args.file)
+    encoder = RowEncoder(COLUMN_NAMES, datetime_columns=("eventdate", "timestamp"))
+
+    print("{:>8} {:>16} {:>16}".format("size", "encoder rows/s", "pandas rows/s"))
+    for size in map(int, args.sizes.split(",")):
+        batch = (events * (size // len(events) + 1))[:size]
+        number = max(1, args.rows // size)
+
+        single = rows_per_second(lambda: encoder.encode_many(batch), size, number)
+        vectorized = rows_per_second(
+            lambda: encode_frame(encoder, pd.DataFrame(batch)), size, number
+        )
+        print("{:>8} {:>16.0f} {:>16.0f}".format(size, single, vectorized))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import argparse
 import datetime
+import functools
 import logging
 import logging.config
 import os
@@ -11,11 +12,12 @@ from webobsclient.contrib.bpptkg.db.seismic_bulletin import Base, Bulletin
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 if True:
-    from wo import settings
+    from wo import settings, shards
+    from wo.checkpoint import Checkpoint
     from wo.clients import webobs
     from wo.singleton import SingleInstanceException
     from wo.utils import date
-    from wo.visitor import SimpleEventVisitor
+    from wo.visitor import SimpleEventVisitor, incremental_sync
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +65,17 @@ def parse_args():
         help="Skip event magnitude calculation.",
     )
 
+    parser.add_argument(
+        "-j",
+        "--mag-workers",
+        type=int,
+        default=settings.MAGNITUDE_WORKERS,
+        help="Number of worker processes to compute event magnitudes "
+        "in parallel. If --workers is greater than 1, it is capped so that "
+        "the total number of processes does not exceed the number of CPUs. "
+        "Default to {}.".format(settings.MAGNITUDE_WORKERS),
+    )
+
     parser.add_argument(
         "-p",
         "--print-only",
@@ -87,7 +100,200 @@ def parse_args():
         "and seismic bulletin database (forward and reverse syncs).",
     )
 
-    return parser.parse_args()
+    parser.add_argument(
+        "-I",
+        "--incremental",
+        action="store_true",
+        help="Perform incremental synchronization. Only events that changed "
+        "since the last run are processed. Time range from start time is only "
+        "synchronized in periodic wide reconciliation pass.",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes. If greater than 1, time range is "
+        "split into shards (see --shard-by) that are synchronized concurrently.",
+    )
+
+    parser.add_argument(
+        "--shard-by",
+        choices=shards.SHARD_BY_CHOICES,
+        help="Split time range into shards by day, week, or month. Each shard "
+        "has its own lock file. Default to day if --workers is greater than 1.",
+    )
+
+    parser.add_argument(
+        "-R",
+        "--resume",
+        action="store_true",
+        help="Resume interrupted run of the same time range and options. "
+        "Completed shards and already processed events are skipped.",
+    )
+
+    args = parser.parse_args()
+    if args.incremental and (args.workers > 1 or args.shard_by is not None):
+        parser.error("--incremental can not be used with --workers or --shard-by.")
+    return args
+
+
+def sync_range(
+    engine, args, starttime, endtime, lockfile=settings.LOCKFILE, checkpoint=None
+):
+    """
+    Run synchronization of time range starttime to endtime (UTC) according to
+    the command line arguments.
+
+    If checkpoint is set, completed time range and processed event IDs are
+    recorded, and work that has already been recorded is skipped.
+
+    :returns: True if all WebObs MC3 events of the time range were fetched,
+    otherwise False.
+    """
+    fetcher = webobs.WebObsMC3Fetcher()
+
+    visitor = SimpleEventVisitor(
+        engine,
+        Bulletin,
+        lockfile=lockfile,
+        dry=args.dry,
+        skip_mag_calc=args.skip_mag_calc,
+        mag_workers=args.mag_workers,
+    )
+
+    if checkpoint is not None and checkpoint.is_shard_done(starttime, endtime):
+        logger.info("Time range %s to %s already completed.", starttime, endtime)
+        return True
+
+    if args.incremental:
+        incremental_sync(
+            engine,
+            Bulletin,
+            fetcher,
+            starttime,
+            endtime,
+            eventtype=args.eventtype,
+            dry_run=args.dry,
+        )
+        return not fetcher.failed_ranges
+
+    if args.reverse and not args.full_sync:
+        # Stream WebObs and database events window by window, so that
+        # reverse sync can run over long time range in constant memory. Windows
+        # with partially fetched WebObs events are skipped. Each fetch resets
+        # failed_ranges, so failures of all windows are in all_failed_ranges.
+        fetch = functools.partial(fetcher.fetch_mc3_as_dict, strict=True)
+        if args.print_only:
+            visitor.reverse_print_range(
+                fetch,
+                starttime,
+                endtime,
+                eventtype=args.eventtype,
+            )
+        else:
+            visitor.reverse_process_range(
+                fetch,
+                starttime,
+                endtime,
+                eventtype=args.eventtype,
+            )
+            if checkpoint is not None and not fetcher.all_failed_ranges:
+                checkpoint.mark_shard_done(starttime, endtime)
+        if fetcher.all_failed_ranges:
+            logger.error(
+                "Failed to fetch %s time ranges of WebObs MC3 bulletin. "
+                "Reverse sync of these time ranges is skipped.",
+                len(fetcher.all_failed_ranges),
+            )
+        return not fetcher.all_failed_ranges
+
+    events = fetcher.fetch_mc3_as_dict(starttime, endtime, eventtype=args.eventtype)
+    logger.info("Number of events: %s", len(events))
+    if fetcher.failed_ranges:
+        logger.error(
+            "Failed to fetch %s time ranges of WebObs MC3 bulletin. "
+            "Only fetched events are synchronized.",
+            len(fetcher.failed_ranges),
+        )
+
+    if checkpoint is not None:
+        skip_eventids = checkpoint.get_processed_events(starttime, endtime)
+        on_upserted = functools.partial(
+            checkpoint.add_processed_events, starttime, endtime
+        )
+    else:
+        skip_eventids = None
+        on_upserted = None
+
+    if args.full_sync:
+        logger.info("Synching WebObs MC3 bulletin and seismic bulletin database...")
+        visitor.process_events(
+            events, skip_eventids=skip_eventids, on_upserted=on_upserted
+        )
+
+        # Events missing from failed time ranges would be mistaken as deleted
+        # from WebObs, so reverse sync is skipped.
+        if not fetcher.failed_ranges:
+            logger.info("Synching seismic bulletin database and WebObs MC3 bulletin...")
+            visitor.reverse_process_events(
+                events, starttime, endtime, eventtype=args.eventtype
+            )
+    else:
+        if args.print_only:
+            visitor.print_events(events)
+            return not fetcher.failed_ranges
+        visitor.process_events(
+            events, skip_eventids=skip_eventids, on_upserted=on_upserted
+        )
+
+    if fetcher.failed_ranges:
+        return False
+
+    if checkpoint is not None:
+        checkpoint.mark_shard_done(starttime, endtime)
+    return True
+
+
+def get_shard_mag_workers(workers, mag_workers, cpu_count=None):
+    """
+    Get number of magnitude worker processes of each shard process, so that
+    workers times magnitude workers does not oversubscribe the CPUs.
+    """
+    if workers < 2:
+        return mag_workers
+    if cpu_count is None:
+        cpu_count = os.cpu_count() or 1
+    return max(1, min(mag_workers, cpu_count // workers))
+
+
+def sync_shard(start, end, args, checkpoint=None):
+    """
+    Run synchronization of a single time shard (local time zone) with its own
+    database engine and lock file.
+
+    :returns: True if the shard was completely synchronized, otherwise False.
+    """
+    starttime = date.to_utc(start)
+    endtime = date.to_utc(end)
+    logger.info("Shard time range [local]: %s to %s", start, end)
+
+    engine = create_engine(settings.DATABASE_ENGINE, poolclass=NullPool)
+    try:
+        return sync_range(
+            engine,
+            args,
+            starttime,
+            endtime,
+            lockfile=shards.get_shard_lockfile(starttime, endtime),
+            checkpoint=checkpoint,
+        )
+    except SingleInstanceException as e:
+        logger.error("Shard %s to %s is already running: %s", start, end, e)
+        return False
+    finally:
+        engine.dispose()
 
 
 def main():
@@ -109,44 +315,64 @@ def main():
     logger.info("Time range [local]: %s to %s", start, end)
     logger.info("Time range [utc]: %s to %s", starttime, endtime)
 
-    try:
-        fetcher = webobs.WebObsMC3Fetcher()
-        events = fetcher.fetch_mc3_as_dict(starttime, endtime, eventtype=args.eventtype)
-        logger.info("Number of events: %s", len(events))
-
-        visitor = SimpleEventVisitor(
-            engine,
-            Bulletin,
-            lockfile=settings.LOCKFILE,
-            dry=args.dry,
+    checkpoint = None
+    if not (args.dry or args.print_only or args.incremental):
+        checkpoint = Checkpoint.from_params(
+            start=starttime,
+            end=endtime,
+            eventtype=args.eventtype,
+            reverse=args.reverse,
+            full_sync=args.full_sync,
             skip_mag_calc=args.skip_mag_calc,
+            shard_by=args.shard_by,
         )
+        if args.resume:
+            logger.info("Resuming from checkpoint: %s", checkpoint.path)
+        else:
+            checkpoint.clear()
 
-        if args.full_sync:
-            logger.info("Synching WebObs MC3 bulletin and seismic bulletin database...")
-            visitor.process_events(events)
+    if args.workers > 1 or args.shard_by is not None:
+        # Each shard process runs its own magnitude process pool.
+        mag_workers = get_shard_mag_workers(args.workers, args.mag_workers)
+        if mag_workers != args.mag_workers:
+            logger.info(
+                "Capping magnitude workers of each shard from %s to %s.",
+                args.mag_workers,
+                mag_workers,
+            )
+            args.mag_workers = mag_workers
 
-            logger.info("Synching seismic bulletin database and WebObs MC3 bulletin...")
-            visitor.reverse_process_events(
-                events, starttime, endtime, eventtype=args.eventtype
+        time_shards = shards.split_time_range(start, end, args.shard_by or "day")
+        logger.info(
+            "Running %s shards with %s workers...", len(time_shards), args.workers
+        )
+
+        results = shards.run_shards(
+            sync_shard, time_shards, args, checkpoint, max_workers=args.workers
+        )
+        failed = [shard for shard, ok in results if not ok]
+        if failed:
+            for shard_start, shard_end in failed:
+                logger.error("Shard failed: %s to %s", shard_start, shard_end)
+            if checkpoint is not None:
+                logger.info("Run again with --resume to skip completed shards.")
+            sys.exit(1)
+    else:
+        try:
+            completed = sync_range(
+                engine, args, starttime, endtime, checkpoint=checkpoint
             )
-        elif args.reverse:
-            if args.print_only:
-                visitor.reverse_print_events(
-                    events, starttime, endtime, eventtype=args.eventtype
-                )
-            else:
-                visitor.reverse_process_events(
-                    events, starttime, endtime, eventtype=args.eventtype
-                )
-        else:
-            if args.print_only:
-                visitor.print_events(events)
-            else:
-                visitor.process_events(events)
+        except SingleInstanceException as e:
+            logger.error(e)
+            return
+        if not completed:
+            logger.error("Some WebObs MC3 time ranges could not be fetched.")
+            if checkpoint is not None:
+                logger.info("Run again with --resume to skip processed events.")
+            sys.exit(1)
 
-    except SingleInstanceException as e:
-        logger.error(e)
+    if checkpoint is not None:
+        checkpoint.clear()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+import os
+import unittest
+from unittest.mock import MagicMock
+
+from webobsclient.parser import MC3Parser
+
+from wo.magnitude import compute_magnitude_all
+from wo.ops import INSERT_QUERY, BulkUpserter
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
+)
+
+
+class BulkUpserterTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(DATA_DIR, "MC3_dump_bulletin1.csv"), "rb") as fd:
+            content = fd.read()
+
+        parser = MC3Parser()
+        self.events = parser.to_dict(content)
+        for event in self.events:
+            event.update(compute_magnitude_all(None))
+
+        self.engine = MagicMock()
+        self.connection = self.engine.raw_connection.return_value
+        self.cursor = self.connection.cursor.return_value
+
+    def test_flush_in_chunks(self):
+        with BulkUpserter(self.engine, chunk_size=3) as upserter:
+            for event in self.events:
+                upserter.add(event)
+
+        n = len(self.events)
+        self.assertEqual(self.cursor.executemany.call_count, (n + 2) // 3)
+        self.assertEqual(self.connection.commit.call_count, (n + 2) // 3)
+        self.engine.raw_connection.assert_called_once()
+        self.connection.close.assert_called_once()
+        self.assertEqual(upserter.succeeded, n)
+        self.assertEqual(upserter.failed, [])
+
+        query, entries = self.cursor.executemany.call_args_list[0][0]
+        self.assertEqual(query, INSERT_QUERY)
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(len(entries[0]), 27)
+
+    def test_chunk_error_isolation(self):
+        bad_eventid = self.events[1]["eventid"]
+
+        def execute(query, entry):
+            if entry[0] == bad_eventid:
+                raise ValueError("Invalid value.")
+
+        self.cursor.executemany.side_effect = ValueError("Invalid value.")
+        self.cursor.execute.side_effect = execute
+
+        upserter = BulkUpserter(self.engine, chunk_size=len(self.events))
+        for event in self.events:
+            upserter.add(event)
+        upserter.close()
+
+        self.assertEqual(self.cursor.execute.call_count, len(self.events))
+        self.assertEqual(upserter.failed, [bad_eventid])
+        self.assertEqual(upserter.succeeded, len(self.events) - 1)
+
+    def test_on_success(self):
+        bad_eventid = self.events[1]["eventid"]
+
+        def execute(query, entry):
+            if entry[0] == bad_eventid:
+                raise ValueError("Invalid value.")
+
+        self.cursor.executemany.side_effect = [None, ValueError("Invalid value.")]
+        self.cursor.execute.side_effect = execute
+
+        eventids = []
+        upserter = BulkUpserter(self.engine, chunk_size=1, on_success=eventids.extend)
+        upserter.add(self.events[0])
+        upserter.add(self.events[1])
+        upserter.close()
+
+        self.assertEqual(eventids, [self.events[0]["eventid"]])
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            BulkUpserter(self.engine, chunk_size=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
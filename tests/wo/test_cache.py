@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from obspy import UTCDateTime, read
+
+from wo.clients.cache import WaveformCache
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
+)
+
+
+class WaveformCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = WaveformCache(root=self.root)
+        self.stream = read(os.path.join(DATA_DIR, "stream.msd")).select(station="MEPAS")
+        self.starttime = self.stream[0].stats.starttime
+        self.endtime = self.stream[0].stats.endtime
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_cache_miss(self):
+        stream = self.cache.get(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.endtime
+        )
+        self.assertIsNone(stream)
+
+    def test_cache_hit(self):
+        self.cache.put(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.endtime, self.stream
+        )
+
+        stream = self.cache.get(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.endtime
+        )
+        self.assertIsNotNone(stream)
+        self.assertEqual(len(stream), 3)
+        for tr in stream:
+            expected = self.stream.select(id=tr.id)[0]
+            self.assertEqual(tr.stats.npts, expected.stats.npts)
+            self.assertTrue((tr.data == expected.data).all())
+
+    def test_cache_slice(self):
+        self.cache.put(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.endtime, self.stream
+        )
+
+        stream = self.cache.get(
+            "VG", "MEPAS", "00", "*H*", self.starttime + 5, self.starttime + 10
+        )
+        self.assertIsNotNone(stream)
+        for tr in stream:
+            self.assertEqual(tr.stats.starttime, self.starttime + 5)
+            self.assertEqual(tr.stats.npts, 501)
+
+    def test_cache_partial_coverage(self):
+        self.cache.put(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.starttime + 5, self.stream
+        )
+
+        stream = self.cache.get(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.endtime
+        )
+        self.assertIsNone(stream)
+
+    def test_cache_partial_response(self):
+        # Server returned data up to 5 seconds after the start of the window.
+        stream = self.stream.slice(self.starttime, self.starttime + 5)
+        self.cache.put("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime, stream)
+
+        self.assertIsNotNone(
+            self.cache.get(
+                "VG", "MEPAS", "00", "*H*", self.starttime, self.starttime + 5
+            )
+        )
+        self.assertIsNone(
+            self.cache.get("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime)
+        )
+
+    def test_cache_gap(self):
+        # Server returned data with a gap from 5 to 10 seconds after the start.
+        stream = self.stream.slice(self.starttime, self.starttime + 5)
+        stream += self.stream.slice(self.starttime + 10, self.endtime)
+        self.cache.put("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime, stream)
+
+        self.assertIsNotNone(
+            self.cache.get(
+                "VG", "MEPAS", "00", "*H*", self.starttime, self.starttime + 5
+            )
+        )
+        self.assertIsNotNone(
+            self.cache.get(
+                "VG", "MEPAS", "00", "*H*", self.starttime + 10, self.endtime
+            )
+        )
+        self.assertIsNone(
+            self.cache.get("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime)
+        )
+        self.assertIsNone(
+            self.cache.get(
+                "VG", "MEPAS", "00", "*H*", self.starttime + 4, self.starttime + 11
+            )
+        )
+
+    def test_cache_missing_component(self):
+        # One component only returned data up to 5 seconds after the start.
+        stream = self.stream.copy()
+        stream[1] = stream[1].slice(self.starttime, self.starttime + 5)
+        self.cache.put("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime, stream)
+
+        self.assertIsNotNone(
+            self.cache.get(
+                "VG", "MEPAS", "00", "*H*", self.starttime, self.starttime + 5
+            )
+        )
+        self.assertIsNone(
+            self.cache.get("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime)
+        )
+
+    def test_cache_recent_data(self):
+        self.cache.min_age = UTCDateTime() - self.starttime + 3600
+
+        self.cache.put(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.endtime, self.stream
+        )
+
+        self.assertIsNone(
+            self.cache.get("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime)
+        )
+
+    def test_evict_by_age(self):
+        self.cache.put(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.endtime, self.stream
+        )
+        path = self.cache.get_path(
+            "VG", "MEPAS", "00", "*H*", UTCDateTime(self.starttime.date)
+        )
+        self.assertTrue(os.path.isfile(path))
+
+        mtime = time.time() - 2 * self.cache.max_age * 86400
+        os.utime(path, (mtime, mtime))
+        self.cache.evict()
+
+        self.assertFalse(os.path.isfile(path))
+        self.assertIsNone(
+            self.cache.get("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime)
+        )
+
+    def test_evict_by_size(self):
+        self.cache.max_size = 0
+        self.cache.put(
+            "VG", "MEPAS", "00", "*H*", self.starttime, self.endtime, self.stream
+        )
+        self.cache.evict()
+
+        self.assertIsNone(
+            self.cache.get("VG", "MEPAS", "00", "*H*", self.starttime, self.endtime)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
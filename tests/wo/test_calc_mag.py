@@ -1,9 +1,16 @@
 import os
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 
+import richter
 from obspy import read
 
-from wo.magnitude import compute_magnitude_all
+from wo.magnitude import (
+    compute_magnitude_all,
+    compute_station_magnitude,
+    get_station_info,
+    iter_magnitudes,
+)
 
 DATA_DIR = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
@@ -26,6 +33,48 @@ class CalculateMagnitudeTest(unittest.TestCase):
         self.assertAlmostEqual(mag["ml_pasarbubar"], 2.158377027093737, places=4)
         self.assertAlmostEqual(mag["ml_pusunglondon"], 2.1240845696276773, places=4)
 
+    def test_compute_station_magnitude(self):
+        st = read(os.path.join(DATA_DIR, "stream.msd"))
+
+        for station in get_station_info():
+            kwargs = {
+                "network": station["network"],
+                "component": station["component"],
+                "channel": station["channel"],
+            }
+            ml, app = compute_station_magnitude(st, station["station"], **kwargs)
+
+            self.assertEqual(app, richter.compute_app(st, station["station"], **kwargs))
+            self.assertAlmostEqual(
+                ml, richter.compute_ml(st, station["station"], **kwargs), places=10
+            )
+
+        ml, app = compute_station_magnitude(st, "MEPAS", channel="BHZ")
+        self.assertIsNone(ml)
+        self.assertIsNone(app)
+
+    def test_iter_magnitudes(self):
+        st = read(os.path.join(DATA_DIR, "stream.msd"))
+        batches = [["event1", "event2"], ["event3"], ["event4", "event5"]]
+
+        def fetch(events):
+            return [st if event != "event3" else None for event in events]
+
+        expected = compute_magnitude_all(st)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(iter_magnitudes(batches, fetch, executor=executor))
+
+        self.assertEqual(
+            [event for event, __, __ in results],
+            ["event1", "event2", "event3", "event4", "event5"],
+        )
+        for event, stream, magnitudes in results:
+            if event == "event3":
+                self.assertIsNone(stream)
+                self.assertIsNone(magnitudes["ml_deles"])
+            else:
+                self.assertEqual(magnitudes, expected)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,67 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import pytz
+
+from wo.checkpoint import Checkpoint
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.start = datetime.datetime(2021, 7, 1, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2021, 7, 2, tzinfo=pytz.utc)
+        self.checkpoint = Checkpoint.from_params(
+            root=self.root, start=self.start, end=self.end, eventtype="ALL"
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_key(self):
+        checkpoint = Checkpoint.from_params(
+            root=self.root, eventtype="ALL", end=self.end, start=self.start
+        )
+        self.assertEqual(checkpoint.key, self.checkpoint.key)
+
+        checkpoint = Checkpoint.from_params(
+            root=self.root, start=self.start, end=self.end, eventtype="VTA"
+        )
+        self.assertNotEqual(checkpoint.key, self.checkpoint.key)
+
+    def test_shard_done(self):
+        self.assertFalse(self.checkpoint.is_shard_done(self.start, self.end))
+
+        self.checkpoint.mark_shard_done(self.start, self.end)
+
+        self.assertTrue(self.checkpoint.is_shard_done(self.start, self.end))
+        self.assertFalse(
+            self.checkpoint.is_shard_done(
+                self.end, self.end + datetime.timedelta(days=1)
+            )
+        )
+
+    def test_processed_events(self):
+        self.assertEqual(
+            self.checkpoint.get_processed_events(self.start, self.end), set()
+        )
+
+        self.checkpoint.add_processed_events(self.start, self.end, ["a", "b"])
+        self.checkpoint.add_processed_events(self.start, self.end, ["c"])
+
+        self.assertEqual(
+            self.checkpoint.get_processed_events(self.start, self.end),
+            {"a", "b", "c"},
+        )
+
+        self.checkpoint.clear()
+        self.assertEqual(
+            self.checkpoint.get_processed_events(self.start, self.end), set()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+import datetime
+import os
+import unittest
+from unittest.mock import patch
+
+import pytz
+from sqlalchemy import create_engine
+from webobsclient.contrib.bpptkg.db.seismic_bulletin import Base, Bulletin
+from webobsclient.contrib.bpptkg.db.sessions import session_scope
+from webobsclient.parser import MC3Parser
+
+from wo.dbquery import (
+    REVERSE_SYNC_COLUMNS,
+    get_bulletin_by_range,
+    iter_bulletin_by_range,
+    reverse_filter_by_window,
+    reverse_filter_exact,
+)
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
+)
+
+
+class GetBulletinByRangeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite://")
+        Base.metadata.create_all(cls.engine, tables=[Bulletin.__table__])
+        Base.prepare(cls.engine, reflect=True)
+
+        with session_scope(cls.engine) as session:
+            for i, eventtype in enumerate(["VTA", None, "MP", "VTA"]):
+                session.add(
+                    Bulletin(
+                        eventid="event{}".format(i),
+                        eventdate=datetime.datetime(2021, 7, 1, i),
+                        eventtype=eventtype,
+                        operator="bot",
+                    )
+                )
+            session.commit()
+
+    def setUp(self):
+        self.starttime = datetime.datetime(2021, 7, 1, 0)
+        self.endtime = datetime.datetime(2021, 7, 1, 3)
+
+    def test_get_bulletin_by_range(self):
+        events = get_bulletin_by_range(
+            self.engine, Bulletin, self.starttime, self.endtime, None
+        )
+
+        self.assertEqual([event["eventid"] for event in events], ["event0", "event2"])
+        self.assertEqual(events[0]["operator"], "bot")
+
+    def test_get_bulletin_by_range_columns(self):
+        rows = get_bulletin_by_range(
+            self.engine,
+            Bulletin,
+            self.starttime,
+            self.endtime,
+            "ALL",
+            columns=["eventid", "eventtype"],
+        )
+
+        self.assertEqual(rows, [("event0", "VTA"), ("event2", "MP")])
+        self.assertIs(type(rows[0]), tuple)
+
+        df = get_bulletin_by_range(
+            self.engine,
+            Bulletin,
+            self.starttime,
+            self.endtime,
+            "MP",
+            columns=["eventid", "eventtype"],
+            frame=True,
+        )
+
+        self.assertEqual(list(df.columns), ["eventid", "eventtype"])
+        self.assertEqual(df["eventid"].tolist(), ["event2"])
+
+    def test_iter_bulletin_by_range(self):
+        rows = iter_bulletin_by_range(
+            self.engine,
+            Bulletin,
+            self.starttime,
+            self.endtime,
+            None,
+            columns=["eventid", "eventtype"],
+            batch_size=1,
+        )
+
+        self.assertEqual(list(rows), [("event0", "VTA"), ("event2", "MP")])
+
+        events = list(
+            iter_bulletin_by_range(
+                self.engine, Bulletin, self.starttime, self.endtime, "VTA"
+            )
+        )
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["eventid"], "event0")
+
+    def test_reverse_filter_by_window(self):
+        calls = []
+
+        def fetch(start, end, eventtype=None):
+            calls.append((start, end))
+            if len(calls) == 1:
+                return [{"eventid": "event0", "eventtype": "MP"}]
+            return []
+
+        start = datetime.datetime(2021, 6, 30, 17, tzinfo=pytz.utc)
+        end = datetime.datetime(2021, 6, 30, 21, tzinfo=pytz.utc)
+        results = list(
+            reverse_filter_by_window(
+                self.engine,
+                Bulletin,
+                fetch,
+                start,
+                end,
+                window=datetime.timedelta(hours=2),
+            )
+        )
+
+        self.assertEqual(
+            calls,
+            [
+                (start, start + datetime.timedelta(hours=2)),
+                (start + datetime.timedelta(hours=2), end),
+            ],
+        )
+        # Second window is skipped because WebObs returns no events.
+        self.assertEqual(len(results), 1)
+        event_db, event_wo = results[0]
+        self.assertEqual(event_db["eventid"], "event0")
+        self.assertEqual(event_db["eventtype"], "VTA")
+        self.assertEqual(event_wo["eventtype"], "MP")
+
+
+class ReverseFilterExactTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(DATA_DIR, "MC3_dump_bulletin.csv"), "rb") as fd:
+            content = fd.read()
+
+        parser = MC3Parser()
+        self.events = parser.to_dict(content)
+        self.start = datetime.datetime(2021, 7, 1, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2021, 7, 8, tzinfo=pytz.utc)
+
+    @patch("wo.dbquery.get_bulletin_by_range")
+    def test_reverse_filter_exact(self, mock_get_bulletin_by_range):
+        rows = [
+            (event["eventid"], event["eventdate"], event["eventtype"], "bot")
+            for event in self.events
+        ]
+        rows[1] = (rows[1][0], rows[1][1], "UNKNOWN", "bot")
+        rows.append(("NOTEXISTS", self.start, "VTA", "bot"))
+        mock_get_bulletin_by_range.return_value = rows
+
+        results = list(
+            reverse_filter_exact(None, None, self.events, self.start, self.end)
+        )
+
+        mock_get_bulletin_by_range.assert_called_once_with(
+            None,
+            None,
+            datetime.datetime(2021, 7, 1, 7, 0, 0),
+            datetime.datetime(2021, 7, 8, 7, 0, 0),
+            None,
+            columns=REVERSE_SYNC_COLUMNS,
+        )
+        self.assertEqual(len(results), 2)
+        self.assertEqual(
+            results[0], (dict(zip(REVERSE_SYNC_COLUMNS, rows[1])), self.events[1])
+        )
+        self.assertEqual(results[1][0]["eventid"], "NOTEXISTS")
+        self.assertEqual(results[1][0]["operator"], "bot")
+        self.assertIsNone(results[1][1])
+
+    @patch("wo.dbquery.get_bulletin_by_range")
+    def test_reverse_filter_exact_empty(self, mock_get_bulletin_by_range):
+        results = list(reverse_filter_exact(None, None, [], self.start, self.end))
+
+        self.assertEqual(results, [])
+        mock_get_bulletin_by_range.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
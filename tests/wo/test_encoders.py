@@ -0,0 +1,94 @@
+import datetime
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+import pytz
+from webobsclient.parser import MC3Parser
+
+from wo.encoders import RowEncoder
+from wo.magnitude import compute_magnitude_all
+from wo.ops import COLUMN_NAMES, prepare_entries
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
+)
+
+
+class RowEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(DATA_DIR, "MC3_dump_bulletin1.csv"), "rb") as fd:
+            content = fd.read()
+
+        parser = MC3Parser()
+        self.events = parser.to_dict(content)
+        for event in self.events:
+            event.update(compute_magnitude_all(None))
+
+        self.encoder = RowEncoder(
+            ["eventid", "eventdate", "duration", "count"],
+            datetime_columns=("eventdate",),
+            timezone="Asia/Jakarta",
+        )
+
+    def test_encode(self):
+        event = {
+            "eventid": "MC3",
+            "eventdate": pd.Timestamp("2021-07-08T00:02:00.24Z"),
+            "duration": np.float64(12.5),
+            "count": np.int64(2),
+        }
+
+        row = self.encoder.encode(event)
+
+        self.assertEqual(row, ("MC3", "2021-07-08 07:02:00", 12.5, 2))
+        self.assertIs(type(row[2]), float)
+        self.assertIs(type(row[3]), int)
+
+    def test_encode_naive_datetime(self):
+        event = {
+            "eventid": "MC3",
+            "eventdate": datetime.datetime(2021, 12, 31, 20, 0, 0),
+            "duration": 1.0,
+            "count": 1,
+        }
+        row = self.encoder.encode(event)
+        self.assertEqual(row[1], "2022-01-01 03:00:00")
+
+        event["eventdate"] = pytz.timezone("Asia/Jakarta").localize(
+            datetime.datetime(2022, 1, 1, 3, 0, 0)
+        )
+        row = self.encoder.encode(event)
+        self.assertEqual(row[1], "2022-01-01 03:00:00")
+
+    def test_encode_null(self):
+        event = {
+            "eventid": "MC3",
+            "eventdate": pd.NaT,
+            "duration": np.nan,
+            "count": None,
+        }
+
+        self.assertEqual(self.encoder.encode(event), ("MC3", None, None, None))
+
+    def test_encode_many(self):
+        encoder = RowEncoder(COLUMN_NAMES, datetime_columns=("eventdate", "timestamp"))
+
+        rows = [encoder.encode(event) for event in self.events]
+        self.assertEqual(encoder.encode_many(self.events), rows)
+
+    def test_prepare_entries(self):
+        entries = prepare_entries(self.events)
+
+        self.assertEqual(len(entries), len(self.events))
+        self.assertEqual(prepare_entries(self.events[0]), entries[:1])
+        for entry in entries:
+            self.assertEqual(len(entry), len(COLUMN_NAMES))
+            for value in entry:
+                self.assertNotIsInstance(value, np.generic)
+
+
+if __name__ == "__main__":
+    unittest.main()
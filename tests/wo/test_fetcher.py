@@ -1,10 +1,27 @@
+import datetime
+import io
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
 
+import pandas as pd
+import pytz
 from dateutil.parser import parse
 from webobsclient import MC3Client
+from webobsclient.parser import MC3Parser
 
-from wo.clients.webobs import WebObsMC3Fetcher
+from wo import constants
+from wo.clients.cache import MC3Cache
+from wo.clients.webobs import (
+    MC3StreamParser,
+    WebObsMC3Fetcher,
+    _CommentFilter,
+    split_fetch_range,
+)
 
 DATA_DIR = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
@@ -55,5 +72,244 @@ class WebObsMC3FetcherTest(unittest.TestCase):
         self.assertEqual(event["eventtype"], "ROCKFALL")
 
 
+class FakeMC3Client:
+    """
+    MC3 client that fails the first request of the given start times.
+    """
+
+    def __init__(self, fail_starttimes=(), fail_count=1):
+        self.api = MC3Client(username="test", password="test").api
+        self.parameters = {}
+        self.fail_count = fail_count
+        self.failures = {starttime: 0 for starttime in fail_starttimes}
+        self.requests = []
+        self.lock = threading.Lock()
+
+        with open(os.path.join(DATA_DIR, "MC3_dump_bulletin1.csv"), "rb") as fd:
+            self.content = fd.read()
+
+    def request(self, **kwargs):
+        starttime = kwargs["starttime"]
+        with self.lock:
+            self.requests.append(starttime)
+            if self.failures.get(starttime, self.fail_count) < self.fail_count:
+                self.failures[starttime] += 1
+                return {"status": "500"}, b""
+        return {"status": "200"}, self.content
+
+
+class ChunkedFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime.datetime(2021, 7, 7, 12, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2021, 7, 9, 12, tzinfo=pytz.utc)
+        self.chunk_start = datetime.datetime(2021, 7, 8, tzinfo=pytz.utc)
+
+    def test_split_fetch_range(self):
+        chunks = split_fetch_range(self.start, self.end, datetime.timedelta(days=1))
+
+        self.assertEqual(
+            chunks,
+            [
+                (self.start, self.chunk_start),
+                (self.chunk_start, datetime.datetime(2021, 7, 9, tzinfo=pytz.utc)),
+                (datetime.datetime(2021, 7, 9, tzinfo=pytz.utc), self.end),
+            ],
+        )
+        self.assertEqual(
+            split_fetch_range(self.start, self.end, datetime.timedelta(days=7)),
+            [(self.start, self.end)],
+        )
+
+    def test_fetch_chunks(self):
+        client = FakeMC3Client()
+        fetcher = WebObsMC3Fetcher(client=client, max_workers=3, retry_delay=0)
+
+        events = fetcher.fetch_mc3_as_dict(self.start, self.end)
+
+        # Each chunk returns the same content, but only events within the chunk
+        # time range are kept.
+        self.assertEqual(len(client.requests), 3)
+        self.assertEqual(
+            [event["eventid"] for event in events],
+            ["2021-07#2380", "2021-07#2381", "2021-07#2392", "2021-07#2382"],
+        )
+        self.assertEqual(fetcher.failed_ranges, [])
+        self.assertEqual(client.parameters, {})
+
+    def test_retry_failed_chunk(self):
+        starttime = self.chunk_start.strftime(constants.DATETIME_FORMAT)
+        client = FakeMC3Client(fail_starttimes=[starttime])
+        fetcher = WebObsMC3Fetcher(client=client, max_workers=3, retry_delay=0)
+
+        events = fetcher.fetch_mc3_as_dict(self.start, self.end)
+
+        self.assertEqual(len(events), 4)
+        self.assertEqual(len(client.requests), 4)
+        self.assertEqual(client.requests.count(starttime), 2)
+        self.assertEqual(fetcher.failed_ranges, [])
+
+    def test_partial_failure(self):
+        starttime = self.start.strftime(constants.DATETIME_FORMAT)
+        client = FakeMC3Client(fail_starttimes=[starttime], fail_count=5)
+        fetcher = WebObsMC3Fetcher(
+            client=client, max_retries=2, max_workers=3, retry_delay=0
+        )
+
+        events = fetcher.fetch_mc3_as_dict(self.start, self.end)
+
+        # Events of the other chunks are still returned.
+        self.assertEqual(len(events), 4)
+        self.assertEqual(len(client.requests), 2 + 2)
+        self.assertEqual(fetcher.failed_ranges, [(self.start, self.chunk_start)])
+
+        fetcher.max_workers = 1
+        self.assertEqual(
+            fetcher.fetch_mc3_as_dict(self.start, self.end, strict=True), {}
+        )
+        self.assertEqual(fetcher.failed_ranges, [(self.start, self.chunk_start)])
+
+    def test_failed_windows(self):
+        starttime = self.start.strftime(constants.DATETIME_FORMAT)
+        client = FakeMC3Client(fail_starttimes=[starttime], fail_count=5)
+        fetcher = WebObsMC3Fetcher(client=client, max_retries=2, retry_delay=0)
+
+        # Fetch window by window like reverse sync, only the first one fails.
+        self.assertEqual(
+            fetcher.fetch_mc3_as_dict(self.start, self.chunk_start, strict=True), {}
+        )
+        events = fetcher.fetch_mc3_as_dict(self.chunk_start, self.end, strict=True)
+
+        self.assertEqual(len(events), 4)
+        self.assertEqual(fetcher.failed_ranges, [])
+        self.assertEqual(fetcher.all_failed_ranges, [(self.start, self.chunk_start)])
+
+
+class MC3CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = MC3Cache(path=os.path.join(self.root, "mc3.sqlite3"), ttl=60)
+        self.client = FakeMC3Client()
+        self.fetcher = WebObsMC3Fetcher(
+            client=self.client, retry_delay=0, cache=self.cache
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_get_mc3_from_cache(self):
+        eventdate = parse("2021-07-08T00:02:00.240000+00:00")
+        event = self.fetcher.get_mc3(eventdate, eventid="2021-07#2380")
+        self.assertEqual(event["eventid"], "2021-07#2380")
+        self.assertEqual(len(self.client.requests), 1)
+
+        # Other events of the same response are served from the cache.
+        event = self.fetcher.get_mc3(
+            parse("2021-07-08T00:10:11.880000+00:00"), sc3id="://bpptkg2021nhcvwk"
+        )
+        self.assertEqual(event["eventid"], "2021-07#2382")
+        event = self.fetcher.get_mc3(parse("2021-07-08T00:04:19.000+00:00"))
+        self.assertEqual(event["eventid"], "2021-07#2381")
+        self.assertEqual(event["eventdate"], parse("2021-07-08T00:04:19+00:00"))
+        self.assertEqual(len(self.client.requests), 1)
+
+        # Events fetched before not_before are not used.
+        event = self.fetcher.get_mc3(
+            eventdate,
+            eventid="2021-07#2380",
+            not_before=datetime.datetime.now(pytz.utc) + datetime.timedelta(1),
+        )
+        self.assertEqual(event["eventid"], "2021-07#2380")
+        self.assertEqual(len(self.client.requests), 2)
+
+    def test_cache_fed_by_fetch(self):
+        start = datetime.datetime(2021, 7, 8, tzinfo=pytz.utc)
+        self.fetcher.fetch_mc3_as_dict(start, start + datetime.timedelta(hours=1))
+
+        event = self.cache.get(eventid="2021-07#2392", eventtype="ROCKFALL")
+        self.assertEqual(event["eventid"], "2021-07#2392")
+        self.assertIsNone(self.cache.get(eventid="2021-07#2392", eventtype="VTA"))
+        self.assertIsNone(self.cache.get(sc3id="://unknown", eventid="2021-07#2392"))
+
+    def test_cache_payload(self):
+        events = self.fetcher.fetch_mc3_as_dict(
+            datetime.datetime(2021, 7, 8, tzinfo=pytz.utc),
+            datetime.datetime(2021, 7, 8, 1, tzinfo=pytz.utc),
+        )
+
+        event = self.cache.get(eventid="2021-07#2380")
+        for key, value in events[0].items():
+            if pd.isna(value):
+                self.assertTrue(pd.isna(event[key]))
+            else:
+                self.assertEqual(event[key], value)
+        self.assertIsInstance(event["eventdate"], pd.Timestamp)
+
+        conn = sqlite3.connect(self.cache.path)
+        try:
+            (data,) = conn.execute(
+                "SELECT data FROM events WHERE eventid = ?", ("2021-07#2380",)
+            ).fetchone()
+        finally:
+            conn.close()
+        self.assertTrue(data.startswith("{"))
+
+    def test_cache_expired(self):
+        events = self.fetcher.fetch_mc3_as_dict(
+            datetime.datetime(2021, 7, 8, tzinfo=pytz.utc),
+            datetime.datetime(2021, 7, 8, 1, tzinfo=pytz.utc),
+        )
+        self.assertIsNotNone(self.cache.get(eventid="2021-07#2380"))
+
+        self.cache.put(events[:1], fetched_at=time.time() - 120)
+        self.assertIsNotNone(self.cache.get(eventid="2021-07#2380"))
+
+        self.cache.ttl = 0
+        self.assertIsNone(self.cache.get(eventid="2021-07#2380"))
+
+
+class MC3StreamParserTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(DATA_DIR, "MC3_dump_bulletin.csv"), "rb") as fd:
+            self.content = fd.read()
+
+    def test_parse(self):
+        expected = MC3Parser().to_df(self.content)
+
+        df = MC3StreamParser(chunksize=1000).parse(self.content)
+
+        self.assertEqual(list(df.columns), list(expected.columns))
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+    def test_parse_time_range(self):
+        start = datetime.datetime(2021, 7, 8, tzinfo=pytz.utc)
+        end = datetime.datetime(2021, 7, 8, 12, tzinfo=pytz.utc)
+        expected = MC3Parser().to_df(self.content)
+        expected = expected.loc[
+            (expected["eventdate"] >= start) & (expected["eventdate"] < end)
+        ].reset_index(drop=True)
+
+        df = MC3StreamParser(chunksize=100).parse(self.content, start=start, end=end)
+
+        self.assertTrue(len(df) > 0)
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+    def test_comment_filter(self):
+        reader = _CommentFilter(io.BytesIO(self.content), blocksize=7)
+        lines = [
+            line
+            for line in self.content.decode("utf-8").splitlines(keepends=True)
+            if not line.startswith("#")
+        ]
+
+        self.assertEqual(reader.read(10) + reader.read(), "".join(lines))
+
+    def test_parse_empty(self):
+        df = MC3StreamParser().parse(self.content.splitlines(keepends=True)[0])
+        self.assertTrue(df.empty)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,96 @@
+import datetime
+import os
+import unittest
+from unittest.mock import MagicMock
+
+from webobsclient.parser import MC3Parser
+
+from wo.fingerprint import (
+    get_db_event_fingerprint,
+    get_event_fingerprint,
+    get_stored_magnitudes,
+    is_waveform_unchanged,
+)
+from wo.visitor import _update_unchanged_events
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
+)
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(DATA_DIR, "MC3_dump_bulletin1.csv"), "rb") as fd:
+            content = fd.read()
+
+        parser = MC3Parser()
+        self.event_wo = parser.to_dict(content)[0]
+
+        # Event as stored in the database. Event date is in local time zone and
+        # duration is stored as single precision float.
+        self.event_db = {
+            "eventid": self.event_wo["eventid"],
+            "eventdate": datetime.datetime(2021, 7, 8, 7, 2, 0),
+            "eventdate_microsecond": 24,
+            "duration": 45.400001525878906,
+            "eventtype": "MP",
+            "ml_deles": 1.2,
+            "count_deles": 100.0,
+        }
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            get_event_fingerprint(self.event_wo),
+            get_db_event_fingerprint(self.event_db),
+        )
+        self.assertTrue(is_waveform_unchanged(self.event_wo, self.event_db))
+
+    def test_fingerprint_changed(self):
+        self.event_db["duration"] = 30.0
+        self.assertFalse(is_waveform_unchanged(self.event_wo, self.event_db))
+
+        self.event_db["duration"] = 45.4
+        self.event_db["eventdate"] = datetime.datetime(2021, 7, 8, 7, 2, 1)
+        self.assertFalse(is_waveform_unchanged(self.event_wo, self.event_db))
+
+        self.assertFalse(is_waveform_unchanged(self.event_wo, None))
+
+    def test_fingerprint_without_magnitudes(self):
+        self.event_db["ml_deles"] = None
+        self.event_db["count_deles"] = None
+        self.assertFalse(is_waveform_unchanged(self.event_wo, self.event_db))
+
+    def test_get_stored_magnitudes(self):
+        magnitudes = get_stored_magnitudes(self.event_db)
+
+        self.assertEqual(len(magnitudes), 8)
+        self.assertEqual(magnitudes["ml_deles"], 1.2)
+        self.assertEqual(magnitudes["count_deles"], 100.0)
+        self.assertIsNone(magnitudes["ml_labuhan"])
+
+    def test_update_unchanged_events(self):
+        upserter = MagicMock()
+        callback = MagicMock()
+        event_new = dict(self.event_wo, eventid="2021-07#9999")
+
+        events = list(
+            _update_unchanged_events(
+                None,
+                [(self.event_wo, self.event_db), (event_new, None)],
+                upserter=upserter,
+                callback=callback,
+            )
+        )
+
+        self.assertEqual(events, [event_new])
+        upserter.add.assert_called_once()
+        event = upserter.add.call_args[0][0]
+        self.assertEqual(event["eventid"], self.event_wo["eventid"])
+        self.assertEqual(event["eventtype"], self.event_wo["eventtype"])
+        self.assertEqual(event["ml_deles"], 1.2)
+        callback.assert_called_once_with(event)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import datetime
+import json
+import pickle
+import unittest
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from wo import payload
+
+
+class PayloadTest(unittest.TestCase):
+
+    def test_update_event_body(self):
+        eventdate = datetime.datetime(2021, 7, 8, 3, 34, 56, 560000, tzinfo=pytz.utc)
+        requested_at = datetime.datetime(2021, 7, 8, 3, 40, 1, 123456, tzinfo=pytz.utc)
+        body = (
+            [eventdate],
+            {
+                "eventid": "2021-07#2380",
+                "sc3id": None,
+                "operator": "bpptkg",
+                "eventtype": "VTA",
+                "requested_at": requested_at,
+            },
+            {"callbacks": None, "errbacks": None, "chain": None, "chord": None},
+        )
+
+        data = payload.dumps(body)
+        args, kwargs, embed = payload.loads(data.encode("utf-8"))
+
+        self.assertIn('{"$dt":1625715296560000}', data)
+        self.assertEqual(args, [eventdate])
+        self.assertEqual(args[0].tzinfo, pytz.utc)
+        self.assertEqual(kwargs["requested_at"], requested_at)
+        self.assertEqual(kwargs["eventid"], "2021-07#2380")
+        self.assertIsNone(kwargs["sc3id"])
+        self.assertLess(len(data), len(pickle.dumps(body)))
+
+    def test_update_event_fields(self):
+        eventdate = datetime.datetime(2021, 7, 8, 3, 34, 56, 560000, tzinfo=pytz.utc)
+        body = (
+            [payload.to_epoch_us(eventdate)],
+            {
+                "eventid": "2021-07#2380",
+                "sc3id": None,
+                "operator": "bpptkg",
+                "eventtype": "VTA",
+                "requested_at": 1625715601123456,
+            },
+            {"callbacks": None, "errbacks": None, "chain": None, "chord": None},
+        )
+
+        data = payload.dumps(body)
+        args, kwargs, embed = payload.loads(data)
+
+        self.assertEqual(data, json.dumps(body, separators=(",", ":")))
+        self.assertEqual(args, [1625715296560000])
+        requested_at = payload.from_epoch_us(kwargs["requested_at"])
+        self.assertEqual(payload.from_epoch_us(args[0]), eventdate)
+        self.assertEqual(
+            requested_at,
+            datetime.datetime(2021, 7, 8, 3, 40, 1, 123456, tzinfo=pytz.utc),
+        )
+
+        tagged = payload.dumps(
+            ([eventdate], dict(kwargs, requested_at=requested_at), embed)
+        )
+        self.assertLess(len(data), len(tagged))
+
+    def test_epoch_us(self):
+        value = datetime.datetime(1969, 12, 31, 23, 59, 59, 999999)
+
+        self.assertEqual(payload.to_epoch_us(value), -1)
+        self.assertEqual(payload.from_epoch_us(-1), pytz.utc.localize(value))
+        self.assertEqual(
+            payload.to_epoch_us(pytz.timezone("Asia/Jakarta").localize(value)),
+            -7 * 3600 * 1000000 - 1,
+        )
+        aware = pytz.utc.localize(value)
+        self.assertIs(payload.from_epoch_us(aware), aware)
+
+    def test_naive_datetime_and_date(self):
+        value = datetime.datetime(1969, 12, 31, 23, 59, 59, 999999)
+
+        self.assertEqual(payload.loads(payload.dumps(value)), value)
+        self.assertEqual(
+            payload.loads(payload.dumps(datetime.date(2021, 7, 8))),
+            datetime.date(2021, 7, 8),
+        )
+
+    def test_mc3_event(self):
+        event = {
+            "eventdate": pd.Timestamp("2021-07-08 03:34:56.56", tz="UTC"),
+            "timestamp": pd.NaT,
+            "eventdate_local": pd.Timestamp("2021-07-08 10:34:56.56"),
+            "number": np.int64(3),
+            "duration": np.float64("nan"),
+            "amplitude": np.float64(12.5),
+            "valid": np.bool_(True),
+        }
+
+        result = payload.loads(payload.dumps(event))
+
+        self.assertEqual(result["eventdate"], event["eventdate"])
+        self.assertIsInstance(result["eventdate"], pd.Timestamp)
+        self.assertIs(result["timestamp"], pd.NaT)
+        self.assertEqual(result["eventdate_local"], event["eventdate_local"])
+        self.assertIsNone(result["eventdate_local"].tzinfo)
+        self.assertEqual(result["number"], 3)
+        self.assertTrue(np.isnan(result["duration"]))
+        self.assertEqual(result["amplitude"], 12.5)
+        self.assertIs(result["valid"], True)
+
+    def test_plain_objects(self):
+        value = {"$dt": "not a timestamp", "other": 1}
+
+        self.assertEqual(payload.loads(json.dumps(value)), value)
+        with self.assertRaises(TypeError):
+            payload.dumps(object())
+
+
+if __name__ == "__main__":
+    unittest.main()
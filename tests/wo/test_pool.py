@@ -0,0 +1,96 @@
+import time
+import unittest
+
+from wo.clients.pool import ClientPool
+
+
+class DummyClient(object):
+
+    def __init__(self):
+        self.closed = False
+
+
+def close_client(client):
+    client.closed = True
+
+
+class ClientPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.key = ("127.0.0.1", 18001, "arclink")
+
+    def test_reuse_client(self):
+        pool = ClientPool(max_size=2)
+
+        with pool.connection(self.key, DummyClient, close=close_client) as c1:
+            pass
+        with pool.connection(self.key, DummyClient, close=close_client) as c2:
+            pass
+
+        self.assertIs(c1, c2)
+        self.assertFalse(c1.closed)
+        self.assertEqual(pool.size(self.key), 1)
+
+    def test_separate_keys(self):
+        pool = ClientPool()
+
+        with pool.connection(self.key, DummyClient) as c1:
+            pass
+        with pool.connection(("127.0.0.1", 18000, "seedlink"), DummyClient) as c2:
+            pass
+
+        self.assertIsNot(c1, c2)
+        self.assertEqual(pool.size(), 2)
+
+    def test_discard_on_error(self):
+        pool = ClientPool()
+
+        with self.assertRaises(ValueError):
+            with pool.connection(self.key, DummyClient, close=close_client) as c1:
+                raise ValueError("Connection reset.")
+
+        self.assertTrue(c1.closed)
+        self.assertEqual(pool.size(self.key), 0)
+
+    def test_health_check(self):
+        pool = ClientPool()
+
+        with pool.connection(self.key, DummyClient, close=close_client) as c1:
+            pass
+        with pool.connection(
+            self.key,
+            DummyClient,
+            health_check=lambda client: False,
+            close=close_client,
+        ) as c2:
+            pass
+
+        self.assertIsNot(c1, c2)
+        self.assertTrue(c1.closed)
+
+    def test_recycle_idle_client(self):
+        pool = ClientPool(max_idle_time=0.1)
+
+        with pool.connection(self.key, DummyClient, close=close_client) as c1:
+            pass
+        time.sleep(0.2)
+        with pool.connection(self.key, DummyClient, close=close_client) as c2:
+            pass
+
+        self.assertIsNot(c1, c2)
+        self.assertTrue(c1.closed)
+
+    def test_max_size(self):
+        pool = ClientPool(max_size=1)
+
+        with pool.connection(self.key, DummyClient, close=close_client) as c1:
+            with pool.connection(self.key, DummyClient, close=close_client) as c2:
+                pass
+
+        self.assertEqual(pool.size(self.key), 1)
+        self.assertTrue(c1.closed)
+        self.assertFalse(c2.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import datetime
+import unittest
+
+import pytz
+
+from wo.shards import get_shard_lockfile, run_shards, split_time_range
+
+
+def shard_duration(start, end, scale):
+    if scale == 0:
+        raise ValueError("Invalid scale.")
+    return (end - start).total_seconds() * scale
+
+
+class SplitTimeRangeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tz = pytz.timezone("Asia/Jakarta")
+
+    def test_split_by_day(self):
+        start = self.tz.localize(datetime.datetime(2021, 7, 1, 12))
+        end = self.tz.localize(datetime.datetime(2021, 7, 4))
+
+        shards = split_time_range(start, end, "day")
+
+        self.assertEqual(
+            shards,
+            [
+                (start, self.tz.localize(datetime.datetime(2021, 7, 2))),
+                (
+                    self.tz.localize(datetime.datetime(2021, 7, 2)),
+                    self.tz.localize(datetime.datetime(2021, 7, 3)),
+                ),
+                (self.tz.localize(datetime.datetime(2021, 7, 3)), end),
+            ],
+        )
+        for shard_start, shard_end in shards:
+            self.assertEqual(shard_start.utcoffset(), datetime.timedelta(hours=7))
+            self.assertEqual(shard_end.utcoffset(), datetime.timedelta(hours=7))
+
+    def test_split_by_week(self):
+        # 2021-07-01 is Thursday.
+        start = self.tz.localize(datetime.datetime(2021, 7, 1))
+        end = self.tz.localize(datetime.datetime(2021, 7, 15))
+
+        shards = split_time_range(start, end, "week")
+
+        self.assertEqual([shard[0].day for shard in shards], [1, 5, 12])
+        self.assertEqual(shards[-1][1], end)
+
+    def test_split_by_month(self):
+        start = self.tz.localize(datetime.datetime(2021, 11, 15))
+        end = self.tz.localize(datetime.datetime(2022, 2, 1))
+
+        shards = split_time_range(start, end, "month")
+
+        self.assertEqual(
+            [(shard[0].month, shard[1].month) for shard in shards],
+            [(11, 12), (12, 1), (1, 2)],
+        )
+
+    def test_split_invalid(self):
+        start = self.tz.localize(datetime.datetime(2021, 7, 1))
+        with self.assertRaises(ValueError):
+            split_time_range(start, start + datetime.timedelta(days=1), "year")
+
+    def test_shard_lockfile(self):
+        start = self.tz.localize(datetime.datetime(2021, 7, 1))
+        end = self.tz.localize(datetime.datetime(2021, 7, 2))
+
+        self.assertNotEqual(
+            get_shard_lockfile(start, end, root="/tmp"),
+            get_shard_lockfile(end, end + datetime.timedelta(days=1), root="/tmp"),
+        )
+
+
+class RunShardsTest(unittest.TestCase):
+
+    def setUp(self):
+        start = datetime.datetime(2021, 7, 1, tzinfo=pytz.utc)
+        end = datetime.datetime(2021, 7, 4, tzinfo=pytz.utc)
+        self.shards = split_time_range(start, end, "day")
+
+    def test_run_shards(self):
+        results = run_shards(shard_duration, self.shards, 1, max_workers=1)
+
+        self.assertEqual([shard for shard, __ in results], self.shards)
+        self.assertEqual([result for __, result in results], [86400.0] * 3)
+
+    def test_run_shards_concurrent(self):
+        results = run_shards(shard_duration, self.shards, 2, max_workers=2)
+
+        self.assertEqual([shard for shard, __ in results], self.shards)
+        self.assertEqual([result for __, result in results], [172800.0] * 3)
+
+    def test_run_shards_error(self):
+        results = run_shards(shard_duration, self.shards, 0, max_workers=2)
+
+        self.assertEqual([result for __, result in results], [None] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,283 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytz
+
+from wo.visitor import incremental_sync
+from wo.watermark import RECONCILED_AT, SYNCED_UNTIL, TIMESTAMP, SyncWatermark
+
+
+def make_event(eventid, eventdate, timestamp):
+    return {
+        "eventid": eventid,
+        "eventdate": pd.Timestamp(eventdate, tz="UTC"),
+        "timestamp": pd.Timestamp(timestamp, tz="UTC"),
+        "eventtype": "VTA",
+    }
+
+
+class SyncWatermarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.watermark = SyncWatermark(
+            path=os.path.join(self.root, "run", "watermark.json"),
+            lookback=60,
+            reconcile_interval=24,
+        )
+        self.now = datetime.datetime(2021, 7, 8, 12, tzinfo=pytz.utc)
+        self.events = [
+            make_event("event1", "2021-07-08 10:00:00", "2021-07-08 10:05:00"),
+            make_event("event2", "2021-07-08 11:00:00", "2021-07-08 11:30:00"),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_load_empty(self):
+        self.assertEqual(self.watermark.load(), {})
+        self.assertTrue(self.watermark.is_reconcile_due(self.now))
+
+    def test_update(self):
+        state = self.watermark.update(self.events, {}, self.now, reconciled_at=self.now)
+
+        self.assertEqual(self.watermark.load(), state)
+        self.assertEqual(state[SYNCED_UNTIL], self.now)
+        self.assertEqual(
+            state[TIMESTAMP], datetime.datetime(2021, 7, 8, 11, 30, tzinfo=pytz.utc)
+        )
+        self.assertEqual(state[RECONCILED_AT], self.now)
+
+        self.assertFalse(
+            self.watermark.is_reconcile_due(self.now + datetime.timedelta(hours=1))
+        )
+        self.assertTrue(
+            self.watermark.is_reconcile_due(self.now + datetime.timedelta(hours=24))
+        )
+        self.assertEqual(
+            self.watermark.get_start(state), self.now - datetime.timedelta(hours=1)
+        )
+
+    def test_filter_delta(self):
+        state = {TIMESTAMP: datetime.datetime(2021, 7, 8, 11, tzinfo=pytz.utc)}
+        events = self.events + [
+            {
+                "eventid": "event3",
+                "eventdate": pd.Timestamp("2021-07-08 11:40:00", tz="UTC"),
+                "timestamp": pd.NaT,
+            }
+        ]
+
+        delta = self.watermark.filter_delta(events, state)
+
+        self.assertEqual([event["eventid"] for event in delta], ["event2", "event3"])
+        self.assertEqual(self.watermark.filter_delta(events, {}), events)
+
+    def test_filter_delta_same_second(self):
+        state = {TIMESTAMP: datetime.datetime(2021, 7, 8, 11, 30, tzinfo=pytz.utc)}
+
+        delta = self.watermark.filter_delta(self.events, state)
+
+        self.assertEqual([event["eventid"] for event in delta], ["event2"])
+
+    def test_advance_failed(self):
+        state = self.watermark.advance(self.events, {}, self.now, failed=["event1"])
+
+        # Watermark is held back before the failed event.
+        self.assertEqual(state[SYNCED_UNTIL], self.events[0]["eventdate"])
+        self.assertEqual(state[TIMESTAMP], self.events[0]["timestamp"])
+        self.assertEqual(
+            [
+                event["eventid"]
+                for event in self.watermark.filter_delta(self.events, state)
+            ],
+            ["event1", "event2"],
+        )
+
+    def test_for_eventtype(self):
+        path = os.path.join(self.root, "watermark.json")
+
+        self.assertEqual(SyncWatermark.for_eventtype("ALL", path=path).path, path)
+        self.assertEqual(
+            SyncWatermark.for_eventtype("VTA", path=path).path,
+            os.path.join(self.root, "watermark.VTA.json"),
+        )
+
+
+class IncrementalSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.watermark = SyncWatermark(
+            path=os.path.join(self.root, "watermark.json"),
+            lookback=60,
+            reconcile_interval=24,
+        )
+        self.now = datetime.datetime(2021, 7, 8, 12, tzinfo=pytz.utc)
+        self.start = datetime.datetime(2021, 7, 7, tzinfo=pytz.utc)
+        self.events = [
+            make_event("event1", "2021-07-08 10:00:00", "2021-07-08 10:05:00"),
+            make_event("event2", "2021-07-08 11:00:00", "2021-07-08 11:30:00"),
+        ]
+        self.fetcher = MagicMock()
+        self.fetcher.fetch_mc3_as_dict.return_value = self.events
+        self.fetcher.failed_ranges = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    @patch("wo.visitor.sync_bulletin_and_webobs")
+    @patch("wo.visitor.sync_webobs_and_bulletin", return_value=[])
+    def test_incremental_sync(self, mock_forward_sync, mock_reverse_sync):
+        reconcile = incremental_sync(
+            None,
+            None,
+            self.fetcher,
+            self.start,
+            self.now,
+            watermark=self.watermark,
+        )
+
+        # First run is always wide reconciliation pass.
+        self.assertTrue(reconcile)
+        self.fetcher.fetch_mc3_as_dict.assert_called_with(
+            self.start, self.now, eventtype="ALL"
+        )
+        mock_forward_sync.assert_called_once_with(
+            None, None, self.events, dry_run=False
+        )
+
+        new_event = make_event("event3", "2021-07-08 12:10:00", "2021-07-08 12:20:00")
+        self.fetcher.fetch_mc3_as_dict.return_value = self.events + [new_event]
+        mock_forward_sync.reset_mock()
+
+        end = self.now + datetime.timedelta(hours=1)
+        reconcile = incremental_sync(
+            None,
+            None,
+            self.fetcher,
+            self.start,
+            end,
+            watermark=self.watermark,
+        )
+
+        self.assertFalse(reconcile)
+        self.fetcher.fetch_mc3_as_dict.assert_called_with(
+            self.now - datetime.timedelta(hours=1), end, eventtype="ALL"
+        )
+        # event2 was modified in the same second as the watermark timestamp,
+        # so it is synchronized again.
+        mock_forward_sync.assert_called_once_with(
+            None, None, [self.events[1], new_event], dry_run=False
+        )
+        self.assertEqual(mock_reverse_sync.call_count, 2)
+        self.assertEqual(self.watermark.load()[SYNCED_UNTIL], end)
+
+    @patch("wo.visitor.sync_bulletin_and_webobs")
+    @patch("wo.visitor.sync_webobs_and_bulletin", return_value=[])
+    def test_incremental_sync_empty(self, mock_forward_sync, mock_reverse_sync):
+        self.fetcher.fetch_mc3_as_dict.return_value = {}
+
+        incremental_sync(
+            None,
+            None,
+            self.fetcher,
+            self.start,
+            self.now,
+            watermark=self.watermark,
+        )
+
+        mock_forward_sync.assert_not_called()
+        mock_reverse_sync.assert_not_called()
+        self.assertEqual(self.watermark.load(), {})
+
+    @patch("wo.visitor.sync_bulletin_and_webobs")
+    @patch("wo.visitor.sync_webobs_and_bulletin", return_value=[])
+    def test_incremental_sync_partial(self, mock_forward_sync, mock_reverse_sync):
+        self.fetcher.failed_ranges = [(self.start, self.start + datetime.timedelta(1))]
+
+        incremental_sync(
+            None,
+            None,
+            self.fetcher,
+            self.start,
+            self.now,
+            watermark=self.watermark,
+        )
+
+        mock_forward_sync.assert_called_once_with(
+            None, None, self.events, dry_run=False
+        )
+        mock_reverse_sync.assert_not_called()
+        self.assertEqual(self.watermark.load(), {})
+
+    @patch("wo.visitor.sync_bulletin_and_webobs")
+    @patch("wo.visitor.sync_webobs_and_bulletin", return_value=["event2"])
+    def test_incremental_sync_failed(self, mock_forward_sync, mock_reverse_sync):
+        incremental_sync(
+            None,
+            None,
+            self.fetcher,
+            self.start,
+            self.now,
+            watermark=self.watermark,
+        )
+
+        state = self.watermark.load()
+        self.assertEqual(state[SYNCED_UNTIL], self.events[1]["eventdate"])
+        self.assertIn(self.events[1], self.watermark.filter_delta(self.events, state))
+
+    @patch("wo.visitor.sync_bulletin_and_webobs")
+    @patch("wo.visitor.diff_webobs_and_bulletin")
+    def test_incremental_sync_dispatch(self, mock_diff, mock_reverse_sync):
+        mock_diff.return_value = (self.events[1:], [])
+        dispatch = MagicMock()
+
+        incremental_sync(
+            None,
+            None,
+            self.fetcher,
+            self.start,
+            self.now,
+            watermark=self.watermark,
+            dispatch=dispatch,
+        )
+
+        mock_diff.assert_called_once_with(None, None, self.events, dry_run=False)
+        mock_reverse_sync.assert_called_once()
+        pending, state = dispatch.call_args[0]
+        self.assertEqual(pending, self.events[1:])
+        self.assertEqual(state[SYNCED_UNTIL], self.now)
+        self.assertEqual(state[RECONCILED_AT], self.now)
+
+        # Watermark is saved by dispatch after pending events are processed.
+        self.assertEqual(self.watermark.load(), {})
+
+    @patch("wo.visitor.sync_bulletin_and_webobs")
+    @patch("wo.visitor.diff_webobs_and_bulletin")
+    def test_incremental_sync_dispatch_partial(self, mock_diff, mock_reverse_sync):
+        self.fetcher.failed_ranges = [(self.start, self.start + datetime.timedelta(1))]
+        mock_diff.return_value = (self.events, [])
+        dispatch = MagicMock()
+
+        incremental_sync(
+            None,
+            None,
+            self.fetcher,
+            self.start,
+            self.now,
+            watermark=self.watermark,
+            dispatch=dispatch,
+        )
+
+        dispatch.assert_called_once_with(self.events, None)
+        mock_reverse_sync.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
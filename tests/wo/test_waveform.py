@@ -0,0 +1,134 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from obspy import UTCDateTime, read
+
+from wo.clients.waveform import coalesce_windows, fetch_stations, get_waveforms_batch
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
+)
+
+STATIONS = [
+    {"network": "VG", "station": "MEDEL", "location": "00", "channel": "*H*"},
+    {"network": "VG", "station": "MELAB", "location": "00", "channel": "*H*"},
+    {"network": "VG", "station": "MEPAS", "location": "00", "channel": "*H*"},
+    {"network": "VG", "station": "MEPUS", "location": "00", "channel": "*H*"},
+]
+
+
+class FetchStationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = read(os.path.join(DATA_DIR, "stream.msd"))
+        self.starttime = UTCDateTime("2021-07-08T00:02:00")
+        self.endtime = self.starttime + 30
+
+    def test_fetch_stations_order(self):
+        delays = {"MEDEL": 0.3, "MELAB": 0.2, "MEPAS": 0.1, "MEPUS": 0.0}
+
+        def fetch(network, station, location, channel, starttime, endtime):
+            time.sleep(delays[station])
+            return self.stream.select(station=station)
+
+        streams = fetch_stations(fetch, STATIONS, self.starttime, self.endtime)
+
+        self.assertEqual(len(streams), len(STATIONS))
+        for sta, st in zip(STATIONS, streams):
+            for tr in st:
+                self.assertEqual(tr.stats.station, sta["station"])
+
+    def test_fetch_stations_deadline(self):
+        def fetch(network, station, location, channel, starttime, endtime):
+            if station == "MEPAS":
+                time.sleep(2)
+            return self.stream.select(station=station)
+
+        streams = fetch_stations(
+            fetch, STATIONS, self.starttime, self.endtime, timeout=0.5
+        )
+
+        self.assertIsNotNone(streams[0])
+        self.assertIsNotNone(streams[1])
+        self.assertIsNone(streams[2])
+        self.assertIsNotNone(streams[3])
+
+    def test_fetch_stations_deadline_queued(self):
+        def fetch(network, station, location, channel, starttime, endtime):
+            time.sleep(0.3)
+            return self.stream.select(station=station)
+
+        # With a single worker, the last station starts after 0.9 s. Deadline
+        # is counted from the start of each request, not from submission.
+        streams = fetch_stations(
+            fetch, STATIONS, self.starttime, self.endtime, max_workers=1, timeout=0.5
+        )
+
+        for st in streams:
+            self.assertIsNotNone(st)
+
+    def test_fetch_stations_error(self):
+        def fetch(network, station, location, channel, starttime, endtime):
+            if station == "MELAB":
+                raise ConnectionError("Connection refused.")
+            return self.stream.select(station=station)
+
+        streams = fetch_stations(fetch, STATIONS, self.starttime, self.endtime)
+
+        self.assertIsNone(streams[1])
+        self.assertEqual(len([st for st in streams if st is not None]), 3)
+
+
+class BatchWaveformTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = read(os.path.join(DATA_DIR, "stream.msd"))
+        self.t0 = self.stream[0].stats.starttime
+
+    def test_coalesce_windows(self):
+        t = self.t0
+        windows = [
+            (t + 100, t + 130),
+            (t, t + 30),
+            (t + 20, t + 50),
+            (t + 1000, t + 1030),
+        ]
+
+        spans = coalesce_windows(windows, max_gap=60)
+
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0], (t, t + 130, [1, 2, 0]))
+        self.assertEqual(spans[1], (t + 1000, t + 1030, [3]))
+
+    def test_coalesce_windows_max_span(self):
+        t = self.t0
+        windows = [(t + i * 60, t + i * 60 + 30) for i in range(10)]
+
+        spans = coalesce_windows(windows, max_gap=60, max_span=300)
+
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0][2], [0, 1, 2, 3, 4])
+        self.assertEqual(spans[1][2], [5, 6, 7, 8, 9])
+        for start, end, __ in spans:
+            self.assertLessEqual(end - start, 300)
+
+    @patch("wo.clients.waveform.get_waveforms")
+    def test_get_waveforms_batch(self, mock_get_waveforms):
+        mock_get_waveforms.return_value = self.stream
+        t = self.t0
+        windows = [(t + 1, t + 5), (t + 3, t + 8), (t + 600, t + 630)]
+
+        streams = get_waveforms_batch(windows, max_gap=600, max_span=3600)
+
+        mock_get_waveforms.assert_called_once_with(t + 1, t + 630)
+        self.assertEqual(len(streams), 3)
+        self.assertEqual(streams[0][0].stats.starttime, t + 1)
+        self.assertEqual(streams[0][0].stats.endtime, t + 5)
+        self.assertEqual(streams[1][0].stats.starttime, t + 3)
+        self.assertIsNone(streams[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from .settings import CHECKPOINT_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def _format_time(d):
+    return d.strftime("%Y%m%dT%H%M%S")
+
+
+class Checkpoint(object):
+    """
+    Backfill checkpoint stored in a directory under CHECKPOINT_DIR.
+
+    The checkpoint records completed time shards and event IDs that have been
+    processed in each shard, so that an interrupted backfill can be resumed
+    without recomputing completed work. Each shard uses its own files, so
+    shards running concurrently in different processes do not write to the
+    same file.
+    """
+
+    def __init__(self, key, root=CHECKPOINT_DIR):
+        self.key = key
+        self.path = os.path.join(root, key)
+
+    @classmethod
+    def from_params(cls, root=CHECKPOINT_DIR, **params):
+        """
+        Create checkpoint keyed by run parameters, e.g. time range, event type,
+        and sync mode.
+        """
+        content = json.dumps(params, sort_keys=True, default=str)
+        key = hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+        return cls(key, root=root)
+
+    def _get_shard_path(self, start, end, suffix):
+        return os.path.join(
+            self.path, "{}-{}{}".format(_format_time(start), _format_time(end), suffix)
+        )
+
+    def is_shard_done(self, start, end):
+        """
+        Check if shard start to end has been completed.
+        """
+        return os.path.isfile(self._get_shard_path(start, end, ".done"))
+
+    def mark_shard_done(self, start, end):
+        """
+        Mark shard start to end as completed.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._get_shard_path(start, end, ".done"), "w"):
+            pass
+
+    def get_processed_events(self, start, end):
+        """
+        Get set of event IDs that have been processed in shard start to end.
+        """
+        try:
+            with open(self._get_shard_path(start, end, ".events"), "r") as fd:
+                return set(line.strip() for line in fd if line.strip())
+        except FileNotFoundError:
+            return set()
+
+    def add_processed_events(self, start, end, eventids):
+        """
+        Record event IDs that have been processed in shard start to end.
+        """
+        if not eventids:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._get_shard_path(start, end, ".events"), "a") as fd:
+            for eventid in eventids:
+                fd.write("{}\n".format(eventid))
+            fd.flush()
+            os.fsync(fd.fileno())
+
+    def clear(self):
+        """
+        Remove all checkpoint records.
+        """
+        logger.debug("Clearing checkpoint %s", self.path)
+        shutil.rmtree(self.path, ignore_errors=True)
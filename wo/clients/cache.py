@@ -0,0 +1,467 @@
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+import pandas as pd
+from obspy import Stream, UTCDateTime, read
+
+from .. import payload
+from ..settings import (
+    MSD_DIR,
+    MSD_EXT,
+    WAVEFORM_CACHE_MAX_AGE,
+    WAVEFORM_CACHE_MAX_SIZE,
+    WAVEFORM_CACHE_MIN_AGE,
+    WEBOBS_MC3_CACHE_FILE,
+    WEBOBS_MC3_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+if sys.platform != "win32":
+    import fcntl
+
+# Number of seconds in a day.
+DAY = 86400
+
+
+def _merge_intervals(intervals):
+    """
+    Merge overlapping or adjacent time intervals.
+    """
+    results = []
+    for start, end in sorted(intervals):
+        if results and start <= results[-1][1]:
+            results[-1][1] = max(results[-1][1], end)
+        else:
+            results.append([start, end])
+    return results
+
+
+def _intersect_intervals(a, b):
+    """
+    Get intersection of two lists of sorted non-overlapping time intervals.
+    """
+    results = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            results.append([start, end])
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return results
+
+
+def _get_coverage(stream, start, end):
+    """
+    Get time intervals (timestamps) from start to end covered by waveform data
+    of every channel returned in stream.
+
+    Each channel only covers its contiguous trace segments, so gaps in the data
+    and time ranges where some of the channels have no data are not covered.
+    Each segment is extended by one sample, so adjacent segments are merged and
+    the window edges are covered although samples do not fall exactly on them.
+    """
+    segments = {}
+    for tr in stream:
+        delta = tr.stats.delta
+        segments.setdefault(tr.id, []).append(
+            [tr.stats.starttime.timestamp - delta, tr.stats.endtime.timestamp + delta]
+        )
+
+    coverage = [[start.timestamp, end.timestamp]]
+    for intervals in segments.values():
+        coverage = _intersect_intervals(coverage, _merge_intervals(intervals))
+    return coverage
+
+
+def _is_covered(intervals, start, end):
+    """
+    Check if time range start to end is fully covered by one of the intervals.
+    """
+    for a, b in intervals:
+        if a <= start and end <= b:
+            return True
+    return False
+
+
+class WaveformCache(object):
+    """
+    Local miniSEED waveform cache on disk.
+
+    Waveform data is stored in day-chunked miniSEED files keyed by network,
+    station, location, and channel (as requested to the server, e.g. *H*). Each
+    day file has a JSON sidecar file that lists time intervals already fetched
+    from the server, so overlapping windows can be served by slicing the cached
+    data.
+
+    Coverage is recorded from the contiguous trace segments actually returned
+    by the server, not the requested window, and only where every returned
+    channel has data, so partial responses and gaps are fetched again. Data
+    less than min_age seconds old is not cached, because the server may still
+    be receiving it.
+
+    Files are evicted if they have not been accessed for max_age days or if the
+    total cache size exceeds max_size MB, least recently used first.
+    """
+
+    def __init__(
+        self,
+        root=MSD_DIR,
+        ext=MSD_EXT,
+        max_size=WAVEFORM_CACHE_MAX_SIZE,
+        max_age=WAVEFORM_CACHE_MAX_AGE,
+        min_age=WAVEFORM_CACHE_MIN_AGE,
+        evict_interval=600,
+    ):
+        self.root = root
+        self.ext = ext
+        self.max_size = max_size
+        self.max_age = max_age
+        self.min_age = min_age
+        self.evict_interval = evict_interval
+        self._last_evicted = None
+        self._evict_lock = threading.Lock()
+
+    def get_path(self, network, station, location, channel, day):
+        """
+        Get day file path of the station. day is UTCDateTime at start of the
+        day.
+        """
+        seed_id = ".".join(
+            quote(item or "", safe="") for item in (network, station, location, channel)
+        )
+        filename = "{}.{:04d}.{:03d}{}".format(seed_id, day.year, day.julday, self.ext)
+        return os.path.join(
+            self.root, quote(network, safe=""), quote(station, safe=""), filename
+        )
+
+    def _days(self, starttime, endtime):
+        day = UTCDateTime(starttime.date)
+        while day < endtime:
+            yield day
+            day += DAY
+
+    def _read_coverage(self, path):
+        try:
+            with open(path + ".json", "r") as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return []
+
+    @contextlib.contextmanager
+    def _lock(self, path):
+        if sys.platform == "win32":
+            yield
+            return
+
+        with open(path + ".lock", "w") as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def get(self, network, station, location, channel, starttime, endtime):
+        """
+        Get waveform data from the cache. Return None if the time window is not
+        fully covered by the cache.
+        """
+        paths = []
+        for day in self._days(starttime, endtime):
+            path = self.get_path(network, station, location, channel, day)
+            coverage = self._read_coverage(path)
+            start = max(starttime, day).timestamp
+            end = min(endtime, day + DAY).timestamp
+            if not _is_covered(coverage, start, end) or not os.path.isfile(path):
+                return None
+            paths.append(path)
+
+        stream = Stream()
+        for path in paths:
+            try:
+                stream += read(
+                    path, format="MSEED", starttime=starttime, endtime=endtime
+                )
+            except Exception as e:
+                logger.error("Failed to read cached waveform %s: %s", path, e)
+                return None
+            # Update access time for eviction.
+            os.utime(path, None)
+
+        logger.debug(
+            "Waveform cache hit: %s.%s.%s.%s (%s to %s)",
+            network,
+            station,
+            location,
+            channel,
+            starttime,
+            endtime,
+        )
+        return stream
+
+    def put(self, network, station, location, channel, starttime, endtime, stream):
+        """
+        Store waveform data fetched from time window starttime to endtime in
+        the cache. Only the time ranges covered by the returned data of every
+        channel are marked as cached.
+        """
+        if not stream:
+            return
+
+        # Skip recent data that may still be arriving at the server.
+        endtime = min(endtime, UTCDateTime() - self.min_age)
+        if endtime <= starttime:
+            return
+
+        for day in self._days(starttime, endtime):
+            path = self.get_path(network, station, location, channel, day)
+            chunk = stream.slice(max(starttime, day), min(endtime, day + DAY))
+            if not chunk:
+                continue
+
+            coverage = _get_coverage(
+                chunk, max(starttime, day), min(endtime, day + DAY)
+            )
+            if not coverage:
+                continue
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                with self._lock(path):
+                    self._write(path, chunk, coverage)
+            except Exception as e:
+                logger.error("Failed to write cached waveform %s: %s", path, e)
+
+        self.maybe_evict()
+
+    def _write(self, path, chunk, intervals):
+        if os.path.isfile(path):
+            chunk = read(path, format="MSEED") + chunk
+
+        # Merge overlapping traces and split at the gaps between cached windows
+        # because miniSEED cannot store masked arrays.
+        chunk.merge(method=1)
+        chunk = chunk.split()
+
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        chunk.write(tmp_path, format="MSEED")
+        os.replace(tmp_path, path)
+
+        coverage = self._read_coverage(path) + intervals
+        tmp_path = "{}.json.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as fd:
+            json.dump(_merge_intervals(coverage), fd)
+        os.replace(tmp_path, path + ".json")
+
+    def maybe_evict(self):
+        """
+        Run eviction if it has not been run in the last evict_interval seconds.
+        """
+        now = time.monotonic()
+        with self._evict_lock:
+            if (
+                self._last_evicted is not None
+                and now - self._last_evicted < self.evict_interval
+            ):
+                return
+            self._last_evicted = now
+        self.evict()
+
+    def evict(self):
+        """
+        Remove day files that have not been accessed for max_age days, then
+        remove least recently used files until total cache size is below
+        max_size MB.
+        """
+        files = []
+        for dirpath, __, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith(self.ext):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        now = time.time()
+        total_size = sum(size for __, size, __ in files)
+        max_size = self.max_size * 1024 * 1024
+        max_age = self.max_age * DAY
+
+        for mtime, size, path in files:
+            if now - mtime <= max_age and total_size <= max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def _remove(self, path):
+        logger.debug("Evicting cached waveform %s", path)
+        for filepath in (path, path + ".json", path + ".lock"):
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(e)
+
+
+def _is_null(value):
+    return value is None or value != value
+
+
+def _to_microseconds(eventdate):
+    """
+    Convert time-aware event date to number of microseconds since epoch.
+    """
+    return pd.Timestamp(eventdate).value // 1000
+
+
+class MC3Cache(object):
+    """
+    Short-lived cache of WebObs MC3 events in a SQLite database.
+
+    Each event is stored as JSON payload (see wo.payload) with the time it was
+    fetched from WebObs and indexed by eventid, sc3id, and eventdate. Events
+    fetched more than ttl seconds ago are not served and are removed on the
+    next write. The database can be shared by multiple processes, e.g. Celery
+    workers.
+    """
+
+    def __init__(self, path=WEBOBS_MC3_CACHE_FILE, ttl=WEBOBS_MC3_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS events ("
+                    "eventid TEXT PRIMARY KEY, "
+                    "sc3id TEXT, "
+                    "eventdate INTEGER, "
+                    "eventtype TEXT, "
+                    "fetched_at REAL, "
+                    "data TEXT)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS events_sc3id ON events (sc3id)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS events_eventdate ON events (eventdate)"
+                )
+            self._initialized = True
+        return conn
+
+    def put(self, events, fetched_at=None):
+        """
+        Store list of WebObs MC3 events. fetched_at is UNIX timestamp of the
+        time the request was sent to WebObs. Newer events are not replaced by
+        older ones.
+        """
+        if fetched_at is None:
+            fetched_at = time.time()
+
+        rows = []
+        for event in events:
+            if _is_null(event.get("eventid")) or _is_null(event.get("eventdate")):
+                continue
+            sc3id = event.get("seiscompid")
+            rows.append(
+                (
+                    event["eventid"],
+                    None if _is_null(sc3id) else sc3id,
+                    _to_microseconds(event["eventdate"]),
+                    event.get("eventtype"),
+                    fetched_at,
+                    payload.dumps(event),
+                )
+            )
+
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "DELETE FROM events WHERE fetched_at < ?",
+                        (time.time() - self.ttl,),
+                    )
+                    conn.executemany(
+                        "DELETE FROM events WHERE eventid = ? AND fetched_at <= ?",
+                        [(row[0], fetched_at) for row in rows],
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?)", rows
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error("Failed to write MC3 cache %s: %s", self.path, e)
+
+    def get(
+        self, eventdate=None, eventid=None, sc3id=None, eventtype=None, not_before=None
+    ):
+        """
+        Get cached event matching the first given criterion of sc3id, eventid,
+        or eventdate (UTC). Other criteria are not tried if the first one does
+        not match, because the event may still be found by requesting WebObs.
+
+        If not_before (UTC) is set, events fetched before that time are ignored.
+
+        Return None if no matching event is found.
+        """
+        min_fetched_at = time.time() - self.ttl
+        if not_before is not None:
+            min_fetched_at = max(min_fetched_at, not_before.timestamp())
+
+        if sc3id is not None:
+            where, value = "sc3id = ?", sc3id
+        elif eventid is not None:
+            where, value = "eventid = ?", eventid
+        elif eventdate is not None:
+            where, value = "eventdate = ?", _to_microseconds(eventdate)
+        else:
+            return None
+
+        sql = "SELECT data FROM events WHERE {} AND fetched_at >= ?".format(where)
+        params = [value, min_fetched_at]
+        if eventtype is not None:
+            sql += " AND eventtype = ?"
+            params.append(eventtype)
+        sql += " ORDER BY fetched_at DESC LIMIT 1"
+
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(sql, params).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error("Failed to read MC3 cache %s: %s", self.path, e)
+            return None
+
+        if row is None:
+            return None
+        try:
+            return payload.loads(row[0])
+        except ValueError as e:
+            # E.g. row written by previous version of the cache.
+            logger.error("Failed to decode cached MC3 event: %s", e)
+            return None
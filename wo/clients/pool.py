@@ -0,0 +1,109 @@
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ClientPool(object):
+    """
+    Thread-safe pool of waveform clients keyed by (host, port, protocol).
+
+    Idle clients are reused across calls. A client is discarded if it raised an
+    exception while in use, failed the health check, or has been idle longer
+    than max_idle_time seconds.
+    """
+
+    def __init__(self, max_size=4, max_idle_time=300):
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self._lock = threading.Lock()
+        self._idle = collections.defaultdict(collections.deque)
+
+    @contextlib.contextmanager
+    def connection(self, key, factory, health_check=None, close=None):
+        """
+        Borrow a client from the pool for the given key.
+
+        :param key: Pool key, e.g. (host, port, protocol).
+
+        :param factory: Function to create a new client if no idle client is
+        available.
+
+        :param health_check: Optional function that takes a client and returns
+        False if the client should not be reused.
+
+        :param close: Optional function to close a discarded client.
+        """
+        client = self._acquire(key, health_check)
+        if client is None:
+            logger.debug("Creating new client for %s.", key)
+            client = factory()
+
+        try:
+            yield client
+        except Exception:
+            self._close(client, close)
+            raise
+        else:
+            self._release(key, client, close)
+
+    def _acquire(self, key, health_check):
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                client, last_used, close = idle.pop()
+
+            if time.monotonic() - last_used > self.max_idle_time:
+                logger.debug("Recycling idle client for %s.", key)
+                self._close(client, close)
+                continue
+
+            if health_check is not None and not health_check(client):
+                logger.debug("Discarding unhealthy client for %s.", key)
+                self._close(client, close)
+                continue
+
+            logger.debug("Reusing client for %s.", key)
+            return client
+
+    def _release(self, key, client, close):
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.max_size:
+                idle.append((client, time.monotonic(), close))
+                return
+        self._close(client, close)
+
+    def _close(self, client, close):
+        if close is None:
+            return
+        try:
+            close(client)
+        except Exception as e:
+            logger.debug(e)
+
+    def clear(self):
+        """
+        Close and remove all idle clients from the pool.
+        """
+        with self._lock:
+            items = [item for idle in self._idle.values() for item in idle]
+            self._idle.clear()
+
+        for client, __, close in items:
+            self._close(client, close)
+
+    def size(self, key=None):
+        """
+        Return number of idle clients in the pool for the given key, or in
+        total if key is None.
+        """
+        with self._lock:
+            if key is not None:
+                return len(self._idle.get(key, ()))
+            return sum(len(idle) for idle in self._idle.values())
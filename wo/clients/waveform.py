@@ -1,11 +1,30 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
-from obspy import UTCDateTime
+from obspy import Stream, UTCDateTime
 from obspy.clients.arclink.client import Client as ArcLinkClient
 from obspy.clients.seedlink.basic_client import Client as SeedLinkClient
 
 from ..constants import SE_STATIONS, STATIONS
-from ..settings import ARCLINK_HOST, ARCLINK_PORT, SEEDLINK_HOST, SEEDLINK_PORT
+from ..settings import (
+    ARCLINK_HOST,
+    ARCLINK_PORT,
+    SEEDLINK_HOST,
+    SEEDLINK_PORT,
+    WAVEFORM_BATCH_MAX_GAP,
+    WAVEFORM_BATCH_MAX_SPAN,
+    WAVEFORM_CACHE_ENABLED,
+    WAVEFORM_FETCH_CONCURRENT,
+    WAVEFORM_FETCH_TIMEOUT,
+    WAVEFORM_FETCH_WORKERS,
+    WAVEFORM_POOL_IDLE_TIME,
+    WAVEFORM_POOL_SIZE,
+)
+from .cache import WaveformCache
+from .pool import ClientPool
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +40,13 @@ TIME_BUFFER_OFFSET = 3600  # 1 hour
 class WaveformClient(object):
     """
     Adapter class to fetch waveform data through SeedLink or ArcLink client.
+
+    SeedLink and ArcLink client objects are kept in a pool keyed by (host, port,
+    protocol), so they are reused across calls instead of being created for
+    every request. The pool does not keep connections open. Both ObsPy clients
+    open the socket at the start of each request and close it at the end
+    (ArcLink HELLO/BYE, SeedLink session run to end time), so pooled clients
+    need neither a health check nor a close hook.
     """
 
     def __init__(
@@ -31,6 +57,7 @@ class WaveformClient(object):
         arclink_port=18001,
         timeout=5,
         use_client=None,
+        pool=None,
     ):
         self.seedlink_host = seedlink_host
         self.seedlink_port = seedlink_port
@@ -39,6 +66,26 @@ class WaveformClient(object):
         self.timeout = timeout
         self.use_client = use_client
 
+        if pool is not None:
+            self.pool = pool
+        else:
+            self.pool = ClientPool(
+                max_size=WAVEFORM_POOL_SIZE, max_idle_time=WAVEFORM_POOL_IDLE_TIME
+            )
+
+    def _create_seedlink_client(self):
+        return SeedLinkClient(
+            self.seedlink_host, self.seedlink_port, timeout=self.timeout
+        )
+
+    def _create_arclink_client(self):
+        return ArcLinkClient(
+            "client@cendana15.com",
+            host=self.arclink_host,
+            port=self.arclink_port,
+            timeout=self.timeout,
+        )
+
     def get_waveforms_via_seedlink(
         self, network, station, location, channel, starttime, endtime
     ):
@@ -46,12 +93,11 @@ class WaveformClient(object):
         Fetch waveform data via SeedLink.
         """
         logger.debug("Using SeedLink client.")
-        client = SeedLinkClient(
-            self.seedlink_host, self.seedlink_port, timeout=self.timeout
-        )
-        stream = client.get_waveforms(
-            network, station, location, channel, starttime, endtime
-        )
+        key = (self.seedlink_host, self.seedlink_port, SEEDLINK_CLIENT)
+        with self.pool.connection(key, self._create_seedlink_client) as client:
+            stream = client.get_waveforms(
+                network, station, location, channel, starttime, endtime
+            )
         return stream
 
     def get_waveforms_via_arclink(
@@ -61,17 +107,19 @@ class WaveformClient(object):
         Fetch waveform data via ArcLink.
         """
         logger.debug("Using ArcLink client.")
-        client = ArcLinkClient(
-            "client@cendana15.com",
-            host=self.arclink_host,
-            port=self.arclink_port,
-            timeout=self.timeout,
-        )
-        stream = client.get_waveforms(
-            network, station, location, channel, starttime, endtime
-        )
+        key = (self.arclink_host, self.arclink_port, ARCLINK_CLIENT)
+        with self.pool.connection(key, self._create_arclink_client) as client:
+            stream = client.get_waveforms(
+                network, station, location, channel, starttime, endtime
+            )
         return stream
 
+    def close(self):
+        """
+        Remove all idle clients from the pool.
+        """
+        self.pool.clear()
+
     def get_waveforms(self, network, station, location, channel, starttime, endtime):
         """
         Fetch waveform on current time window. Client is determined
@@ -100,14 +148,280 @@ class WaveformClient(object):
             raise ValueError("Unsupported client type.")
 
 
-def get_waveforms(starttime, endtime):
-    client = WaveformClient(
-        seedlink_host=SEEDLINK_HOST,
-        seedlink_port=SEEDLINK_PORT,
-        arclink_host=ARCLINK_HOST,
-        arclink_port=ARCLINK_PORT,
+_waveform_client = None
+
+
+def get_client():
+    """
+    Get waveform client shared by the current process, so pooled connections
+    are reused across events.
+    """
+    global _waveform_client
+    if _waveform_client is None:
+        _waveform_client = WaveformClient(
+            seedlink_host=SEEDLINK_HOST,
+            seedlink_port=SEEDLINK_PORT,
+            arclink_host=ARCLINK_HOST,
+            arclink_port=ARCLINK_PORT,
+        )
+    return _waveform_client
+
+
+_waveform_cache = None
+
+
+def get_cache():
+    """
+    Get local miniSEED waveform cache. Return None if the cache is disabled.
+    """
+    global _waveform_cache
+    if not WAVEFORM_CACHE_ENABLED:
+        return None
+    if _waveform_cache is None:
+        _waveform_cache = WaveformCache()
+    return _waveform_cache
+
+
+def cached(fetch, cache):
+    """
+    Wrap fetch function, so waveform data is served from the cache if the time
+    window has been fetched before, and stored in the cache otherwise.
+    """
+    if cache is None:
+        return fetch
+
+    def wrapper(network, station, location, channel, starttime, endtime):
+        stream = cache.get(network, station, location, channel, starttime, endtime)
+        if stream is not None:
+            return stream
+
+        stream = fetch(network, station, location, channel, starttime, endtime)
+        cache.put(network, station, location, channel, starttime, endtime, stream)
+        return stream
+
+    return wrapper
+
+
+def fetch_stations(fetch, stations, starttime, endtime, max_workers=None, timeout=None):
+    """
+    Fetch waveform data of all stations concurrently using a bounded thread
+    pool.
+
+    :param fetch: Fetch function with signature (network, station, location,
+    channel, starttime, endtime), e.g. WaveformClient.get_waveforms_via_arclink.
+
+    :param stations: List of station definitions, e.g. STATIONS.
+
+    :param max_workers: Maximum number of worker threads. Default to the number
+    of stations.
+
+    :param timeout: Deadline in seconds for each station counted from the time
+    the request of the station starts running. Stations waiting for a free
+    worker thread are not timed out. If a station does not respond before the
+    deadline, its result is discarded. If None, wait until all stations
+    finished.
+
+    :returns: List of ObsPy streams in the same order as stations. Stream of a
+    station that failed or exceeded the deadline is None.
+    """
+    if not stations:
+        return []
+
+    if max_workers is None or max_workers < 1:
+        max_workers = len(stations)
+
+    started = [threading.Event() for __ in stations]
+    started_at = [None] * len(stations)
+
+    def run(index, sta):
+        started_at[index] = time.monotonic()
+        started[index].set()
+        return fetch(
+            sta["network"],
+            sta["station"],
+            sta["location"],
+            sta["channel"],
+            starttime,
+            endtime,
+        )
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+    for index, sta in enumerate(stations):
+        logger.info("Fetching waveform data for station %s...", sta["station"])
+        futures.append(executor.submit(run, index, sta))
+
+    results = []
+    try:
+        for index, (sta, future) in enumerate(zip(stations, futures)):
+            if timeout is not None:
+                # Worker threads of stalled stations exit once the underlying
+                # client times out, so queued stations eventually start.
+                started[index].wait()
+                remaining = max(0, started_at[index] + timeout - time.monotonic())
+            else:
+                remaining = None
+
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                logger.error(
+                    "Fetching waveform data for station %s exceeded "
+                    "the deadline of %ss.",
+                    sta["station"],
+                    timeout,
+                )
+                results.append(None)
+            except Exception as e:
+                logger.error(e)
+                results.append(None)
+    finally:
+        # Do not wait for stalled stations. Their threads exit once the
+        # underlying client times out.
+        executor.shutdown(wait=False)
+
+    return results
+
+
+def get_waveforms(starttime, endtime, concurrent=None):
+    """
+    Fetch waveform data of all stations on the time window starttime to
+    endtime and merge the traces into a single stream.
+
+    If concurrent is True, all stations are requested in parallel. Otherwise,
+    stations are requested one by one. If concurrent is None, use
+    WAVEFORM_FETCH_CONCURRENT settings.
+    """
+    if concurrent is None:
+        concurrent = WAVEFORM_FETCH_CONCURRENT
+
+    if concurrent:
+        return _get_waveforms_concurrent(starttime, endtime)
+    return _get_waveforms_serial(starttime, endtime)
+
+
+def coalesce_windows(windows, max_gap=0, max_span=None):
+    """
+    Coalesce overlapping or nearby time windows into merged spans.
+
+    :param windows: List of tuple of (starttime, endtime).
+
+    :param max_gap: Windows separated by at most max_gap seconds are merged into
+    the same span.
+
+    :param max_span: Maximum length of a span in seconds. A window is put into a
+    new span if merging it would make the span longer than max_span. If None,
+    span length is not limited.
+
+    :returns: List of tuple of (starttime, endtime, indices) sorted by
+    starttime, where indices are the positions of the windows in the span.
+    """
+    order = sorted(range(len(windows)), key=lambda index: windows[index][0])
+
+    spans = []
+    for index in order:
+        start, end = windows[index]
+        if spans:
+            span_start, span_end, indices = spans[-1]
+            new_end = max(span_end, end)
+            if start - span_end <= max_gap and (
+                max_span is None or new_end - span_start <= max_span
+            ):
+                spans[-1] = (span_start, new_end, indices + [index])
+                continue
+        spans.append((start, end, [index]))
+    return spans
+
+
+def get_waveforms_batch(
+    windows, max_gap=WAVEFORM_BATCH_MAX_GAP, max_span=WAVEFORM_BATCH_MAX_SPAN
+):
+    """
+    Fetch waveform data for many time windows at once.
+
+    Overlapping or nearby windows are coalesced into merged spans, each span is
+    fetched once for all stations, and the stream of each window is sliced
+    from the span stream in memory.
+
+    :param windows: List of tuple of (starttime, endtime).
+
+    :returns: List of ObsPy streams in the same order as windows. Stream is None
+    if no waveform data available for the window.
+    """
+    results = [None] * len(windows)
+
+    spans = coalesce_windows(windows, max_gap=max_gap, max_span=max_span)
+    logger.info(
+        "Fetching waveform data for %s windows in %s requests...",
+        len(windows),
+        len(spans),
     )
 
+    for span_start, span_end, indices in spans:
+        logger.info("Fetch span (UTC): %s to %s", span_start, span_end)
+        stream = get_waveforms(span_start, span_end)
+        if stream is None:
+            continue
+
+        for index in indices:
+            starttime, endtime = windows[index]
+            substream = stream.slice(starttime, endtime)
+            if substream:
+                results[index] = substream
+
+    return results
+
+
+def _get_waveforms_concurrent(starttime, endtime):
+    client = get_client()
+
+    delta = UTCDateTime() - endtime
+
+    logger.info("Time delta offset: %.2f s", delta)
+
+    if abs(delta) < TIME_BUFFER_OFFSET:
+        logger.info("Fetching waveform data (fast mode)...")
+        streams = fetch_stations(
+            client.get_waveforms_via_seedlink,
+            SE_STATIONS,
+            starttime,
+            endtime,
+            max_workers=WAVEFORM_FETCH_WORKERS,
+            timeout=WAVEFORM_FETCH_TIMEOUT,
+        )
+    else:
+        streams = fetch_stations(
+            cached(client.get_waveforms_via_arclink, get_cache()),
+            STATIONS,
+            starttime,
+            endtime,
+            max_workers=WAVEFORM_FETCH_WORKERS,
+            timeout=WAVEFORM_FETCH_TIMEOUT,
+        )
+
+    # Merge traces following the station definition order, so the resulting
+    # stream is deterministic regardless which station responds first.
+    stream = None
+    for msd in streams:
+        if msd is None:
+            continue
+
+        logger.debug("Stream: %s", msd)
+
+        if stream is None:
+            stream = Stream()
+        stream += msd
+
+    if stream is None:
+        return None
+
+    stream.merge(method=1, fill_value="interpolate")
+    return stream
+
+
+def _get_waveforms_serial(starttime, endtime):
+    client = get_client()
+
     stream = None
     delta = UTCDateTime() - endtime
 
@@ -132,6 +446,7 @@ def get_waveforms(starttime, endtime):
                 logger.error(e)
 
     else:
+        fetch = cached(client.get_waveforms_via_arclink, get_cache())
         for sta in STATIONS:
             network = sta["network"]
             station = sta["station"]
@@ -140,9 +455,7 @@ def get_waveforms(starttime, endtime):
 
             try:
                 logger.info("Fetching waveform data for station %s...", station)
-                msd = client.get_waveforms_via_arclink(
-                    network, station, location, channel, starttime, endtime
-                )
+                msd = fetch(network, station, location, channel, starttime, endtime)
 
                 logger.debug("Stream: %s", msd)
 
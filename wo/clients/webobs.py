@@ -1,29 +1,253 @@
+import copy
 import datetime
+import io
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 from webobsclient import MC3Client
 from webobsclient.parser import MC3Parser
+from webobsclient.schemas import MC3Schema
 
 from .. import constants
-from ..settings import WEBOBS_HOST, WEBOBS_PASSWORD, WEBOBS_USERNAME
+from ..settings import (
+    WEBOBS_FETCH_CHUNK_SIZE,
+    WEBOBS_FETCH_WORKERS,
+    WEBOBS_HOST,
+    WEBOBS_MC3_CACHE_ENABLED,
+    WEBOBS_PASSWORD,
+    WEBOBS_USERNAME,
+)
+from .cache import MC3Cache
 
 logger = logging.getLogger(__name__)
 
+# Explicit dtypes of MC3 CSV columns. Datetime columns are read as string and
+# converted separately.
+MC3_DTYPES = {
+    "eventdate": "str",
+    "number": "float64",
+    "duration": "float64",
+    "amplitude": "str",
+    "magnitude": "str",
+    "energy": "float64",
+    "longitude": "float64",
+    "latitude": "float64",
+    "depth": "float64",
+    "eventtype": "str",
+    "seiscompid": "str",
+    "location_mode": "str",
+    "location_type": "str",
+    "projection": "str",
+    "operator": "str",
+    "timestamp": "str",
+    "eventid": "str",
+}
+
 
 class FetcherError(Exception):
     pass
 
 
+class _CommentFilter(object):
+    """
+    Read-only text stream of lines that do not start with comment character.
+    The underlying binary stream is read in blocks of whole lines.
+    """
+
+    def __init__(self, fd, comment="#", encoding="utf-8", blocksize=1 << 20):
+        self.fd = fd
+        self.comment = comment
+        self.encoding = encoding
+        self.blocksize = blocksize
+        self._remainder = b""
+        self._buffer = ""
+        self._eof = False
+
+    def _read_block(self):
+        data = self._remainder + self.fd.read(self.blocksize)
+        if len(data) == len(self._remainder):
+            self._eof = True
+            self._remainder = b""
+        else:
+            index = data.rfind(b"\n") + 1
+            if index == 0:
+                self._remainder = data
+                return ""
+            data, self._remainder = data[:index], data[index:]
+
+        text = data.decode(self.encoding)
+        if text.startswith(self.comment) or "\n" + self.comment in text:
+            text = "".join(
+                line
+                for line in text.splitlines(keepends=True)
+                if not line.startswith(self.comment)
+            )
+        return text
+
+    def read(self, size=-1):
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            self._buffer += self._read_block()
+
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def __iter__(self):
+        return iter(self.read().splitlines(keepends=True))
+
+
+class MC3StreamParser(object):
+    """
+    Streaming WebObs MC3 CSV parser.
+
+    CSV content is parsed in chunks of chunksize rows with explicit column
+    dtypes and rows outside of the requested time range are dropped while
+    parsing, so memory usage does not grow with the number of rows outside of
+    the time range. The result has the same columns as MC3Parser.to_df.
+    """
+
+    def __init__(self, chunksize=10000, schema=None):
+        self.chunksize = chunksize
+        self.schema = schema if schema is not None else MC3Schema()
+
+    def _parse_datetime(self, series):
+        # MC3 datetime values, e.g. 20210708 000200.24, are handled by the
+        # Pandas ISO 8601 fast path, which is faster than explicit format.
+        return pd.to_datetime(series, utc=True)
+
+    def iter_chunks(self, source, start=None, end=None):
+        """
+        Parse CSV content (bytes or binary file object) and yield DataFrame of
+        rows that have eventdate in time range start to end (UTC). If start or
+        end is None, the time range is not bounded.
+        """
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+
+        columns = self.schema.get_columns()
+        reader = pd.read_csv(
+            _CommentFilter(source, comment=self.schema.comment),
+            delimiter=self.schema.delimiter,
+            header=None,
+            names=columns,
+            dtype={name: MC3_DTYPES.get(name, "str") for name in columns},
+            chunksize=self.chunksize,
+        )
+        for df in reader:
+            df["eventdate"] = self._parse_datetime(df["eventdate"])
+            mask = df["eventdate"].notna()
+            if start is not None:
+                mask &= df["eventdate"] >= start
+            if end is not None:
+                mask &= df["eventdate"] < end
+            if not mask.all():
+                df = df.loc[mask]
+            if df.empty:
+                continue
+            yield df
+
+    def parse(self, source, start=None, end=None):
+        """
+        Parse CSV content (bytes or binary file object) returned as Pandas
+        DataFrame of rows that have eventdate in time range start to end (UTC).
+        """
+        frames = list(self.iter_chunks(source, start=start, end=end))
+        if not frames:
+            return pd.DataFrame()
+        if len(frames) == 1:
+            df = frames[0].reset_index(drop=True)
+        else:
+            df = pd.concat(frames, ignore_index=True)
+
+        if not df["number"].isna().any():
+            df["number"] = df["number"].astype("int64")
+
+        # Same derived fields as MC3Parser.to_df.
+        df["timestamp"] = self._parse_datetime(df["timestamp"])
+        df["eventdate_microsecond"] = df["eventdate"].dt.microsecond / 10000
+        df["valid"] = 0
+        df["timestamp_microsecond"] = df["timestamp"].dt.microsecond / 10000
+        return df
+
+
+_mc3_cache = None
+
+
+def get_mc3_cache():
+    """
+    Get WebObs MC3 event cache. Return None if the cache is disabled.
+    """
+    global _mc3_cache
+    if not WEBOBS_MC3_CACHE_ENABLED:
+        return None
+    if _mc3_cache is None:
+        _mc3_cache = MC3Cache()
+    return _mc3_cache
+
+
+def split_fetch_range(start, end, chunk_size):
+    """
+    Split time range start to end into chunks of chunk_size. Chunk boundaries
+    are aligned to multiples of chunk_size from midnight of start, so that
+    inner boundaries fall on whole hours of the MC3 request.
+
+    :returns: List of tuple of chunk start and end time.
+    """
+    if chunk_size.total_seconds() <= 0:
+        raise ValueError("Chunk size must be positive.")
+
+    chunks = []
+    boundary = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    current = start
+    while current < end:
+        while boundary <= current:
+            boundary += chunk_size
+        chunk_end = min(boundary, end)
+        chunks.append((current, chunk_end))
+        current = chunk_end
+    return chunks
+
+
 class WebObsMC3Fetcher:
     """
     WebObs MC3 bulletin fetcher.
+
+    Time ranges longer than chunk_size (datetime.timedelta) are requested in
+    chunks, fetched concurrently by at most max_workers threads. Chunks that
+    still fail after max retries are skipped and recorded in failed_ranges.
+    failed_ranges only holds the failures of the last fetch, all_failed_ranges
+    the failures of all fetches of the fetcher, e.g. window by window reverse
+    sync.
+
+    If cache (MC3Cache) is set, fetched events are stored in the cache and
+    get_mc3 is served from the cache if possible.
     """
 
-    def __init__(self, client=None, parser=None, max_retries=5, retry_delay=10):
+    def __init__(
+        self,
+        client=None,
+        parser=None,
+        max_retries=5,
+        retry_delay=10,
+        chunk_size=datetime.timedelta(days=WEBOBS_FETCH_CHUNK_SIZE),
+        max_workers=WEBOBS_FETCH_WORKERS,
+        cache=None,
+    ):
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.cache = cache
+
+        # Time ranges of the last fetch that failed after max retries.
+        self.failed_ranges = []
+        # Time ranges of all fetches that failed after max retries.
+        self.all_failed_ranges = []
+        self._local = threading.local()
 
         if client is not None:
             self.client = client
@@ -36,6 +260,25 @@ class WebObsMC3Fetcher:
             self.parser = parser
         else:
             self.parser = MC3Parser()
+        self.stream_parser = MC3StreamParser()
+
+        self._owner = threading.get_ident()
+
+    def _get_client(self):
+        """
+        Get MC3 client of the current thread. Request parameters are stored in
+        the client instance, so worker threads use their own copy of the
+        client.
+        """
+        if threading.get_ident() == self._owner:
+            return self.client
+
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = copy.copy(self.client)
+            client.parameters = {}
+            self._local.client = client
+        return client
 
     def request_mc3(self, start, end, eventtype="ALL"):
         """
@@ -48,12 +291,13 @@ class WebObsMC3Fetcher:
         If request failed, it will try until max retries reached. If all retries
         failed, return None.
         """
-        logger.info("Fetching MC3 bulletin (%s)...", self.client.api.host)
+        client = self._get_client()
+        logger.info("Fetching MC3 bulletin (%s)...", client.api.host)
         logger.info("Time range (UTC): %s to %s", start, end)
 
         for __ in range(self.max_retries):
             try:
-                response, content = self.client.request(
+                response, content = client.request(
                     starttime=start.strftime(constants.DATETIME_FORMAT),
                     endtime=end.strftime(constants.DATETIME_FORMAT),
                     type=eventtype,
@@ -79,7 +323,9 @@ class WebObsMC3Fetcher:
 
         return content
 
-    def get_mc3(self, eventdate, eventid=None, sc3id=None, eventtype=None):
+    def get_mc3(
+        self, eventdate, eventid=None, sc3id=None, eventtype=None, not_before=None
+    ):
         """
         Get event from WebObs MC3 bulletin defined by eventdate (UTC) and
         matching criteria (eventid, sc3id, or eventtype).
@@ -89,11 +335,28 @@ class WebObsMC3Fetcher:
         WebObs MC3 eventdate also in UTC time zone. Beware that eventdate also
         takes account miliseconds part.
 
+        If cache is set, the event is first looked up in the cache. Cached events
+        fetched before not_before (UTC) are ignored, e.g. set not_before to the
+        time the event was modified.
+
         If event not found after matching criteria, return None.
         """
+        if self.cache is not None:
+            event = self.cache.get(
+                eventdate=eventdate,
+                eventid=eventid,
+                sc3id=sc3id,
+                eventtype=eventtype,
+                not_before=not_before,
+            )
+            if event is not None:
+                logger.info("Found event in MC3 cache")
+                return event
+
         start = eventdate - datetime.timedelta(seconds=10)
         end = eventdate + datetime.timedelta(seconds=10)
 
+        fetched_at = time.time()
         if eventtype is not None:
             content = self.request_mc3(start, end, eventtype=eventtype)
         else:
@@ -110,6 +373,9 @@ class WebObsMC3Fetcher:
         else:
             logger.info("Fetched %s events from WebObs MC3", len(df))
 
+        if self.cache is not None:
+            self.cache.put(df.to_dict(orient="records"), fetched_at=fetched_at)
+
         if sc3id is not None:
             event = df.loc[df["seiscompid"] == sc3id]
             if not event.empty:
@@ -125,27 +391,76 @@ class WebObsMC3Fetcher:
             return event.to_dict(orient="records")[0]
         return None
 
-    def fetch_mc3_as_df(self, start, end, eventtype="ALL"):
+    def _fetch_chunk(self, start, end, eventtype="ALL"):
         """
-        Request MC3 bulletin defined by start time, end time, and optional
-        eventtype returned as Pandas DataFrame.
+        Request MC3 bulletin of a single chunk returned as Pandas DataFrame, or
+        None if the request failed.
         """
+        fetched_at = time.time()
         content = self.request_mc3(start, end, eventtype=eventtype)
         if content is None:
-            return pd.DataFrame()
+            return None
 
         # Filter exact to allow only eventdate in the defined time range.
-        df = self.parser.to_df(content)
-        df = df.where((df["eventdate"] >= start) & (df["eventdate"] < end))
-        df.dropna(how="any", inplace=True, subset=["eventdate"])
+        df = self.stream_parser.parse(content, start=start, end=end)
+        if self.cache is not None and not df.empty:
+            self.cache.put(df.to_dict(orient="records"), fetched_at=fetched_at)
         return df
 
-    def fetch_mc3_as_dict(self, start, end, eventtype="ALL"):
+    def fetch_mc3_as_df(self, start, end, eventtype="ALL", strict=False):
+        """
+        Request MC3 bulletin defined by start time, end time, and optional
+        eventtype returned as Pandas DataFrame.
+
+        If some chunks failed, events of the other chunks are still returned and
+        the failed time ranges are stored in failed_ranges. If strict is True,
+        return empty DataFrame instead.
+        """
+        self.failed_ranges = []
+        chunks = split_fetch_range(start, end, self.chunk_size)
+
+        if len(chunks) < 2 or self.max_workers is None or self.max_workers < 2:
+            results = [
+                self._fetch_chunk(chunk_start, chunk_end, eventtype=eventtype)
+                for chunk_start, chunk_end in chunks
+            ]
+        else:
+            logger.info(
+                "Fetching %s chunks of MC3 bulletin using %s workers...",
+                len(chunks),
+                self.max_workers,
+            )
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(
+                    executor.map(
+                        lambda chunk: self._fetch_chunk(
+                            chunk[0], chunk[1], eventtype=eventtype
+                        ),
+                        chunks,
+                    )
+                )
+
+        frames = []
+        for chunk, df in zip(chunks, results):
+            if df is None:
+                logger.error("Failed to fetch MC3 bulletin from %s to %s", *chunk)
+                self.failed_ranges.append(chunk)
+                self.all_failed_ranges.append(chunk)
+            elif not df.empty:
+                frames.append(df)
+
+        if self.failed_ranges and strict:
+            return pd.DataFrame()
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def fetch_mc3_as_dict(self, start, end, eventtype="ALL", strict=False):
         """
         Request MC3 bulletin defined by start time, end time, and optional
         eventtype returned as dictionary.
         """
-        df = self.fetch_mc3_as_df(start, end, eventtype=eventtype)
+        df = self.fetch_mc3_as_df(start, end, eventtype=eventtype, strict=strict)
         if df.empty:
             return {}
         return df.to_dict(orient="records")
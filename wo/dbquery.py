@@ -1,3 +1,4 @@
+import datetime
 import logging
 
 import pandas as pd
@@ -5,12 +6,44 @@ import pytz
 from webobsclient.contrib.bpptkg.db.sessions import session_scope
 from webobsclient.contrib.bpptkg.utils.sqlalchemy import object_as_dict
 
-from .settings import TIMEZONE
+from .settings import REVERSE_SYNC_BATCH_SIZE, REVERSE_SYNC_WINDOW, TIMEZONE
 
 logger = logging.getLogger(__name__)
 
 
-def get_bulletin_by_range(engine, table, starttime, endtime, eventtype):
+# Columns needed by reverse synchronization.
+REVERSE_SYNC_COLUMNS = ("eventid", "eventdate", "eventtype", "operator")
+
+
+def _query_bulletin_by_range(
+    session, table, starttime, endtime, eventtype, *, columns=None
+):
+    if columns is None:
+        queryset = session.query(table)
+    else:
+        queryset = session.query(*[getattr(table, column) for column in columns])
+
+    queryset = queryset.filter(
+        table.eventdate >= starttime,
+        table.eventdate < endtime,
+    )
+    if eventtype == "ALL":
+        queryset = queryset.filter(table.eventtype != None)
+    elif isinstance(eventtype, str):
+        queryset = queryset.filter(table.eventtype == eventtype)
+    elif isinstance(eventtype, (list, tuple)):
+        queryset = queryset.filter(table.eventtype.in_(eventtype))
+    else:
+        queryset = queryset.filter(table.eventtype != None)
+
+    logger.debug("Queryset: %s", queryset)
+
+    return queryset.order_by(table.eventdate)
+
+
+def get_bulletin_by_range(
+    engine, table, starttime, endtime, eventtype, *, columns=None, frame=False
+):
     """
     Get bulletin by particular time range and eventtype.
 
@@ -25,30 +58,68 @@ def get_bulletin_by_range(engine, table, starttime, endtime, eventtype):
     :param eventtype: Event type, e.g. VTA, VTB. If eventtype is None or ALL,
     query all events (excluding None). ALL eventtype is used by WebObs to query
     all event types.
+
+    :param columns: List of column names to select. If columns is None, full
+    model objects are loaded and returned as list of dictionary. Otherwise,
+    only the listed columns are selected and returned as list of tuples
+    ordered by columns, without ORM object overhead.
+
+    :param frame: If True and columns is given, return Pandas DataFrame
+    instead of list of tuples.
     """
     logger.info("Database eventtype query: %s", eventtype)
 
     with session_scope(engine) as session:
-        queryset = session.query(table).filter(
-            table.eventdate >= starttime,
-            table.eventdate < endtime,
+        queryset = _query_bulletin_by_range(
+            session, table, starttime, endtime, eventtype, columns=columns
         )
-        if eventtype == "ALL":
-            queryset = queryset.filter(table.eventtype != None)
-        elif isinstance(eventtype, str):
-            queryset = queryset.filter(table.eventtype == eventtype)
-        elif isinstance(eventtype, (list, tuple)):
-            queryset = queryset.filter(table.eventtype.in_(eventtype))
-        else:
-            queryset = queryset.filter(table.eventtype != None)
+        results = queryset.all()
+        if columns is None:
+            return [object_as_dict(item) for item in results]
+
+        rows = [tuple(row) for row in results]
+        if frame:
+            return pd.DataFrame.from_records(rows, columns=list(columns))
+        return rows
+
+
+def iter_bulletin_by_range(
+    engine,
+    table,
+    starttime,
+    endtime,
+    eventtype,
+    *,
+    columns=None,
+    batch_size=REVERSE_SYNC_BATCH_SIZE,
+):
+    """
+    Generator function to iterate bulletin by particular time range and
+    eventtype using server-side cursor, so that the result set is never loaded
+    into memory at once. Rows are fetched from the server batch_size rows at a
+    time.
 
-        logger.debug("Queryset: %s", queryset)
+    Parameters are the same as get_bulletin_by_range(). Yield dictionary of
+    event if columns is None, otherwise yield tuple ordered by columns.
+    """
+    logger.info("Database eventtype query: %s", eventtype)
+
+    with session_scope(engine) as session:
+        queryset = _query_bulletin_by_range(
+            session, table, starttime, endtime, eventtype, columns=columns
+        )
+        queryset = queryset.execution_options(stream_results=True).yield_per(batch_size)
 
-        results = queryset.order_by(table.eventdate).all()
-        return [object_as_dict(item) for item in results]
+        for item in queryset:
+            if columns is None:
+                yield object_as_dict(item)
+            else:
+                yield tuple(item)
 
 
-def reverse_filter_exact(engine, table, wo_events, start, end, eventtype=None):
+def reverse_filter_exact(
+    engine, table, wo_events, start, end, eventtype=None, *, stream=False
+):
     """
     Generator function to check if particular event not exists (event ID not
     exists, or event ID exists but eventtype differ) in the webobs.
@@ -66,35 +137,89 @@ def reverse_filter_exact(engine, table, wo_events, start, end, eventtype=None):
 
     :param eventtype: Event type, e.g. VTA, VTB.
 
+    :param stream: If True, stream database events using server-side cursor
+    instead of loading all events into memory.
+
     :return: Yield a tuple of database event and WebObs event (None if not
     matched), e.g. (event_db, event_wo). event_db is a dictionary of event in
-    the database while event_wo is a dictionary of event in the WebObs. Note
-    that eventdate in the database always uses local time zone while eventdate
-    in the WebObs uses UTC time zone.
+    the database with REVERSE_SYNC_COLUMNS keys while event_wo is a dictionary
+    of event in the WebObs. Note that eventdate in the database always uses
+    local time zone while eventdate in the WebObs uses UTC time zone.
     """
 
-    df = pd.DataFrame(wo_events)
+    if not wo_events:
+        return
 
-    if not df.empty:
-        localtz = pytz.timezone(TIMEZONE)
-        starttime = start.astimezone(localtz).replace(tzinfo=None)
-        endtime = end.astimezone(localtz).replace(tzinfo=None)
+    # Index WebObs events by event ID once. If there are duplicate event IDs,
+    # the first event is used.
+    index = {}
+    for wo_event in wo_events:
+        index.setdefault(wo_event["eventid"], wo_event)
 
-        logger.info("Database query time range (local): %s to %s", starttime, endtime)
+    localtz = pytz.timezone(TIMEZONE)
+    starttime = start.astimezone(localtz).replace(tzinfo=None)
+    endtime = end.astimezone(localtz).replace(tzinfo=None)
 
-        logger.info("Fetching bulletin data from database...")
-        db_events = get_bulletin_by_range(engine, table, starttime, endtime, eventtype)
+    logger.info("Database query time range (local): %s to %s", starttime, endtime)
 
-        logger.info("Fetched %s events from database.", len(db_events))
+    logger.info("Fetching bulletin data from database...")
+    columns = REVERSE_SYNC_COLUMNS
+    if stream:
+        rows = iter_bulletin_by_range(
+            engine, table, starttime, endtime, eventtype, columns=columns
+        )
+    else:
+        rows = get_bulletin_by_range(
+            engine, table, starttime, endtime, eventtype, columns=columns
+        )
+        logger.info("Fetched %s events from database.", len(rows))
+
+    for row in rows:
+        eventid, __, eventtype_db, __ = row
+        matched_event = index.get(eventid)
+        if matched_event is None:
+            yield (dict(zip(columns, row)), None)
+        elif matched_event["eventtype"] != eventtype_db:
+            yield (dict(zip(columns, row)), matched_event)
+
+
+def reverse_filter_by_window(
+    engine,
+    table,
+    fetch,
+    start,
+    end,
+    eventtype=None,
+    *,
+    window=datetime.timedelta(days=REVERSE_SYNC_WINDOW),
+):
+    """
+    Generator function similar to reverse_filter_exact(), but split time range
+    start to end into windows, so that reverse synchronization can run over
+    arbitrary long time range in constant memory. For each window, WebObs
+    events are fetched using fetch function and database events are streamed
+    using server-side cursor.
 
-        eventids = set(df["eventid"])
-        for event in db_events:
-            eventid = event["eventid"]
-            if eventid not in eventids:
-                yield (event, None)
-            else:
-                matched_event = df.loc[df["eventid"] == eventid].to_dict(
-                    orient="records"
-                )[0]
-                if matched_event["eventtype"] != event["eventtype"]:
-                    yield (event, matched_event)
+    If WebObs returns no events for a window, the window is skipped, similar to
+    reverse_filter_exact() with empty WebObs events.
+
+    :param fetch: Function to fetch WebObs events with signature
+    fetch(start, end, eventtype=eventtype), e.g.
+    WebObsMC3Fetcher.fetch_mc3_as_dict.
+
+    :param window: Time window of each WebObs request and database query as
+    datetime.timedelta.
+    """
+    wstart = start
+    while wstart < end:
+        wend = min(wstart + window, end)
+
+        wo_events = fetch(wstart, wend, eventtype=eventtype)
+        logger.info(
+            "Number of WebObs events (%s to %s): %s", wstart, wend, len(wo_events)
+        )
+
+        yield from reverse_filter_exact(
+            engine, table, wo_events, wstart, wend, eventtype, stream=True
+        )
+        wstart = wend
@@ -0,0 +1,107 @@
+import datetime
+
+import numpy as np
+import pytz
+
+from .settings import TIMEZONE
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _is_null(value):
+    # NaN and NaT are the only values that are not equal to themselves.
+    return value is None or value != value
+
+
+def _encode_value(value):
+    if _is_null(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class RowEncoder(object):
+    """
+    Encode event dictionaries to database row tuples.
+
+    Column mapping is compiled once into a list of (column, encoder) pairs.
+    Datetime columns are converted to local time zone and formatted as
+    DATETIME_FORMAT string. Naive datetime is assumed to be in UTC time zone.
+    NaN, NaT, and None values are encoded as None (NULL).
+
+    Events are encoded without pandas. Vectorized pandas encoding is slower for
+    any batch up to UPSERT_CHUNK_SIZE events, see
+    scripts/benchmark_row_encoder.py.
+    """
+
+    def __init__(
+        self,
+        columns,
+        datetime_columns=(),
+        timezone=TIMEZONE,
+    ):
+        self.columns = list(columns)
+        self.datetime_columns = [
+            column for column in self.columns if column in set(datetime_columns)
+        ]
+        self.timezone = pytz.timezone(timezone)
+
+        self._encoders = [
+            (
+                column,
+                (
+                    self._encode_datetime
+                    if column in self.datetime_columns
+                    else _encode_value
+                ),
+            )
+            for column in self.columns
+        ]
+        self._offsets = {}
+
+    def _utcoffset(self, value):
+        # Time zone transitions occur on multiples of 15 minutes in UTC, so
+        # cache the offset for each 15 minutes bucket instead of resolving the
+        # time zone for every value.
+        key = (value.year, value.month, value.day, value.hour, value.minute // 15)
+        offset = self._offsets.get(key)
+        if offset is None:
+            utc = datetime.datetime(*key[:4], minute=key[4] * 15, tzinfo=pytz.utc)
+            offset = utc.astimezone(self.timezone).utcoffset()
+            self._offsets[key] = offset
+        return offset
+
+    def _encode_datetime(self, value):
+        if _is_null(value):
+            return None
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.utc)
+        local = datetime.datetime(
+            value.year,
+            value.month,
+            value.day,
+            value.hour,
+            value.minute,
+            value.second,
+        ) + self._utcoffset(value)
+        return "%04d-%02d-%02d %02d:%02d:%02d" % (
+            local.year,
+            local.month,
+            local.day,
+            local.hour,
+            local.minute,
+            local.second,
+        )
+
+    def encode(self, event):
+        """
+        Encode an event dictionary to a row tuple.
+        """
+        return tuple(encoder(event[column]) for column, encoder in self._encoders)
+
+    def encode_many(self, events):
+        """
+        Encode list of event dictionaries to list of row tuples.
+        """
+        return [self.encode(event) for event in events]
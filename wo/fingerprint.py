@@ -0,0 +1,92 @@
+import pytz
+
+from .magnitude import get_station_info
+from .settings import TIMEZONE
+
+
+def _is_null(value):
+    return value is None or value != value
+
+
+def make_fingerprint(eventdate, eventdate_microsecond, duration):
+    """
+    Make fingerprint of the fields that affect waveform-derived values of an
+    event, i.e. event date and duration.
+
+    :param eventdate: Event date in UTC time zone. Microsecond part is ignored.
+
+    :param eventdate_microsecond: Microsecond part of event date as stored in
+    the bulletin.
+
+    :param duration: Event duration in seconds.
+    """
+    if _is_null(eventdate):
+        return None
+
+    eventdate = eventdate.replace(microsecond=0)
+    if _is_null(eventdate_microsecond):
+        eventdate_microsecond = 0
+    if _is_null(duration):
+        duration = None
+    else:
+        # Duration is stored as single precision float in the database.
+        duration = round(float(duration), 2)
+
+    return "{}|{}|{}".format(
+        eventdate.strftime("%Y-%m-%dT%H:%M:%S"),
+        int(eventdate_microsecond),
+        duration,
+    )
+
+
+def get_event_fingerprint(event):
+    """
+    Get fingerprint of WebObs event. Event date is in UTC time zone.
+    """
+    eventdate = event["eventdate"]
+    if not _is_null(eventdate):
+        eventdate = eventdate.astimezone(pytz.utc)
+    return make_fingerprint(
+        eventdate, event.get("eventdate_microsecond"), event.get("duration")
+    )
+
+
+def get_db_event_fingerprint(event, timezone=TIMEZONE):
+    """
+    Get fingerprint of bulletin database event. Event date is naive datetime in
+    local time zone.
+    """
+    eventdate = event["eventdate"]
+    if not _is_null(eventdate):
+        eventdate = pytz.timezone(timezone).localize(eventdate).astimezone(pytz.utc)
+    return make_fingerprint(
+        eventdate, event.get("eventdate_microsecond"), event.get("duration")
+    )
+
+
+def get_stored_magnitudes(event):
+    """
+    Get magnitude and amplitude fields of bulletin database event.
+    """
+    results = {}
+    for station in get_station_info():
+        results[station["ml_field"]] = event.get(station["ml_field"])
+        results[station["app_field"]] = event.get(station["app_field"])
+    return results
+
+
+def is_waveform_unchanged(event_wo, event_db):
+    """
+    Check if waveform-derived values of the database event can be reused for
+    the WebObs event, i.e. the fingerprints are equal and the database event
+    has stored magnitudes.
+    """
+    if event_db is None:
+        return False
+
+    fingerprint = get_event_fingerprint(event_wo)
+    if fingerprint is None or fingerprint != get_db_event_fingerprint(event_db):
+        return False
+
+    magnitudes = get_stored_magnitudes(event_db)
+    return any(not _is_null(value) for value in magnitudes.values())
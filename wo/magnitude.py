@@ -1,4 +1,13 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import richter
+from obspy import Stream
+from richter import paz
+
+logger = logging.getLogger(__name__)
 
 
 def get_station_info():
@@ -39,6 +48,47 @@ def get_station_info():
     return stations
 
 
+def compute_station_magnitude(stream, station, network="VG", component="Z", **kwargs):
+    """
+    Calculate Richter magnitude (ML) and amplitude peak-to-peak (app) of a
+    station in a single pass.
+
+    The station trace is selected and merged once, then app is computed from
+    the raw trace data and ML from the same trace after Wood-Anderson
+    simulation. Results are equal to richter.compute_ml() and
+    richter.compute_app(), but only the selected trace is copied instead of the
+    whole stream for each call.
+
+    :returns: Tuple of (ml, app). Value is None if station trace is not found.
+    """
+    selected = stream.select(
+        station=station, network=network, component=component, **kwargs
+    )
+    if not selected:
+        return None, None
+
+    # Copy the selected traces only, because merge and simulate work in place.
+    selected = Stream(traces=[tr.copy() for tr in selected])
+    if len(selected) > 1:
+        selected.merge(method=1, fill_value="interpolate")
+    trace = selected[0]
+
+    app = np.abs(np.min(trace.data)) + np.abs(np.max(trace.data))
+
+    trace.simulate(
+        paz_remove=paz.get_paz(station, component),
+        paz_simulate=paz.PAZ["WOOD_ANDERSON"],
+        water_level=0.0,
+    )
+    wa_ampl = np.max(np.abs(trace.data))
+    if not wa_ampl:
+        return None, app
+
+    # Convert WA amplitude from meter to mili-meter.
+    ml = richter.compute_bpptkg_ml(wa_ampl * 1000)
+    return ml, app
+
+
 def compute_magnitude_all(stream):
     """
     Calculate magnitude and amplitude peak-to-peak (app) for station MEDEL,
@@ -51,15 +101,7 @@ def compute_magnitude_all(stream):
 
     for station in stations:
         if stream is not None:
-            ml = richter.compute_ml(
-                stream,
-                station["station"],
-                network=station["network"],
-                component=station["component"],
-                channel=station["channel"],
-            )
-
-            app = richter.compute_app(
+            ml, app = compute_station_magnitude(
                 stream,
                 station["station"],
                 network=station["network"],
@@ -73,3 +115,67 @@ def compute_magnitude_all(stream):
             results[station["ml_field"]] = None
             results[station["app_field"]] = None
     return results
+
+
+def create_executor(max_workers=None):
+    """
+    Create process pool executor to compute magnitude of many events in
+    parallel.
+
+    Return None if max_workers is less than 2 or if current process is a
+    daemonic process (e.g. Celery prefork worker), because daemonic processes
+    are not allowed to have child processes. In that case, magnitude is computed
+    in the current process.
+    """
+    if max_workers is not None and max_workers < 2:
+        return None
+
+    if multiprocessing.current_process().daemon:
+        logger.warning(
+            "Could not create process pool in a daemonic process. "
+            "Computing magnitude in the current process."
+        )
+        return None
+
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def iter_magnitudes(batches, fetch, executor=None):
+    """
+    Fetch waveform data and compute magnitude for batches of events.
+
+    If executor is not None, magnitudes of a batch are computed in the executor
+    while the next batch is being fetched.
+
+    :param batches: Iterable of list of events.
+
+    :param fetch: Function that takes list of events and returns list of ObsPy
+    streams in the same order.
+
+    :param executor: Optional executor, e.g. created by create_executor().
+
+    :returns: Yield tuples of (event, stream, magnitudes) in the same order as
+    the events.
+    """
+    pending = None
+
+    for events in batches:
+        streams = fetch(events)
+
+        if executor is None:
+            for event, stream in zip(events, streams):
+                yield event, stream, compute_magnitude_all(stream)
+            continue
+
+        futures = [executor.submit(compute_magnitude_all, stream) for stream in streams]
+        if pending is not None:
+            yield from _collect(*pending)
+        pending = (events, streams, futures)
+
+    if pending is not None:
+        yield from _collect(*pending)
+
+
+def _collect(events, streams, futures):
+    for event, stream, future in zip(events, streams, futures):
+        yield event, stream, future.result()
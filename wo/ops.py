@@ -1,13 +1,106 @@
 import logging
 
-import pandas as pd
 from webobsclient.contrib.bpptkg.db.sessions import session_scope
 
 from .decorators import retry
-from .settings import TIMEZONE
+from .encoders import RowEncoder
+from .settings import UPSERT_CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
+INSERT_QUERY = r"""
+    INSERT INTO bulletin (
+        eventid,
+        eventdate,
+        eventdate_microsecond,
+        number,
+        duration,
+        amplitude,
+        magnitude,
+        longitude,
+        latitude,
+        depth,
+        type,
+        file,
+        valid,
+        projection,
+        operator,
+        timestamp,
+        timestamp_microsecond,
+        deles,
+        labuhan,
+        pasarbubar,
+        pusunglondon,
+        ml_deles,
+        ml_labuhan,
+        ml_pasarbubar,
+        ml_pusunglondon,
+        locmode,
+        loctype
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+    ) ON DUPLICATE KEY UPDATE
+        eventdate=VALUES(eventdate),
+        eventdate_microsecond=VALUES(eventdate_microsecond),
+        number=VALUES(number),
+        duration=VALUES(duration),
+        amplitude=VALUES(amplitude),
+        magnitude=VALUES(magnitude),
+        longitude=VALUES(longitude),
+        latitude=VALUES(latitude),
+        depth=VALUES(depth),
+        type=VALUES(type),
+        file=VALUES(file),
+        valid=VALUES(valid),
+        projection=VALUES(projection),
+        operator=VALUES(operator),
+        timestamp=VALUES(timestamp),
+        timestamp_microsecond=VALUES(timestamp_microsecond),
+        deles=VALUES(deles),
+        labuhan=VALUES(labuhan),
+        pasarbubar=VALUES(pasarbubar),
+        pusunglondon=VALUES(pusunglondon),
+        ml_deles=VALUES(ml_deles),
+        ml_labuhan=VALUES(ml_labuhan),
+        ml_pasarbubar=VALUES(ml_pasarbubar),
+        ml_pusunglondon=VALUES(ml_pusunglondon),
+        locmode=VALUES(locmode),
+        loctype=VALUES(loctype)
+"""
+
+COLUMN_NAMES = [
+    "eventid",
+    "eventdate",
+    "eventdate_microsecond",
+    "number",
+    "duration",
+    "amplitude",
+    "magnitude",
+    "longitude",
+    "latitude",
+    "depth",
+    "eventtype",
+    "seiscompid",
+    "valid",
+    "projection",
+    "operator",
+    "timestamp",
+    "timestamp_microsecond",
+    "count_deles",
+    "count_labuhan",
+    "count_pasarbubar",
+    "count_pusunglondon",
+    "ml_deles",
+    "ml_labuhan",
+    "ml_pasarbubar",
+    "ml_pusunglondon",
+    "location_mode",
+    "location_type",
+]
+
+_row_encoder = RowEncoder(COLUMN_NAMES, datetime_columns=("eventdate", "timestamp"))
+
 
 @retry(max_retries=5)
 def hide_event(engine, table, eventid, operator, *, update_operator_value=True):
@@ -109,6 +202,23 @@ def delete_event(engine, table, eventid, operator, update_operator_value=True):
         return False
 
 
+def prepare_entries(data):
+    """
+    Convert event data to list of tuples ordered by COLUMN_NAMES. Event date
+    and timestamp are converted from UTC to local time zone.
+
+    :param data: Event data, can be a dictionary or a list of dictionary.
+    """
+    if isinstance(data, dict):
+        entries = [_row_encoder.encode(data)]
+    else:
+        entries = _row_encoder.encode_many(data)
+
+    logger.info("Event entries: %s", entries)
+
+    return entries
+
+
 def mysql_upsert(engine, data):
     """
     Insert new event to database model or update the event if primary key
@@ -123,123 +233,13 @@ def mysql_upsert(engine, data):
 
     :returns: True if upsert succeed, otherwise return False.
     """
-    insert_query = r"""
-        INSERT INTO bulletin (
-            eventid,
-            eventdate,
-            eventdate_microsecond,
-            number,
-            duration,
-            amplitude,
-            magnitude,
-            longitude,
-            latitude,
-            depth,
-            type,
-            file,
-            valid,
-            projection,
-            operator,
-            timestamp,
-            timestamp_microsecond,
-            deles,
-            labuhan,
-            pasarbubar,
-            pusunglondon,
-            ml_deles,
-            ml_labuhan,
-            ml_pasarbubar,
-            ml_pusunglondon,
-	        locmode,
-            loctype
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        ) ON DUPLICATE KEY UPDATE
-            eventdate=VALUES(eventdate),
-            eventdate_microsecond=VALUES(eventdate_microsecond),
-            number=VALUES(number),
-            duration=VALUES(duration),
-            amplitude=VALUES(amplitude),
-            magnitude=VALUES(magnitude),
-            longitude=VALUES(longitude),
-            latitude=VALUES(latitude),
-            depth=VALUES(depth),
-            type=VALUES(type),
-            file=VALUES(file),
-            valid=VALUES(valid),
-            projection=VALUES(projection),
-            operator=VALUES(operator),
-            timestamp=VALUES(timestamp),
-            timestamp_microsecond=VALUES(timestamp_microsecond),
-            deles=VALUES(deles),
-            labuhan=VALUES(labuhan),
-            pasarbubar=VALUES(pasarbubar),
-            pusunglondon=VALUES(pusunglondon),
-            ml_deles=VALUES(ml_deles),
-            ml_labuhan=VALUES(ml_labuhan),
-            ml_pasarbubar=VALUES(ml_pasarbubar),
-            ml_pusunglondon=VALUES(ml_pusunglondon),
-            locmode=VALUES(locmode),
-	        loctype=VALUES(loctype)
-    """
-    column_names = [
-        "eventid",
-        "eventdate",
-        "eventdate_microsecond",
-        "number",
-        "duration",
-        "amplitude",
-        "magnitude",
-        "longitude",
-        "latitude",
-        "depth",
-        "eventtype",
-        "seiscompid",
-        "valid",
-        "projection",
-        "operator",
-        "timestamp",
-        "timestamp_microsecond",
-        "count_deles",
-        "count_labuhan",
-        "count_pasarbubar",
-        "count_pusunglondon",
-        "ml_deles",
-        "ml_labuhan",
-        "ml_pasarbubar",
-        "ml_pusunglondon",
-        "location_mode",
-        "location_type",
-    ]
-
     logger.info("Preparing event data entry.")
-    if isinstance(data, dict):
-        df = pd.DataFrame(
-            [
-                data,
-            ]
-        )
-    else:
-        df = pd.DataFrame(data)
-
-    # Convert any timestamp column to local time zone.
-    df["eventdate"] = df["eventdate"].dt.tz_convert(TIMEZONE).dt.tz_localize(None)
-    df["timestamp"] = df["timestamp"].dt.tz_convert(TIMEZONE).dt.tz_localize(None)
-
-    datetime_format = "%Y-%m-%d %H:%M:%S"
-    df["eventdate"] = df["eventdate"].dt.strftime(datetime_format)
-    df["timestamp"] = df["timestamp"].dt.strftime(datetime_format)
-
-    df = df.astype(object).where((pd.notnull(df)), None)
+    entries = prepare_entries(data)
 
-    logger.info("Event entries: %s", df.to_dict(orient="records"))
-
-    entries = map(tuple, df[column_names].values.tolist())
     connection = engine.raw_connection()
     cursor = connection.cursor()
     try:
-        cursor.executemany(insert_query, entries)
+        cursor.executemany(INSERT_QUERY, entries)
         connection.commit()
         return True
     except Exception as e:
@@ -249,3 +249,114 @@ def mysql_upsert(engine, data):
     finally:
         if connection:
             connection.close()
+
+
+class BulkUpserter(object):
+    """
+    Accumulate processed events and upsert them to the database in chunks.
+
+    Each chunk is inserted using a single multi-row INSERT ... ON DUPLICATE KEY
+    UPDATE statement inside one transaction. If a chunk fails, the transaction
+    is rolled back and the events in the chunk are upserted one by one, so an
+    invalid event does not fail the whole chunk.
+
+    If on_success is set, it is called with list of event IDs after they are
+    successfully upserted.
+
+    Example:
+
+    .. code-block:: python
+
+        with BulkUpserter(engine, chunk_size=500) as upserter:
+            for event in events:
+                upserter.add(event)
+    """
+
+    def __init__(self, engine, chunk_size=UPSERT_CHUNK_SIZE, on_success=None):
+        if int(chunk_size) < 1:
+            raise ValueError("chunk_size value must be a positive integer.")
+
+        self.engine = engine
+        self.chunk_size = int(chunk_size)
+        self.on_success = on_success
+        self.events = []
+        self.succeeded = 0
+        self.failed = []
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        finally:
+            self.close()
+
+    def add(self, event):
+        """
+        Add an event to the buffer. Buffer is flushed when it reaches
+        chunk_size events.
+        """
+        self.events.append(event)
+        if len(self.events) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Upsert all buffered events to the database.
+
+        :returns: True if all events succeeded, otherwise return False.
+        """
+        if not self.events:
+            return True
+
+        events = self.events
+        self.events = []
+
+        logger.info("Upserting %s events to database...", len(events))
+        entries = prepare_entries(events)
+
+        if self._connection is None:
+            self._connection = self.engine.raw_connection()
+        connection = self._connection
+        cursor = connection.cursor()
+
+        try:
+            cursor.executemany(INSERT_QUERY, entries)
+            connection.commit()
+            self.succeeded += len(entries)
+            self._notify([entry[0] for entry in entries])
+            return True
+        except Exception as e:
+            logger.error(e)
+            connection.rollback()
+
+        logger.info("Chunk upsert failed. Upserting events one by one...")
+        ok = True
+        succeeded = []
+        for entry in entries:
+            try:
+                cursor.execute(INSERT_QUERY, entry)
+                connection.commit()
+                self.succeeded += 1
+                succeeded.append(entry[0])
+            except Exception as e:
+                logger.error("Event %s failed to be upserted: %s", entry[0], e)
+                connection.rollback()
+                self.failed.append(entry[0])
+                ok = False
+        self._notify(succeeded)
+        return ok
+
+    def _notify(self, eventids):
+        if self.on_success is not None and eventids:
+            self.on_success(eventids)
+
+    def close(self):
+        """
+        Close database connection.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
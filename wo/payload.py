@@ -0,0 +1,133 @@
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+import pytz
+
+# Compact JSON payload of Celery task messages. Values that JSON can not
+# represent are encoded as single key objects tagged with the value type:
+#
+#   {"$dt": 1625715296560000}   aware datetime, microseconds since epoch (UTC)
+#   {"$ndt": 1625715296560000}  naive datetime, microseconds since epoch
+#   {"$ts": 1625715296560000}   aware pandas Timestamp (UTC), null for NaT
+#   {"$nts": 1625715296560000}  naive pandas Timestamp
+#   {"$d": 18816}               date, days since epoch
+#
+# NumPy scalars are encoded as Python scalars. Unlike pickle, decoding a
+# payload never creates objects other than the types above, so it is safe to
+# accept messages from untrusted producers.
+#
+# WebObs action tasks have fixed fields of plain JSON types, so their messages
+# need no type tags. Dates are microseconds since epoch (UTC), see
+# to_epoch_us():
+#
+#   webobs_update_event   args: [eventdate]
+#                         kwargs: eventid, sc3id, operator, eventtype (string
+#                         or null), requested_at (epoch microseconds),
+#                         coalesce_keys (list of string, optional),
+#                         coalesce_token (string, optional)
+#   webobs_hide_event     args: [eventid]
+#                         kwargs: operator
+#   webobs_restore_event  args: [eventid, eventtype]
+#                         kwargs: operator
+#   webobs_delete_event   args: [eventid]
+#                         kwargs: operator
+#
+# Tags are only used for the other tasks and the MC3 event cache.
+NAME = "bulletin"
+CONTENT_TYPE = "application/x-bulletin-payload"
+CONTENT_ENCODING = "utf-8"
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+_NAIVE_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_DATE = datetime.date(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _to_microseconds(value, epoch):
+    return (value - epoch) // _MICROSECOND
+
+
+def to_epoch_us(value):
+    """
+    Convert aware datetime to microseconds since epoch (UTC). Naive datetime is
+    assumed to be in UTC time zone.
+    """
+    if value.tzinfo is None or value.tzinfo.utcoffset(value) is None:
+        value = pytz.utc.localize(value)
+    return _to_microseconds(value, _EPOCH)
+
+
+def from_epoch_us(value):
+    """
+    Convert microseconds since epoch to UTC datetime. Datetime values, e.g. of
+    tasks queued by previous release, are returned as is.
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+    return _EPOCH + datetime.timedelta(microseconds=value)
+
+
+def _default(value):
+    if value is pd.NaT:
+        return {"$ts": None}
+    if isinstance(value, pd.Timestamp):
+        if value.tzinfo is None:
+            return {"$nts": value.value // 1000}
+        return {"$ts": value.value // 1000}
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None or value.tzinfo.utcoffset(value) is None:
+            return {"$ndt": _to_microseconds(value.replace(tzinfo=None), _NAIVE_EPOCH)}
+        return {"$dt": to_epoch_us(value)}
+    if isinstance(value, datetime.date):
+        return {"$d": (value - _EPOCH_DATE).days}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(
+        "Object of type {} is not payload serializable".format(type(value).__name__)
+    )
+
+
+def _decode_timestamp(value, tz):
+    if value is None:
+        return pd.NaT
+    return pd.Timestamp(value, unit="us", tz=tz)
+
+
+_DECODERS = {
+    "$dt": from_epoch_us,
+    "$ndt": lambda value: _NAIVE_EPOCH + datetime.timedelta(microseconds=value),
+    "$ts": lambda value: _decode_timestamp(value, "UTC"),
+    "$nts": lambda value: _decode_timestamp(value, None),
+    "$d": lambda value: _EPOCH_DATE + datetime.timedelta(days=value),
+}
+
+
+def _object_hook(obj):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        decoder = _DECODERS.get(key)
+        if decoder is not None:
+            return decoder(value)
+    return obj
+
+
+_encoder = json.JSONEncoder(default=_default, separators=(",", ":"))
+_decoder = json.JSONDecoder(object_hook=_object_hook)
+
+
+def dumps(obj):
+    """
+    Serialize obj to compact JSON payload string.
+    """
+    return _encoder.encode(obj)
+
+
+def loads(data):
+    """
+    Deserialize JSON payload string or bytes to Python object.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode(CONTENT_ENCODING)
+    return _decoder.decode(data)
@@ -77,6 +77,9 @@ LOGGING = {
 
 LOCKFILE = os.path.join(RUN_DIR, "bulletin.lock")
 
+# Directory of resumable backfill checkpoints of scripts/run_sync.py.
+CHECKPOINT_DIR = os.path.join(RUN_DIR, "checkpoints")
+
 DAY_RANGE = config("DAY_RANGE", default=3, cast=int)
 if DAY_RANGE <= 0:
     raise ValueError("DAY_RANGE value must be greater than 0.")
@@ -86,10 +89,81 @@ SEEDLINK_PORT = config("SEEDLINK_PORT", default=18000, cast=int)
 ARCLINK_HOST = config("ARCLINK_HOST", default="127.0.0.1")
 ARCLINK_PORT = config("ARCLINK_PORT", default=18001, cast=int)
 
+# Fetch waveform data of all stations concurrently. WAVEFORM_FETCH_WORKERS is
+# the maximum number of stations requested at the same time and
+# WAVEFORM_FETCH_TIMEOUT is the deadline for each station in seconds.
+WAVEFORM_FETCH_CONCURRENT = config("WAVEFORM_FETCH_CONCURRENT", default=True, cast=bool)
+WAVEFORM_FETCH_WORKERS = config("WAVEFORM_FETCH_WORKERS", default=4, cast=int)
+WAVEFORM_FETCH_TIMEOUT = config("WAVEFORM_FETCH_TIMEOUT", default=60, cast=int)
+
+# Maximum number of idle SeedLink/ArcLink clients kept for each server and the
+# time in seconds before an idle client is recycled.
+WAVEFORM_POOL_SIZE = config("WAVEFORM_POOL_SIZE", default=4, cast=int)
+WAVEFORM_POOL_IDLE_TIME = config("WAVEFORM_POOL_IDLE_TIME", default=300, cast=int)
+
+# Cache waveform data fetched via ArcLink in day-chunked miniSEED files under
+# MSD_DIR. Cached files are evicted if total size exceeds WAVEFORM_CACHE_MAX_SIZE
+# MB or if they have not been accessed for WAVEFORM_CACHE_MAX_AGE days.
+WAVEFORM_CACHE_ENABLED = config("WAVEFORM_CACHE_ENABLED", default=True, cast=bool)
+WAVEFORM_CACHE_MAX_SIZE = config("WAVEFORM_CACHE_MAX_SIZE", default=2048, cast=int)
+WAVEFORM_CACHE_MAX_AGE = config("WAVEFORM_CACHE_MAX_AGE", default=30, cast=int)
+
+# Waveform data more recent than WAVEFORM_CACHE_MIN_AGE seconds is not cached,
+# because the ArcLink server may still be receiving it.
+WAVEFORM_CACHE_MIN_AGE = config("WAVEFORM_CACHE_MIN_AGE", default=7200, cast=int)
+
+# Batch waveform retrieval settings. Events are processed in batches of
+# WAVEFORM_BATCH_SIZE events. Event windows separated by at most
+# WAVEFORM_BATCH_MAX_GAP seconds are fetched in a single request as long as the
+# request is not longer than WAVEFORM_BATCH_MAX_SPAN seconds.
+WAVEFORM_BATCH_SIZE = config("WAVEFORM_BATCH_SIZE", default=200, cast=int)
+WAVEFORM_BATCH_MAX_GAP = config("WAVEFORM_BATCH_MAX_GAP", default=120, cast=int)
+WAVEFORM_BATCH_MAX_SPAN = config("WAVEFORM_BATCH_MAX_SPAN", default=3600, cast=int)
+
+# Number of worker processes to compute event magnitudes in parallel. Set to 1
+# to compute magnitudes in the current process.
+MAGNITUDE_WORKERS = config("MAGNITUDE_WORKERS", default=1, cast=int)
+
+# Maximum number of events upserted to the database in a single statement
+# during synchronization.
+UPSERT_CHUNK_SIZE = config("UPSERT_CHUNK_SIZE", default=500, cast=int)
+
+# Number of rows fetched from the server-side cursor at a time when streaming
+# bulletin events during reverse synchronization.
+REVERSE_SYNC_BATCH_SIZE = config("REVERSE_SYNC_BATCH_SIZE", default=1000, cast=int)
+
+# Time window in days of each WebObs MC3 request and database query when
+# streaming reverse synchronization over long time ranges.
+REVERSE_SYNC_WINDOW = config("REVERSE_SYNC_WINDOW", default=1, cast=float)
+if REVERSE_SYNC_WINDOW <= 0:
+    raise ValueError("REVERSE_SYNC_WINDOW value must be greater than 0.")
+
+# Incremental synchronization settings. The watermark of the last synchronized
+# WebObs MC3 event is stored in SYNC_WATERMARK_FILE. Incremental sync requests
+# events from the watermark eventdate minus SYNC_LOOKBACK minutes, to catch
+# events entered late by the operators. A wide reconciliation pass is run every
+# SYNC_RECONCILE_INTERVAL hours. Sync of a single event type, e.g. VTA, uses its
+# own watermark file with the event type suffix, e.g. sync_watermark.VTA.json.
+SYNC_WATERMARK_FILE = os.path.join(RUN_DIR, "sync_watermark.json")
+SYNC_LOOKBACK = config("SYNC_LOOKBACK", default=360, cast=int)
+SYNC_RECONCILE_INTERVAL = config("SYNC_RECONCILE_INTERVAL", default=24, cast=int)
+
 WEBOBS_USERNAME = config("WEBOBS_USERNAME")
 WEBOBS_PASSWORD = config("WEBOBS_PASSWORD")
 WEBOBS_HOST = config("WEBOBS_HOST", default="")
 
+# WebObs MC3 requests longer than WEBOBS_FETCH_CHUNK_SIZE days are split into
+# chunks fetched concurrently by at most WEBOBS_FETCH_WORKERS threads.
+WEBOBS_FETCH_CHUNK_SIZE = config("WEBOBS_FETCH_CHUNK_SIZE", default=1, cast=float)
+WEBOBS_FETCH_WORKERS = config("WEBOBS_FETCH_WORKERS", default=3, cast=int)
+
+# Cache WebObs MC3 events fetched by sync and update event requests in
+# WEBOBS_MC3_CACHE_FILE for WEBOBS_MC3_CACHE_TTL seconds, so that update event
+# requests of recently fetched events do not have to request WebObs again.
+WEBOBS_MC3_CACHE_ENABLED = config("WEBOBS_MC3_CACHE_ENABLED", default=True, cast=bool)
+WEBOBS_MC3_CACHE_TTL = config("WEBOBS_MC3_CACHE_TTL", default=300, cast=int)
+WEBOBS_MC3_CACHE_FILE = os.path.join(RUN_DIR, "mc3_cache.sqlite3")
+
 # This variable can be used to mock `wo.clients.waveform.get_waveforms()`
 # function for testing purposes.
 GET_WAVEFORMS_FUNCTION = None
@@ -0,0 +1,102 @@
+import datetime
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .settings import RUN_DIR
+
+logger = logging.getLogger(__name__)
+
+SHARD_BY_CHOICES = ("day", "week", "month")
+
+
+def _localize(tz, d):
+    if tz is None:
+        return d
+    if hasattr(tz, "localize"):
+        # pytz time zone.
+        return tz.localize(d)
+    return d.replace(tzinfo=tz)
+
+
+def _next_boundary(d, shard_by):
+    midnight = d.replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    if shard_by == "day":
+        boundary = midnight + datetime.timedelta(days=1)
+    elif shard_by == "week":
+        boundary = midnight + datetime.timedelta(days=7 - midnight.weekday())
+    elif shard_by == "month":
+        boundary = (midnight.replace(day=1) + datetime.timedelta(days=32)).replace(
+            day=1
+        )
+    else:
+        raise ValueError(
+            "Unknown shard_by value: {}. Supported values: {}".format(
+                shard_by, ", ".join(SHARD_BY_CHOICES)
+            )
+        )
+    return _localize(d.tzinfo, boundary)
+
+
+def split_time_range(start, end, shard_by="day"):
+    """
+    Split time range start to end into shards aligned to calendar day, week
+    (starts on Monday), or month boundaries in time zone of start.
+
+    :returns: List of tuple of shard start and end time.
+    """
+    shards = []
+    current = start
+    while current < end:
+        shard_end = min(_next_boundary(current, shard_by), end)
+        shards.append((current, shard_end))
+        current = shard_end
+    return shards
+
+
+def get_shard_lockfile(start, end, root=RUN_DIR):
+    """
+    Get lock file path of the shard, so that different shards can run
+    concurrently while the same shard can not.
+    """
+    return os.path.join(
+        root,
+        "bulletin-{}-{}.lock".format(
+            start.strftime("%Y%m%dT%H%M%S"), end.strftime("%Y%m%dT%H%M%S")
+        ),
+    )
+
+
+def run_shards(func, shards, *args, max_workers=1):
+    """
+    Run func(start, end, *args) for each shard. If max_workers is greater than
+    1, shards are run concurrently in a process pool. func and args must be
+    picklable.
+
+    :returns: List of tuple of shard and result of func. Result is None if the
+    shard raised an exception.
+    """
+    results = []
+    if max_workers is None or max_workers < 2 or len(shards) < 2:
+        for start, end in shards:
+            try:
+                result = func(start, end, *args)
+            except Exception as e:
+                logger.error("Shard %s to %s failed: %s", start, end, e)
+                result = None
+            results.append(((start, end), result))
+        return results
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            ((start, end), executor.submit(func, start, end, *args))
+            for start, end in shards
+        ]
+        for shard, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error("Shard %s to %s failed: %s", shard[0], shard[1], e)
+                result = None
+            results.append((shard, result))
+    return results
@@ -1,6 +1,8 @@
+import datetime
 import logging
 
 import pandas as pd
+import pytz
 from obspy import UTCDateTime
 from webobsclient.contrib.bpptkg.db import query
 
@@ -9,13 +11,76 @@ from waveview.adapter import WaveViewAdapter
 from . import dbquery, ops, settings
 from .actions import WebObsAction
 from .clients import webobs
-from .clients.waveform import get_waveforms
-from .magnitude import compute_magnitude_all
+from .clients.waveform import get_waveforms, get_waveforms_batch
+from .fingerprint import get_stored_magnitudes, is_waveform_unchanged
+from .magnitude import compute_magnitude_all, create_executor, iter_magnitudes
 from .singleton import SingleInstance
+from .watermark import SyncWatermark
 
 logger = logging.getLogger(__name__)
 
 
+def _chunked(iterable, size):
+    """
+    Split iterable into lists of at most size items.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def get_event_time_window(event):
+    """
+    Get waveform time window of the event in UTC time zone. If event duration
+    is not set, default to 30 seconds.
+    """
+    start = UTCDateTime(event["eventdate"])
+    if event["duration"] is None or pd.isna(event["duration"]):
+        # Set default duration to 30 seconds.
+        duration = 30.0
+    else:
+        duration = float(event["duration"])
+
+    end = start + duration
+    return start, end
+
+
+def _get_waveforms_function():
+    get_waveforms_func = settings.GET_WAVEFORMS_FUNCTION
+    if get_waveforms_func is not None:
+        if not callable(get_waveforms_func):
+            raise ValueError(
+                "GET_WAVEFORMS_FUNCTION must be a callable function "
+                "instead of type of {}".format(type(get_waveforms_func))
+            )
+    return get_waveforms_func
+
+
+def fetch_event_waveforms(events):
+    """
+    Fetch waveform data for list of events using batch waveform retrieval.
+
+    :param events: List of dictionary of WebObs events.
+
+    :returns: List of ObsPy streams in the same order as events.
+    """
+    windows = [get_event_time_window(event) for event in events]
+
+    get_waveforms_func = _get_waveforms_function()
+    if get_waveforms_func is not None:
+        return [get_waveforms_func(start, end) for start, end in windows]
+    return get_waveforms_batch(windows)
+
+
+def _skip_waveforms(events):
+    return [None] * len(events)
+
+
 def reverse_process_event_and_updatedb(
     engine, table, event_db, event_wo, *, dry_run=False
 ):
@@ -67,11 +132,16 @@ class SimpleEventVisitor(SingleInstance):
         flavor_id="",
         dry=False,
         skip_mag_calc=False,
+        mag_workers=None,
     ):
         self.engine = engine
         self.table = table
         self.dry = dry
         self.skip_mag_calc = skip_mag_calc
+        if mag_workers is not None:
+            self.mag_workers = mag_workers
+        else:
+            self.mag_workers = settings.MAGNITUDE_WORKERS
 
         super().__init__(flavor_id=flavor_id, lockfile=lockfile)
 
@@ -106,27 +176,26 @@ class SimpleEventVisitor(SingleInstance):
                 ),
             )
 
-    def reverse_print_events(self, events, start, end, eventtype=None):
-        """
-        Print all events in the database that are not in the WebObs MC3
-        bulletin.
-
-        :param events: List of dictionary of WebObs events.
-
-        :param start: Start time to query database in UTC time zone.
+    def _reverse_print(self, results):
+        for event, wo_event in results:
+            if wo_event is None:
+                eventtype_wo = None
+            else:
+                eventtype_wo = wo_event["eventtype"]
 
-        :param end: End time to query database in UTC time zone.
+            logger.info(
+                "Found event: %s",
+                "(ID: {}, eventdate[local]: {}, type[db]: {}, "
+                "type[wo]: {})".format(
+                    event["eventid"],
+                    event["eventdate"],
+                    event["eventtype"],
+                    eventtype_wo,
+                ),
+            )
 
-        :param eventtype: Event type, e.g. VTA, VTB.
-        """
-        for event, wo_event in dbquery.reverse_filter_exact(
-            self.engine,
-            self.table,
-            events,
-            start,
-            end,
-            eventtype,
-        ):
+    def _reverse_process(self, results):
+        for event, wo_event in results:
             if wo_event is None:
                 eventtype_wo = None
             else:
@@ -143,6 +212,32 @@ class SimpleEventVisitor(SingleInstance):
                 ),
             )
 
+            reverse_process_event_and_updatedb(self.engine, self.table, event, wo_event)
+
+    def reverse_print_events(self, events, start, end, eventtype=None):
+        """
+        Print all events in the database that are not in the WebObs MC3
+        bulletin.
+
+        :param events: List of dictionary of WebObs events.
+
+        :param start: Start time to query database in UTC time zone.
+
+        :param end: End time to query database in UTC time zone.
+
+        :param eventtype: Event type, e.g. VTA, VTB.
+        """
+        self._reverse_print(
+            dbquery.reverse_filter_exact(
+                self.engine,
+                self.table,
+                events,
+                start,
+                end,
+                eventtype,
+            )
+        )
+
     def reverse_process_events(self, events, start, end, eventtype=None):
         """
         Process all events in the database that are not in the WebObs MC3
@@ -156,31 +251,68 @@ class SimpleEventVisitor(SingleInstance):
 
         :param eventtype: Event type, e.g. VTA, VTB.
         """
-        for event, wo_event in dbquery.reverse_filter_exact(
-            self.engine,
-            self.table,
-            events,
-            start,
-            end,
-            eventtype,
-        ):
-            if wo_event is None:
-                eventtype_wo = None
-            else:
-                eventtype_wo = wo_event["eventtype"]
+        self._reverse_process(
+            dbquery.reverse_filter_exact(
+                self.engine,
+                self.table,
+                events,
+                start,
+                end,
+                eventtype,
+            )
+        )
 
-            logger.info(
-                "Found event: %s",
-                "(ID: {}, eventdate[local]: {}, type[db]: {}, "
-                "type[wo]: {})".format(
-                    event["eventid"],
-                    event["eventdate"],
-                    event["eventtype"],
-                    eventtype_wo,
-                ),
+    def reverse_print_range(self, fetch, start, end, eventtype=None):
+        """
+        Print all events in the database that are not in the WebObs MC3
+        bulletin. Both WebObs and database events are streamed window by
+        window, so that time range can be arbitrary long.
+
+        :param fetch: Function to fetch WebObs events with signature
+        fetch(start, end, eventtype=eventtype).
+
+        :param start: Start time in UTC time zone.
+
+        :param end: End time in UTC time zone.
+
+        :param eventtype: Event type, e.g. VTA, VTB.
+        """
+        self._reverse_print(
+            dbquery.reverse_filter_by_window(
+                self.engine,
+                self.table,
+                fetch,
+                start,
+                end,
+                eventtype,
             )
+        )
 
-            reverse_process_event_and_updatedb(self.engine, self.table, event, wo_event)
+    def reverse_process_range(self, fetch, start, end, eventtype=None):
+        """
+        Process all events in the database that are not in the WebObs MC3
+        bulletin. Both WebObs and database events are streamed window by
+        window, so that time range can be arbitrary long.
+
+        :param fetch: Function to fetch WebObs events with signature
+        fetch(start, end, eventtype=eventtype).
+
+        :param start: Start time in UTC time zone.
+
+        :param end: End time in UTC time zone.
+
+        :param eventtype: Event type, e.g. VTA, VTB.
+        """
+        self._reverse_process(
+            dbquery.reverse_filter_by_window(
+                self.engine,
+                self.table,
+                fetch,
+                start,
+                end,
+                eventtype,
+            )
+        )
 
     def filter_events(self, events):
         """
@@ -198,20 +330,10 @@ class SimpleEventVisitor(SingleInstance):
 
         return results
 
-    def process_events(self, events):
-        """
-        Process all events that have not been synched between WebObs and
-        database.
-
-        :param events: List of dictionary of WebObs events.
-        """
+    def _filter_events_and_log(self, events):
         for event, result in query.filter_exact(self.engine, self.table, events):
             logger.info("Event from WebObs: %s", event)
 
-            eventid = event["eventid"]
-            eventtype = event["eventtype"]
-            eventdate = event["eventdate"].to_pydatetime()
-
             if result is None:
                 eventtype_db = None
             else:
@@ -221,52 +343,87 @@ class SimpleEventVisitor(SingleInstance):
                 "Found event: %s",
                 "(ID: {}, eventdate[local]: {}, type[wo]: {}, "
                 "type[db]: {})".format(
-                    eventid,
-                    eventdate,
-                    eventtype,
+                    event["eventid"],
+                    event["eventdate"],
+                    event["eventtype"],
                     eventtype_db,
                 ),
             )
+            yield event, result
 
-            if not self.skip_mag_calc:
-                start = UTCDateTime(eventdate)
-                if (event["duration"] is None) or (pd.isna(event["duration"])):
-                    duration = 30.0
-                else:
-                    duration = float(event["duration"])
+    def process_events(self, events, *, skip_eventids=None, on_upserted=None):
+        """
+        Process all events that have not been synched between WebObs and
+        database.
+
+        Waveform data is fetched in batches. If mag_workers is greater than 1,
+        magnitudes are computed in a process pool while the next batch is being
+        fetched.
+
+        Events whose event date and duration have not changed are updated
+        without fetching waveform data, reusing magnitudes stored in the
+        database.
 
-                end = start + duration
+        :param events: List of dictionary of WebObs events.
 
-                logger.info("Event ID: %s", eventid)
-                logger.info("Event type: %s", eventtype)
-                logger.info("Event date (UTC): %s", start)
-                logger.info("Fetch time window (UTC): %s to %s", start, end)
+        :param skip_eventids: Set of event IDs to skip, e.g. events that have
+        already been processed in the previous run.
 
-                stream = get_waveforms(start, end)
+        :param on_upserted: Function called with list of event IDs after they
+        are successfully upserted to the database.
+        """
+        if skip_eventids:
+            n = len(events)
+            events = [
+                event for event in events if event["eventid"] not in skip_eventids
+            ]
+            logger.info("Skipping %s already processed events.", n - len(events))
+
+        if self.skip_mag_calc:
+            executor = None
+            fetch = _skip_waveforms
+        else:
+            executor = create_executor(self.mag_workers)
+            fetch = fetch_event_waveforms
+
+        upserter = ops.BulkUpserter(self.engine, on_success=on_upserted)
+        batches = _chunked(
+            _update_unchanged_events(
+                self.engine,
+                self._filter_events_and_log(events),
+                dry_run=self.dry,
+                upserter=upserter,
+            ),
+            settings.WAVEFORM_BATCH_SIZE,
+        )
+        try:
+            for event, stream, magnitudes in iter_magnitudes(
+                batches, fetch, executor=executor
+            ):
                 if stream is not None:
+                    logger.info("Event ID: %s", event["eventid"])
                     logger.info("Stream:")
                     logger.info(stream.__str__(extended=True))
-            else:
-                stream = None
 
-            magnitudes = compute_magnitude_all(stream)
-            logger.info("Magnitude info: %s", magnitudes)
-            event.update(magnitudes)
+                logger.info("Magnitude info: %s", magnitudes)
+                event.update(magnitudes)
 
-            logger.info("Event data: %s", event)
+                logger.info("Event data: %s", event)
 
-            if not event:
-                logger.warning("Event data is empty. Skipping.")
-                continue
+                if not event:
+                    logger.warning("Event data is empty. Skipping.")
+                    continue
 
-            if self.dry:
-                logger.info("Using dry run. Results not inserted to database.")
-            else:
-                ok = ops.mysql_upsert(self.engine, event)
-                if ok:
-                    logger.info("Event data successfully updated.")
+                if self.dry:
+                    logger.info("Using dry run. Results not inserted to database.")
                 else:
-                    logger.error("Event value failed to be updated.")
+                    upserter.add(event)
+
+            _flush_upserter(upserter)
+        finally:
+            upserter.close()
+            if executor is not None:
+                executor.shutdown()
 
 
 def process_event_and_updatedb(engine, event, *, dry_run=False):
@@ -274,31 +431,41 @@ def process_event_and_updatedb(engine, event, *, dry_run=False):
     Process event by calculating necessary fields and update to database. If
     dry_run is True, don't update the database.
     """
+    start, end = get_event_time_window(event)
 
-    # Calculate magnitude info.
-    start = UTCDateTime(event["eventdate"])
-    if event["duration"] is None or pd.isna(event["duration"]):
-        # Set default duration to 30 seconds.
-        duration = 30.0
-    else:
-        duration = float(event["duration"])
-
-    end = start + duration
-
-    get_waveforms_func = settings.GET_WAVEFORMS_FUNCTION
+    get_waveforms_func = _get_waveforms_function()
     if get_waveforms_func is not None:
-        if not callable(get_waveforms_func):
-            raise ValueError(
-                "GET_WAVEFORMS_FUNCTION must be a callable function "
-                "instead of type of {}".format(type(get_waveforms_func))
-            )
         stream = get_waveforms_func(start, end)
     else:
         stream = get_waveforms(start, end)
+
+    return process_stream_and_updatedb(engine, event, stream, dry_run=dry_run)
+
+
+def process_stream_and_updatedb(engine, event, stream, *, dry_run=False):
+    """
+    Calculate necessary fields of the event from already fetched waveform
+    stream and update to database. If dry_run is True, don't update the
+    database.
+    """
     if stream is not None:
         logger.info(stream.__str__(extended=True))
 
+    # Calculate magnitude info.
     magnitudes = compute_magnitude_all(stream)
+    return update_magnitudes_and_db(engine, event, magnitudes, dry_run=dry_run)
+
+
+def update_magnitudes_and_db(
+    engine, event, magnitudes, *, dry_run=False, upserter=None
+):
+    """
+    Update event with already computed magnitudes and update to database. If
+    dry_run is True, don't update the database.
+
+    If upserter (an instance of ops.BulkUpserter) is not None, the event is
+    added to the upserter buffer instead of upserted immediately.
+    """
     logger.info("Magnitude info: %s", magnitudes)
     event.update(magnitudes)
 
@@ -309,6 +476,8 @@ def process_event_and_updatedb(engine, event, *, dry_run=False):
 
     if dry_run:
         logger.info("Using dry run. Event is not inserted to database.")
+    elif upserter is not None:
+        upserter.add(event)
     else:
         ok = ops.mysql_upsert(engine, event)
         if ok:
@@ -319,14 +488,19 @@ def process_event_and_updatedb(engine, event, *, dry_run=False):
     return event
 
 
-def sync_webobs_and_bulletin(engine, table, events, *, dry_run=False):
-    """
-    Synchronize events between webobs and bulletin database. If any of the event
-    not exists or has different eventtype, process the event and update the
-    database.
-    """
-    waveview = WaveViewAdapter()
+def _flush_upserter(upserter):
+    ok = upserter.flush()
+    if ok:
+        logger.info("%s events successfully updated.", upserter.succeeded)
+    else:
+        logger.error(
+            "%s events failed to be updated: %s",
+            len(upserter.failed),
+            upserter.failed,
+        )
+
 
+def _filter_exact_and_log(engine, table, events):
     for event_wo, event_db in query.filter_exact(engine, table, events):
         if event_db is None:
             eventtype_db = None
@@ -345,9 +519,118 @@ def sync_webobs_and_bulletin(engine, table, events, *, dry_run=False):
                 eventtype_db,
             )
         )
+        yield event_wo, event_db
+
+
+def _update_unchanged_events(
+    engine, pairs, *, dry_run=False, upserter=None, callback=None
+):
+    """
+    Generator function to update metadata of events whose waveform fingerprint
+    (event date and duration) is unchanged, reusing magnitudes stored in the
+    database instead of fetching waveform data. Yield the rest of the events
+    that need waveform processing.
+
+    :param pairs: Iterable of tuple of WebObs event and database event (None if
+    not exists).
+
+    :param callback: Function called with each updated event.
+    """
+    for event_wo, event_db in pairs:
+        if not is_waveform_unchanged(event_wo, event_db):
+            yield event_wo
+            continue
+
+        logger.info(
+            "Event %s waveform fingerprint unchanged. Updating metadata only.",
+            event_wo["eventid"],
+        )
+        event = update_magnitudes_and_db(
+            engine,
+            event_wo,
+            get_stored_magnitudes(event_db),
+            dry_run=dry_run,
+            upserter=upserter,
+        )
+        if callback is not None:
+            callback(event)
+
+
+def diff_webobs_and_bulletin(engine, table, events, *, dry_run=False):
+    """
+    Compare events between webobs and bulletin database. Events that are
+    missing from the database or differ from WebObs but whose event date and
+    duration have not changed are updated without fetching waveform data.
+
+    :returns: Tuple of list of events that need waveform processing, e.g. to be
+    passed to process_webobs_events(), and list of event IDs that failed to be
+    updated.
+    """
+    waveview = WaveViewAdapter()
+
+    upserter = ops.BulkUpserter(engine)
+    try:
+        pending = list(
+            _update_unchanged_events(
+                engine,
+                _filter_exact_and_log(engine, table, events),
+                dry_run=dry_run,
+                upserter=upserter,
+                callback=waveview.update_event,
+            )
+        )
+        _flush_upserter(upserter)
+    finally:
+        upserter.close()
+    return pending, upserter.failed
 
-        event = process_event_and_updatedb(engine, event_wo, dry_run=dry_run)
-        waveview.update_event(event)
+
+def process_webobs_events(engine, events, *, dry_run=False):
+    """
+    Fetch waveform data of WebObs events, compute magnitudes, and update the
+    database. Events are not compared with the database, so only pass events
+    returned by diff_webobs_and_bulletin().
+
+    :returns: List of event IDs that failed to be updated.
+    """
+    waveview = WaveViewAdapter()
+
+    executor = create_executor(settings.MAGNITUDE_WORKERS)
+    upserter = ops.BulkUpserter(engine)
+    batches = _chunked(events, settings.WAVEFORM_BATCH_SIZE)
+    try:
+        for event_wo, stream, magnitudes in iter_magnitudes(
+            batches, fetch_event_waveforms, executor=executor
+        ):
+            if stream is not None:
+                logger.info(stream.__str__(extended=True))
+
+            event = update_magnitudes_and_db(
+                engine, event_wo, magnitudes, dry_run=dry_run, upserter=upserter
+            )
+            waveview.update_event(event)
+
+        _flush_upserter(upserter)
+    finally:
+        upserter.close()
+        if executor is not None:
+            executor.shutdown()
+    return upserter.failed
+
+
+def sync_webobs_and_bulletin(engine, table, events, *, dry_run=False):
+    """
+    Synchronize events between webobs and bulletin database. If any of the event
+    not exists or has different eventtype, process the event and update the
+    database. If event date and duration of the event have not changed, only
+    event metadata is updated without fetching waveform data.
+
+    :returns: List of event IDs that failed to be updated.
+    """
+    pending, failed = diff_webobs_and_bulletin(engine, table, events, dry_run=dry_run)
+    if pending:
+        failed = failed + process_webobs_events(engine, pending, dry_run=dry_run)
+    return failed
 
 
 def sync_bulletin_and_webobs(
@@ -394,6 +677,120 @@ def sync_bulletin_and_webobs(
             waveview.delete_event(eventid)
 
 
+def incremental_sync(
+    engine,
+    table,
+    fetcher,
+    reconcile_start,
+    end,
+    *,
+    watermark=None,
+    eventtype="ALL",
+    dry_run=False,
+    dispatch=None,
+):
+    """
+    Incrementally synchronize events between WebObs MC3 bulletin and bulletin
+    database using persisted watermark of the last synchronized events.
+
+    If wide reconciliation pass is due, synchronize all events from
+    reconcile_start to end (forward and reverse syncs). Otherwise, only request
+    events from the watermark eventdate minus lookback time and forward sync
+    events that are new or modified after the watermark timestamp. Reverse sync
+    is run over the requested time range.
+
+    Watermark is not advanced if WebObs returns no events, if some time ranges
+    failed to be fetched, or if dry_run is True. It is not advanced past events
+    that failed to be updated, so they are synchronized again in the next run.
+
+    :param fetcher: WebObs MC3 fetcher, e.g. WebObsMC3Fetcher instance.
+
+    :param reconcile_start: Start time of wide reconciliation pass in UTC time
+    zone.
+
+    :param end: End time in UTC time zone.
+
+    :param watermark: SyncWatermark instance. If not set, use watermark file of
+    the eventtype.
+
+    :param dispatch: Function called with list of events that need waveform
+    processing and the advanced watermark state (None if the watermark must
+    not be advanced), e.g. to process the events in parallel subtasks. If set,
+    the events are not processed in the current process and dispatch is
+    responsible for saving the state once all of them have been processed,
+    held back before the events that failed (see SyncWatermark.hold_back()).
+
+    :returns: True if wide reconciliation pass was run, otherwise False.
+    """
+    if watermark is None:
+        watermark = SyncWatermark.for_eventtype(eventtype)
+
+    state = watermark.load()
+    reconcile = watermark.is_reconcile_due(end, state=state)
+    if reconcile:
+        start = reconcile_start
+        logger.info("Running wide reconciliation sync (%s to %s)", start, end)
+    else:
+        start = watermark.get_start(state)
+        logger.info("Running incremental sync (%s to %s)", start, end)
+
+    events = fetcher.fetch_mc3_as_dict(start, end, eventtype=eventtype)
+    logger.info("Number of events: %s", len(events))
+    if not events:
+        return reconcile
+
+    # If some time ranges failed to be fetched, only run forward sync of the
+    # fetched events. Reverse sync would mistake missing events as deleted and
+    # the watermark would skip the failed time ranges.
+    failed_ranges = getattr(fetcher, "failed_ranges", None)
+    if failed_ranges:
+        logger.error(
+            "Failed to fetch %s time ranges. Skipping reverse sync.",
+            len(failed_ranges),
+        )
+
+    if reconcile:
+        delta = events
+    else:
+        delta = watermark.filter_delta(events, state)
+    logger.info("Number of new or modified events: %s", len(delta))
+
+    pending = []
+    failed = []
+    if dispatch is not None:
+        if delta:
+            pending, failed = diff_webobs_and_bulletin(
+                engine, table, delta, dry_run=dry_run
+            )
+    elif delta:
+        failed = sync_webobs_and_bulletin(engine, table, delta, dry_run=dry_run)
+
+    if failed_ranges:
+        if dispatch is not None:
+            dispatch(pending, None)
+        return reconcile
+
+    sync_bulletin_and_webobs(
+        engine, table, events, start, end, eventtype=eventtype, dry_run=dry_run
+    )
+
+    new_state = None
+    if not dry_run:
+        new_state = watermark.advance(
+            events,
+            state,
+            end,
+            reconciled_at=end if reconcile else None,
+            failed=failed,
+        )
+
+    if dispatch is not None:
+        dispatch(pending, new_state)
+    elif new_state is not None:
+        watermark.save(new_state)
+    return reconcile
+
+
 def _execute_action(
     engine,
     table,
@@ -405,9 +802,20 @@ def _execute_action(
     eventtype=None,
     operator=None,
     sc3id=None,
+    not_before=None,
+    once=None,
 ):
     """
     Process event depending on the action type.
+
+    For update event action, not_before (UTC) is the earliest time WebObs MC3
+    events can be fetched to reflect the event modification. Cached events
+    fetched before that time are not used. Default to current time.
+
+    For update event action, once is an optional function called as
+    once(event, func) with the matched WebObs MC3 event before fetching
+    waveform data, e.g. to skip event modifications that have already been
+    applied. It should call func() to process the event.
     """
 
     logger.info("Triggered action: %s", action)
@@ -424,11 +832,17 @@ def _execute_action(
     if action == WebObsAction.WEBOBS_UPDATE_EVENT:
         fetcher_class = settings.WEBOBS_MC3_FETCHER_CLASS
         if fetcher_class is not None:
-            fetcher = fetcher_class()
+            fetcher = fetcher_class(cache=webobs.get_mc3_cache())
         else:
-            fetcher = webobs.WebObsMC3Fetcher()
+            fetcher = webobs.WebObsMC3Fetcher(cache=webobs.get_mc3_cache())
+        if not_before is None:
+            not_before = datetime.datetime.now(pytz.utc)
         event = fetcher.get_mc3(
-            eventdate, eventid=eventid, sc3id=sc3id, eventtype=eventtype
+            eventdate,
+            eventid=eventid,
+            sc3id=sc3id,
+            eventtype=eventtype,
+            not_before=not_before,
         )
 
         # If event is None, the calculation could not be proceeded. So, just
@@ -438,7 +852,13 @@ def _execute_action(
             return
         logger.info("Matched event from WebObs MC3: %s", event)
 
-        process_event_and_updatedb(engine, event, dry_run=dry_run)
+        def process():
+            return process_event_and_updatedb(engine, event, dry_run=dry_run)
+
+        if once is None:
+            process()
+        else:
+            once(event, process)
 
     elif action == WebObsAction.WEBOBS_HIDE_EVENT:
         if eventid is None:
@@ -507,11 +927,15 @@ def update_event(
     sc3id=None,
     eventtype=None,
     operator=None,
+    not_before=None,
+    once=None,
 ):
     """
     Update an event in the database.
 
-    Update can be creating a new event or updating existing event.
+    Update can be creating a new event or updating existing event. WebObs MC3
+    events fetched before not_before (UTC) are not used to update the event.
+    See _execute_action() for once parameter.
     """
     _execute_action(
         engine,
@@ -522,6 +946,8 @@ def update_event(
         sc3id=sc3id,
         eventtype=eventtype,
         operator=operator,
+        not_before=not_before,
+        once=once,
     )
 
 
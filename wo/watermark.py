@@ -0,0 +1,203 @@
+import datetime
+import json
+import logging
+import os
+
+from .settings import SYNC_LOOKBACK, SYNC_RECONCILE_INTERVAL, SYNC_WATERMARK_FILE
+from .utils import date
+
+logger = logging.getLogger(__name__)
+
+# Keys of the watermark state. All values are UTC datetime.
+SYNCED_UNTIL = "synced_until"
+TIMESTAMP = "timestamp"
+RECONCILED_AT = "reconciled_at"
+
+
+def _is_null(value):
+    return value is None or value != value
+
+
+def _max_value(events, key):
+    values = [event[key] for event in events if not _is_null(event.get(key))]
+    if not values:
+        return None
+    return date.to_utc(max(values))
+
+
+def _min_value(events, key):
+    values = [event[key] for event in events if not _is_null(event.get(key))]
+    if not values:
+        return None
+    return date.to_utc(min(values))
+
+
+def dump_state(state):
+    """
+    Convert watermark state to dictionary of ISO 8601 strings, e.g. to be saved
+    as JSON or passed to Celery tasks.
+    """
+    return {key: value.isoformat() for key, value in state.items() if value}
+
+
+def load_state(data):
+    """
+    Convert dictionary of ISO 8601 strings returned by dump_state() to
+    watermark state.
+    """
+    state = {}
+    for key in (SYNCED_UNTIL, TIMESTAMP, RECONCILED_AT):
+        if data.get(key):
+            state[key] = date.to_utc(date.to_datetime(data[key]))
+    return state
+
+
+class SyncWatermark(object):
+    """
+    High-water mark of the last successfully synchronized WebObs MC3 events.
+
+    The watermark stores the end of the last synchronized time range (event
+    date), the latest MC3 timestamp (last modified time) of synchronized events,
+    and the time of the last wide reconciliation pass. It is persisted as JSON
+    file, so that incremental synchronization only has to request and process
+    events that changed since the previous run.
+    """
+
+    def __init__(
+        self,
+        path=SYNC_WATERMARK_FILE,
+        lookback=SYNC_LOOKBACK,
+        reconcile_interval=SYNC_RECONCILE_INTERVAL,
+    ):
+        self.path = path
+        self.lookback = datetime.timedelta(minutes=lookback)
+        self.reconcile_interval = datetime.timedelta(hours=reconcile_interval)
+
+    @classmethod
+    def for_eventtype(cls, eventtype="ALL", path=SYNC_WATERMARK_FILE, **kwargs):
+        """
+        Create watermark of synchronization of an event type. Each event type
+        has its own watermark file, so synchronizing one event type does not
+        skip changes of the other types.
+        """
+        if eventtype and eventtype != "ALL":
+            root, ext = os.path.splitext(path)
+            path = "{}.{}{}".format(root, eventtype, ext)
+        return cls(path=path, **kwargs)
+
+    def load(self):
+        """
+        Load watermark state. Return empty dictionary if watermark file not
+        exists or invalid.
+        """
+        try:
+            with open(self.path, "r") as fd:
+                data = json.load(fd)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error("Failed to read sync watermark %s: %s", self.path, e)
+            return {}
+
+        return load_state(data)
+
+    def save(self, state):
+        """
+        Save watermark state atomically.
+        """
+        data = dump_state(state)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as fd:
+            json.dump(data, fd)
+        os.replace(tmp_path, self.path)
+
+    def is_reconcile_due(self, now, state=None):
+        """
+        Check if wide reconciliation pass should be run at time now (UTC).
+        """
+        if state is None:
+            state = self.load()
+        if SYNCED_UNTIL not in state or RECONCILED_AT not in state:
+            return True
+        return now - state[RECONCILED_AT] >= self.reconcile_interval
+
+    def get_start(self, state):
+        """
+        Get start time (UTC) of incremental synchronization request.
+        """
+        return state[SYNCED_UNTIL] - self.lookback
+
+    def filter_delta(self, events, state):
+        """
+        Filter events that are new or modified at or after the watermark
+        timestamp. Events modified in the same second as the watermark are
+        included, because MC3 timestamp has one second resolution. Events
+        without MC3 timestamp are always included.
+        """
+        timestamp = state.get(TIMESTAMP)
+        if timestamp is None:
+            return list(events)
+
+        results = []
+        for event in events:
+            value = event.get(TIMESTAMP)
+            if _is_null(value) or date.to_utc(value) >= timestamp:
+                results.append(event)
+        return results
+
+    def advance(self, events, state, end, *, reconciled_at=None, failed=None):
+        """
+        Get watermark state advanced with successfully synchronized events up
+        to time end (UTC) without saving it.
+
+        :param failed: List of event IDs that failed to be synchronized. The
+        watermark is not advanced past these events, so they are synchronized
+        again in the next run.
+        """
+        failed = set(failed or ())
+        state = dict(state)
+        state[SYNCED_UNTIL] = date.to_utc(end)
+        timestamp = _max_value(
+            [event for event in events if event.get("eventid") not in failed],
+            TIMESTAMP,
+        )
+        if timestamp is not None and (
+            TIMESTAMP not in state or timestamp > state[TIMESTAMP]
+        ):
+            state[TIMESTAMP] = timestamp
+        if reconciled_at is not None:
+            state[RECONCILED_AT] = date.to_utc(reconciled_at)
+        if failed:
+            state = self.hold_back(
+                state, [event for event in events if event.get("eventid") in failed]
+            )
+        return state
+
+    def hold_back(self, state, events):
+        """
+        Get watermark state moved back to before the events, e.g. events that
+        failed to be synchronized, so that the next incremental run requests and
+        processes them again.
+
+        :param events: List of events with eventdate and MC3 timestamp.
+        """
+        state = dict(state)
+        eventdate = _min_value(events, "eventdate")
+        if eventdate is not None and SYNCED_UNTIL in state:
+            state[SYNCED_UNTIL] = min(state[SYNCED_UNTIL], eventdate)
+        timestamp = _min_value(events, TIMESTAMP)
+        if timestamp is not None and TIMESTAMP in state:
+            state[TIMESTAMP] = min(state[TIMESTAMP], timestamp)
+        return state
+
+    def update(self, events, state, end, *, reconciled_at=None, failed=None):
+        """
+        Advance watermark state with successfully synchronized events up to
+        time end (UTC) and save the state.
+        """
+        state = self.advance(
+            events, state, end, reconciled_at=reconciled_at, failed=failed
+        )
+        self.save(state)
+        return state